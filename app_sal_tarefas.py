@@ -1,11 +1,21 @@
+import time
+TEMPO_INICIO = time.perf_counter()  # Medição do cold start (ver relatório no fim da seção 3)
+
 import dash
 from dash import dcc, html, Input, Output, State, dash_table
 import dash_bootstrap_components as dbc
-import plotly.express as px
-import plotly.graph_objects as go
+import plotly.graph_objects as go  # Já carregado pelo próprio dash; plotly.express é importado só no primeiro gráfico
 from dash.dash_table.Format import Format, Scheme, Symbol, Group
+from dash.exceptions import PreventUpdate
+from functools import lru_cache
 import pandas as pd
+import json
 import os
+import threading
+from camada_dados import CamadaDados
+from etl_processamento import (LIMITE_CLASSE_A, LIMITE_CLASSE_B, ARQUIVOS_CSV, SALARIOS, TAREFAS, classificar_mo_serie, ler_versao_dados, reconciliar,
+                                carregar_dimensoes, atualizar_dimensoes, aplicar_dimensoes, montar_indice_abc,
+                                limpar_particoes_antigas, hash_csvs)
 
 # =============================================================================
 # 1. CONFIGURAÇÃO DE SEGURANÇA (LOGIN)
@@ -21,8 +31,18 @@ USUARIOS = {
 # =============================================================================
 FONT_AWESOME = "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.2/css/all.min.css"
 
+# Fila local para cálculos pesados (dash background callbacks com diskcache).
+# Os jobs rodam fora do worker do gunicorn e o resultado fica em disco por filtro.
+# Sem o diskcache instalado, os callbacks pesados rodam de forma síncrona como antes.
+PASTA_CACHE_CALLBACKS = os.path.join(os.getcwd(), 'cache_callbacks')
+try:
+    import diskcache
+    background_manager = dash.DiskcacheManager(diskcache.Cache(PASTA_CACHE_CALLBACKS), cache_by=[lambda: ASSINATURA_DADOS], expire=3600)
+except ImportError:
+    background_manager = None
+
 # IMPORTANTE: suppress_callback_exceptions=True é necessário para login dinâmico
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.SLATE, FONT_AWESOME], title="EBM Salários e Tarefas", suppress_callback_exceptions=True)
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.SLATE, FONT_AWESOME], title="EBM Salários e Tarefas", suppress_callback_exceptions=True, background_callback_manager=background_manager)
 server = app.server
 
 # Paleta Padronizada
@@ -36,8 +56,10 @@ COLORS = {
 }
 
 BLUE_NEON_SCALE = [(0.0, "#172554"), (0.5, "#1e40af"), (1.0, "#3b82f6")]
+CORES_CLASSE_ABC = {'A': COLORS['cyan'], 'B': COLORS['azul'], 'C': COLORS['base_gray']}
 money_fmt = Format(precision=2, scheme=Scheme.fixed, symbol=Symbol.yes, symbol_prefix='R$ ', group=Group.yes, group_delimiter='.', decimal_delimiter=',')
 hour_fmt = Format(precision=1, scheme=Scheme.fixed, symbol=Symbol.yes, symbol_suffix=' h')
+num_fmt = Format(precision=2, scheme=Scheme.fixed, group=Group.yes, group_delimiter='.', decimal_delimiter=',')
 
 def update_layout_theme(fig):
     fig.update_layout(
@@ -51,16 +73,7 @@ def update_layout_theme(fig):
 # =============================================================================
 # 3. DADOS E LÓGICA (MANTIDO ORIGINAL)
 # =============================================================================
-TERMOS_INDIRETOS = [
-    'MESTRE', 'ENCARREGADO', 'ESTAGIARIO', 'ESTAGIÁRIO', 'ENGENHEIRO', 'TECNICO', 'TÉCNICO', 
-    'ANALISTA', 'ASSISTENTE', 'AUXILIAR', 'COORDENADOR', 'GERENTE', 'ALMOXARIFE', 
-    'ADMINISTRATIVO', 'APONTADOR', 'VIGIA', 'GUARITA'
-]
-
-def classificar_mo(funcao):
-    if pd.isna(funcao): return 'Direto'
-    if any(termo in str(funcao).upper() for termo in TERMOS_INDIRETOS): return 'Indireto'
-    return 'Direto'
+# TERMOS_INDIRETOS / classificar_mo agora vivem no etl_processamento (o ETL grava o Tipo_MO nas partições)
 
 # Ajuste para ler da pasta dados_tratados corretamente no Render
 PASTA_DADOS = os.path.join(os.getcwd(), 'dados_tratados')
@@ -90,25 +103,105 @@ def load_data():
             else: df_sal[col] = 0.0
 
         if 'Valor_Tarefa' in df_tar.columns: df_tar['Valor_Tarefa'] = df_tar['Valor_Tarefa'].apply(tropicalizar_valor_input)
-        if 'Função' in df_sal.columns: df_sal['Tipo_MO'] = df_sal['Função'].apply(classificar_mo)
+        for df in (df_tar, df_sal):
+            for col in [c for c in df.columns if c.startswith('id_')]: df[col] = df[col].astype('int32')
+        if 'Função' in df_sal.columns: df_sal['Tipo_MO'] = classificar_mo_serie(df_sal['Função'])
         else: df_sal['Tipo_MO'] = 'Direto'
         return df_tar, df_sal
     except FileNotFoundError: return pd.DataFrame(), pd.DataFrame()
 
-df_tarefas, df_salarios = load_data()
-
-# Tratamentos Globais
-if not df_tarefas.empty:
-    if 'Centro_Custo' in df_tarefas.columns: df_tarefas['Centro_Custo'] = df_tarefas['Centro_Custo'].fillna('N/I')
-    if 'Descricao_Servico' in df_tarefas.columns: df_tarefas['Descricao_Servico'] = df_tarefas['Descricao_Servico'].fillna('Serviço N/I')
-    if 'Tipo' not in df_tarefas.columns: df_tarefas['Tipo'] = 'Produção'
-
-if not df_salarios.empty:
-    if 'Função' in df_salarios.columns: df_salarios['Função'] = df_salarios['Função'].fillna('Outros')
-    if 'Justificativa' in df_salarios.columns: df_salarios['Justificativa'] = df_salarios['Justificativa'].fillna('-')
-
-obras = sorted(df_salarios['Obra'].unique()) if not df_salarios.empty else []
-comps = sorted(df_salarios['Competencia'].unique()) if not df_salarios.empty else []
+def assinatura_dados():
+    # Muda sempre que o ETL regrava as bases; invalida o cache dos jobs em segundo plano
+    arquivos = [os.path.join(PASTA_DADOS, nome) for nome in ARQUIVOS_CSV]
+    return '|'.join(str(os.path.getmtime(a)) for a in arquivos if os.path.exists(a))
+
+def garantir_dimensoes(df_tar, df_sal):
+    # Bases de um ETL anterior às dimensões: calcula os ids em memória (sem gravar as dimensões)
+    if df_sal.empty or 'id_obra' in df_sal.columns: return df_tar, df_sal
+    dims = atualizar_dimensoes(carregar_dimensoes(PASTA_DADOS), df_sal, df_tar)
+    return aplicar_dimensoes(dims, df_tar, TAREFAS), aplicar_dimensoes(dims, df_sal, SALARIOS)
+
+def carregar_dados():
+    # Sem partições (ETL antigo): CSVs inteiros
+    return garantir_dimensoes(*load_data()) + ('csv',)
+
+def preencher_vazios(serie, valor):
+    # Nomes vindos das dimensões são Categorical: o valor padrão entra como categoria (em ordem alfabética)
+    if isinstance(serie.dtype, pd.CategoricalDtype) and valor not in serie.cat.categories:
+        serie = serie.cat.set_categories(sorted([*serie.cat.categories, valor]))
+    return serie.fillna(valor)
+
+def tratar_bases(df_tarefas, df_salarios):
+    # Tratamentos Globais
+    if not df_tarefas.empty:
+        if 'Centro_Custo' in df_tarefas.columns: df_tarefas['Centro_Custo'] = df_tarefas['Centro_Custo'].fillna('N/I')
+        if 'Descricao_Servico' in df_tarefas.columns: df_tarefas['Descricao_Servico'] = preencher_vazios(df_tarefas['Descricao_Servico'], 'Serviço N/I')
+        if 'Tipo' not in df_tarefas.columns: df_tarefas['Tipo'] = 'Produção'
+
+    if not df_salarios.empty:
+        if 'Função' in df_salarios.columns: df_salarios['Função'] = preencher_vazios(df_salarios['Função'], 'Outros')
+        if 'Justificativa' in df_salarios.columns: df_salarios['Justificativa'] = df_salarios['Justificativa'].fillna('-')
+    return df_tarefas, df_salarios
+
+def tratar_particao(df_sal, df_tar):
+    df_tar, df_sal = tratar_bases(df_tar, df_sal)
+    return df_sal, df_tar
+
+def particoes_atualizadas(pasta):
+    # CSV alterado depois do ETL (ex.: correção manual) -> partições desatualizadas, vale o CSV
+    with open(os.path.join(PASTA_DADOS, pasta, 'manifesto.json'), encoding='utf-8') as f:
+        gravados = json.load(f).get('csvs', {})
+    atuais = hash_csvs(PASTA_DADOS)
+    mudaram = [nome for nome, hash_gravado in gravados.items() if nome in atuais and atuais[nome] != hash_gravado]
+    for nome in mudaram:
+        print(f"[AVISO] {nome} mudou depois do ETL. Lendo CSVs.")
+    return not mudaram
+
+def carregar_camada(versao):
+    """
+    Partições por competência publicadas pelo ETL: só as recentes ficam em memória e as
+    antigas são lidas sob demanda (camada_dados). Sem partições, CSVs inteiros.
+    """
+    pasta = versao.get('particoes')
+    if pasta and os.path.exists(os.path.join(PASTA_DADOS, pasta, 'manifesto.json')) and particoes_atualizadas(pasta):
+        camada = CamadaDados.de_pasta(os.path.join(PASTA_DADOS, pasta), carregar_dimensoes(PASTA_DADOS), tratar=tratar_particao)
+        return camada, 'partições'
+    df_tar, df_sal, origem = carregar_dados()
+    df_tar, df_sal = tratar_bases(df_tar, df_sal)
+    return CamadaDados.de_bases(df_sal, df_tar), origem
+
+# De quanto em quanto tempo a tela aberta confere se há versão nova (filtros e topo)
+INTERVALO_VERSAO_SEG = int(os.environ.get("DASH_INTERVALO_VERSAO", "60"))
+
+# A versão é lida antes dos dados: se o ETL publicar no meio do boot, a próxima checagem recarrega
+versao_inicial = ler_versao_dados(PASTA_DADOS)
+VERSAO_DADOS = versao_inicial.get('versao', 0)
+inicio_dados = time.perf_counter()
+CAMADA, ORIGEM_DADOS = carregar_camada(versao_inicial)
+TEMPO_DADOS = time.perf_counter() - inicio_dados
+ASSINATURA_DADOS = assinatura_dados()
+
+obras = CAMADA.obras
+comps = CAMADA.competencias
+trava_recarga = threading.Lock()
+
+# Conferência das bases (tarefas x total, bruto - faltas x bruto, horas de HE) e curva ABC
+# (índice por obra/tipo + detalhe por serviço), calculadas por competência quando pedidas.
+# Ficam guardadas na camada junto da partição, e saem da memória com ela.
+def anomalias_competencia(comp):
+    return CAMADA.derivado(comp, 'anomalias', lambda particao: reconciliar(*particao))
+
+def abc_da_particao(particao):
+    return montar_indice_abc(particao[1])
+
+def indice_abc_competencia(comp):
+    return CAMADA.derivado(comp, 'abc', abc_da_particao)
+
+def aquecer_camada(camada):
+    # As competências em memória já sobem com a curva ABC pronta (no boot e a cada versão nova)
+    for comp_recente in camada.quentes: camada.derivado(comp_recente, 'abc', abc_da_particao)
+
+aquecer_camada(CAMADA)
 
 # =============================================================================
 # 4. LAYOUTS (LOGIN vs DASHBOARD)
@@ -191,6 +284,12 @@ login_layout = html.Div(
 )
 
 # --- B. LAYOUT DO DASHBOARD (Encapsulado em Função) ---
+def opcoes_competencia():
+    return [{'label': c, 'value': c} for c in comps]
+
+def opcoes_obra():
+    return [{'label': 'TODAS', 'value': 'TODAS'}] + [{'label': o, 'value': o} for o in obras]
+
 def get_dashboard_layout():
     sidebar = html.Div([
         html.Div([
@@ -199,11 +298,11 @@ def get_dashboard_layout():
         ], className="d-flex align-items-center mb-5 px-2"),
 
         html.Label("COMPETÊNCIA", className="small text-muted fw-bold mb-2 px-2"),
-        dcc.Dropdown(id='filtro-competencia', options=[{'label': c, 'value': c} for c in comps], 
+        dcc.Dropdown(id='filtro-competencia', options=opcoes_competencia(), 
                      value=comps[-1] if comps else None, clearable=False, className="mb-4", style={'backgroundColor': COLORS['filter_bg']}),
 
         html.Label("OBRA", className="small text-muted fw-bold mb-2 px-2"),
-        dcc.Dropdown(id='filtro-obra', options=[{'label': 'TODAS', 'value': 'TODAS'}] + [{'label': o, 'value': o} for o in obras], 
+        dcc.Dropdown(id='filtro-obra', options=opcoes_obra(), 
                      value='TODAS', clearable=False, className="mb-4"),
 
         html.Div([html.Hr(style={'borderColor': COLORS['grid']}), html.Small("v19.0 - Cálculo Qtd Horas", className="text-muted text-center d-block")], style={'marginTop': 'auto'})
@@ -278,70 +377,101 @@ def get_dashboard_layout():
         ]),
 
         # HE
-        dbc.Row([
-            dbc.Col(html.Div([
-                html.H5("Horas Extras por Obra (Geral - R$)", className="mb-3", style={'fontWeight': 'bold'}),
-                dcc.Graph(id='grafico-he-obra', style={'height': '400px'}, config={'displayModeBar': False})
-            ], className="kpi-card p-4 mb-4"), width=12, lg=6),
-            dbc.Col(html.Div([
-                html.H5("Ranking HE por Função (Top 10 - R$)", className="mb-3", style={'fontWeight': 'bold'}),
-                dcc.Graph(id='grafico-he-funcao', style={'height': '400px'}, config={'displayModeBar': False})
-            ], className="kpi-card p-4 mb-4"), width=12, lg=6),
-        ]),
-        
-        # TOP Indiretos HE (QTD)
-        dbc.Row([
-            dbc.Col(html.Div([
-                html.H5("Top 10 Indiretos: Quantidade de Horas Extras (Estimado)", className="mb-3", style={'fontWeight': 'bold', 'color': COLORS['text']}),
-                dcc.Graph(id='grafico-he-indireto-qtd', style={'height': '400px'}, config={'displayModeBar': False})
-            ], className="kpi-card p-4 mb-4"), width=12),
-        ]),
+        html.Div([
+            dcc.Store(id='secao-he-visivel', data=False),
+            dcc.Store(id='secao-he-pedido'),
+            dbc.Progress(id='progresso-he', value=0, striped=True, animated=True, color='info', className='mb-3', style={'display': 'none', 'height': '6px'}),
+            dbc.Row([
+                dbc.Col(html.Div([
+                    html.H5("Horas Extras por Obra (Geral - R$)", className="mb-3", style={'fontWeight': 'bold'}),
+                    dcc.Graph(id='grafico-he-obra', style={'height': '400px'}, config={'displayModeBar': False})
+                ], className="kpi-card p-4 mb-4"), width=12, lg=6),
+                dbc.Col(html.Div([
+                    html.H5("Ranking HE por Função (Top 10 - R$)", className="mb-3", style={'fontWeight': 'bold'}),
+                    dcc.Graph(id='grafico-he-funcao', style={'height': '400px'}, config={'displayModeBar': False})
+                ], className="kpi-card p-4 mb-4"), width=12, lg=6),
+            ]),
+
+            # TOP Indiretos HE (QTD)
+            dbc.Row([
+                dbc.Col(html.Div([
+                    html.H5("Top 10 Indiretos: Quantidade de Horas Extras (Estimado)", className="mb-3", style={'fontWeight': 'bold', 'color': COLORS['text']}),
+                    dcc.Graph(id='grafico-he-indireto-qtd', style={'height': '400px'}, config={'displayModeBar': False})
+                ], className="kpi-card p-4 mb-4"), width=12),
+            ]),
+        ], id='secao-he', className='secao-lazy'),
 
         # Tarefas
-        dbc.Row([
-            dbc.Col(html.Div([
-                html.Div([
-                    html.H5("Top 15 Tarefas Mais Custosas (Curva ABC)", className="mb-0", style={'fontWeight': 'bold'}),
-                    dcc.RadioItems(id='radio-tipo-tarefa', options=[{'label': ' Tudo', 'value': 'TODOS'}, {'label': ' Produção', 'value': 'Produção'}, {'label': ' Outros/Adm', 'value': 'Outros'}], value='TODOS', inputStyle={"marginRight": "5px", "marginLeft": "15px"}, style={'color': 'white'})
-                ], className="d-flex justify-content-between align-items-center mb-3"),
-                dcc.Graph(id='grafico-top-tarefas', style={'height': '450px'}, config={'displayModeBar': False})
-            ], className="kpi-card p-4 mb-4"), width=12),
-        ]),
+        html.Div([
+            dcc.Store(id='secao-tarefas-visivel', data=False),
+            dcc.Store(id='secao-tarefas-pedido'),
+            dbc.Row([
+                dbc.Col(html.Div([
+                    html.Div([
+                        html.H5("Tarefas Mais Custosas (Curva ABC)", className="mb-0", style={'fontWeight': 'bold'}),
+                        html.Div([
+                            dcc.RadioItems(id='radio-tipo-tarefa', options=[{'label': ' Tudo', 'value': 'TODOS'}, {'label': ' Produção', 'value': 'Produção'}, {'label': ' Outros/Adm', 'value': 'Outros'}], value='TODOS', inputStyle={"marginRight": "5px", "marginLeft": "15px"}, style={'color': 'white'}),
+                            dcc.Dropdown(id='abc-top-n', options=[{'label': f'Top {n}', 'value': str(n)} for n in (10, 15, 30, 50)] + [{'label': 'Curva completa', 'value': 'pareto'}],
+                                         value='15', clearable=False, style={'width': '170px', 'marginLeft': '15px', 'backgroundColor': COLORS['filter_bg']}),
+                        ], className="d-flex align-items-center"),
+                    ], className="d-flex justify-content-between align-items-center mb-3"),
+                    dcc.Graph(id='grafico-top-tarefas', style={'height': '450px'}, config={'displayModeBar': False}),
+                    html.Div(id='abc-detalhe', className="mt-3")
+                ], className="kpi-card p-4 mb-4"), width=12),
+            ]),
+        ], id='secao-tarefas', className='secao-lazy'),
 
         # Scatter
-        dbc.Row([
-            dbc.Col(html.Div([
-                html.H5("Dispersão: Salário Fixo vs Produção (MO Direta)", className="mb-3", style={'fontWeight': 'bold'}),
-                dcc.Graph(id='grafico-scatter', style={'height': '450px'}, config={'displayModeBar': False})
-            ], className="kpi-card p-4 mb-4"), width=12),
-        ]),
+        html.Div([
+            dcc.Store(id='secao-scatter-visivel', data=False),
+            dcc.Store(id='secao-scatter-pedido'),
+            dbc.Row([
+                dbc.Col(html.Div([
+                    html.H5("Dispersão: Salário Fixo vs Produção (MO Direta)", className="mb-3", style={'fontWeight': 'bold'}),
+                    dcc.Graph(id='grafico-scatter', style={'height': '450px'}, config={'displayModeBar': False})
+                ], className="kpi-card p-4 mb-4"), width=12),
+            ]),
+        ], id='secao-scatter', className='secao-lazy'),
 
         # Rankings
-        dbc.Row([
-            dbc.Col(html.Div([
-                html.H5("Ranking de Custo: MO DIRETA", className="mb-3", style={'fontWeight': 'bold', 'color': COLORS['azul']}),
-                dcc.Graph(id='grafico-funcao-direto', style={'height': '450px'}, config={'displayModeBar': False})
-            ], className="kpi-card p-4 mb-4"), width=12, lg=6),
-            dbc.Col(html.Div([
-                html.H5("Ranking de Custo: MO INDIRETA (Gestão)", className="mb-3", style={'fontWeight': 'bold', 'color': COLORS['roxo']}),
-                dcc.Graph(id='grafico-funcao-indireto', style={'height': '450px'}, config={'displayModeBar': False})
-            ], className="kpi-card p-4 mb-4"), width=12, lg=6),
-        ]),
+        html.Div([
+            dcc.Store(id='secao-rankings-visivel', data=False),
+            dcc.Store(id='secao-rankings-pedido'),
+            dbc.Row([
+                dbc.Col(html.Div([
+                    html.H5("Ranking de Custo: MO DIRETA", className="mb-3", style={'fontWeight': 'bold', 'color': COLORS['azul']}),
+                    dcc.Graph(id='grafico-funcao-direto', style={'height': '450px'}, config={'displayModeBar': False})
+                ], className="kpi-card p-4 mb-4"), width=12, lg=6),
+                dbc.Col(html.Div([
+                    html.H5("Ranking de Custo: MO INDIRETA (Gestão)", className="mb-3", style={'fontWeight': 'bold', 'color': COLORS['roxo']}),
+                    dcc.Graph(id='grafico-funcao-indireto', style={'height': '450px'}, config={'displayModeBar': False})
+                ], className="kpi-card p-4 mb-4"), width=12, lg=6),
+            ]),
+        ], id='secao-rankings', className='secao-lazy'),
 
         # Tabela
-        dbc.Row([
-            dbc.Col(html.Div([
-                dbc.Tabs([
-                    dbc.Tab(label="🏆 Alta Performance", tab_id="tab-alta", label_style={"color": COLORS['success']}),
-                    dbc.Tab(label="⚠️ Déficit", tab_id="tab-baixa", label_style={"color": COLORS['danger']}),
-                    dbc.Tab(label="📋 Indiretos", tab_id="tab-indiretos", label_style={"color": COLORS['roxo']}),
-                ], id="tabs-tabelas", active_tab="tab-alta", className="mb-3"),
-                html.Div(id="conteudo-tabela")
-            ], className="kpi-card p-4 mb-4"), width=12),
-        ]),
+        html.Div([
+            dcc.Store(id='secao-tabela-visivel', data=False),
+            dcc.Store(id='secao-tabela-pedido'),
+            dbc.Progress(id='progresso-tabela', value=0, striped=True, animated=True, color='info', className='mb-3', style={'display': 'none', 'height': '6px'}),
+            dbc.Row([
+                dbc.Col(html.Div([
+                    dbc.Tabs([
+                        dbc.Tab(label="🏆 Alta Performance", tab_id="tab-alta", label_style={"color": COLORS['success']}),
+                        dbc.Tab(label="⚠️ Déficit", tab_id="tab-baixa", label_style={"color": COLORS['danger']}),
+                        dbc.Tab(label="📋 Indiretos", tab_id="tab-indiretos", label_style={"color": COLORS['roxo']}),
+                        dbc.Tab(label="🔎 Anomalias", tab_id="tab-anomalias", label_style={"color": COLORS['accent_main']}),
+                    ], id="tabs-tabelas", active_tab="tab-alta", className="mb-3"),
+                    html.Div(id="conteudo-tabela")
+                ], className="kpi-card p-4 mb-4"), width=12),
+            ]),
+        ], id='secao-tabela', className='secao-lazy'),
     ], id="page-content", className="content")
     
-    return html.Div([dcc.Store(id='side_click'), sidebar, content])
+    # Versão dos dados que os filtros da tela mostram; o intervalo confere se o ETL publicou outra
+    versao = [dcc.Store(id='versao-filtros', data=VERSAO_DADOS),
+              dcc.Interval(id='intervalo-versao', interval=INTERVALO_VERSAO_SEG * 1000)]
+    return html.Div([dcc.Store(id='side_click'), *versao, sidebar, content])
 
 # APP LAYOUT PRINCIPAL (CONTROLADOR)
 app.layout = html.Div([
@@ -366,6 +496,7 @@ def manage_login(n_login, username, password): # REMOVIDO n_logout DOS ARGUMENTO
     # Como só tem um Input agora, não precisamos verificar qual botão foi clicado
     if n_login:
         if username in USUARIOS and USUARIOS[username] == password:
+            recarregar_se_publicado()  # Filtros do layout já com as obras/competências da versão nova
             return get_dashboard_layout(), ""
         else:
             return login_layout, "Acesso Negado: Usuário ou senha incorretos."
@@ -385,31 +516,36 @@ def toggle_sidebar(n, s_class, c_class):
     if n: return ("sidebar", "content") if "sidebar-collapsed" in s_class else ("sidebar sidebar-collapsed", "content content-expanded")
     return s_class, c_class
 
-@app.callback(
-    [Output('kpi-custo-real', 'children'), Output('kpi-prod', 'children'),
-     Output('kpi-efic', 'children'), Output('kpi-pct-bonificada', 'children'),
-     Output('kpi-resultado', 'children'), Output('kpi-desperdicio', 'children'), 
-     Output('grafico-balanco-roi', 'figure'),
-     Output('grafico-obra-stack', 'figure'), Output('grafico-pie-mo', 'figure'),
-     Output('grafico-he-obra', 'figure'), Output('grafico-he-funcao', 'figure'), Output('grafico-he-indireto-qtd', 'figure'),
-     Output('grafico-top-tarefas', 'figure'),
-     Output('grafico-scatter', 'figure'), 
-     Output('grafico-funcao-direto', 'figure'), Output('grafico-funcao-indireto', 'figure'),
-     Output('conteudo-tabela', 'children')],
-    [Input('filtro-competencia', 'value'), Input('filtro-obra', 'value'),
-     Input('tabs-tabelas', 'active_tab'), Input('radio-tipo-tarefa', 'value')]
-)
-def update_dash(comp, obra, tab, tipo_tarefa_filtro):
-    if df_salarios.empty: return "R$ 0", "R$ 0", "", "0%", "", "R$ 0", {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, []
+# --- FUNÇÕES DE CÁLCULO (CACHEADAS POR FILTRO) ---
+# Cada seção do dashboard é calculada por uma função própria, memorizada por
+# combinação de filtros. Assim, rolar a página de volta para uma seção já vista
+# (ou repetir um filtro) não recalcula nada no servidor.
+fmt = lambda x: f"R$ {x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
 
-    df_s = df_salarios[df_salarios['Competencia'] == comp].copy()
+def figura_vazia():
+    return update_layout_theme(go.Figure())
+
+def filtrar_bases(comp, obra):
+    # ATENÇÃO: os DataFrames retornados são compartilhados com a camada de dados. Use .copy() antes de alterar.
+    # Lê só a partição da competência (memória ou disco); sem cache aqui para não segurar partições frias.
+    df_s, df_t = CAMADA.obter(comp)
     if obra != 'TODAS': df_s = df_s[df_s['Obra'] == obra]
-    df_t = df_tarefas[df_tarefas['Competencia'] == comp].copy()
     if obra != 'TODAS': df_t = df_t[df_t['Obra'] == obra]
+    return df_s, df_t
 
-    # --- KPI: DIRETO ---
+def diretos_com_gap(df_s):
     df_direto_kpi = df_s[df_s['Tipo_MO'] == 'Direto'].copy()
     df_direto_kpi['Ganho_Real'] = df_direto_kpi['Valor das tarefas (R$)'] > df_direto_kpi['Salario Base (R$)']
+    df_direto_kpi['Gap'] = df_direto_kpi['Valor das tarefas (R$)'] - df_direto_kpi['Salario Base (R$)']
+    return df_direto_kpi
+
+@lru_cache(maxsize=32)
+def calcular_topo(comp, obra):
+    import plotly.express as px
+    df_s, df_t = filtrar_bases(comp, obra)
+
+    # --- KPI: DIRETO ---
+    df_direto_kpi = diretos_com_gap(df_s)
     
     total_diretos = len(df_direto_kpi)
     total_bonificados = len(df_direto_kpi[df_direto_kpi['Ganho_Real'] == True])
@@ -420,7 +556,6 @@ def update_dash(comp, obra, tab, tipo_tarefa_filtro):
     prod_direto = df_direto_kpi['Valor das tarefas (R$)'].sum()
     custo_direto = df_direto_kpi['Salário bruto - faltas (R$)'].sum()
     
-    df_direto_kpi['Gap'] = df_direto_kpi['Valor das tarefas (R$)'] - df_direto_kpi['Salario Base (R$)']
     desperdicio = abs(df_direto_kpi[df_direto_kpi['Gap'] < 0]['Gap'].sum())
     custo_total_geral = df_s['Salário bruto - faltas (R$)'].sum()
     
@@ -431,7 +566,6 @@ def update_dash(comp, obra, tab, tipo_tarefa_filtro):
     else:
         kpi_efic_comp = html.Span([html.I(className="fa-solid fa-arrow-trend-up me-2"), f"{efic:.1f}% ", html.Span("(Meta)", style={'fontSize': '0.65rem', 'opacity': '0.8'})], style={'color': COLORS['azul'], 'fontWeight': 'bold', 'fontSize': '1.1rem'})
 
-    fmt = lambda x: f"R$ {x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
     resultado = prod_direto - custo_direto
     cor_res = COLORS['success'] if resultado >= 0 else COLORS['danger']
     icone_res = "fa-thumbs-up" if resultado >= 0 else "fa-thumbs-down"
@@ -459,6 +593,13 @@ def update_dash(comp, obra, tab, tipo_tarefa_filtro):
     fig_pie = update_layout_theme(fig_pie)
     fig_pie.update_traces(textinfo='percent+label', hovertemplate='<b>%{label}</b><br>Total: R$ %{value:,.2f}<extra></extra>')
 
+    return fmt(custo_total_geral), fmt(prod_direto), kpi_efic_comp, kpi_pct_bonif_fmt, kpi_res_comp, fmt(desperdicio), fig_roi, fig_stack, fig_pie
+
+@lru_cache(maxsize=32)
+def figura_he_obra(comp, obra):
+    import plotly.express as px
+    df_s, _ = filtrar_bases(comp, obra)
+
     # 3. HE
     df_he_obra = df_s.melt(id_vars='Obra', value_vars=['HE 50% (em tarefas)', 'HE 50% (fora tarefas)'], var_name='Tipo', value_name='Valor')
     df_he_obra = df_he_obra.groupby(['Obra', 'Tipo'])['Valor'].sum().reset_index()
@@ -466,6 +607,12 @@ def update_dash(comp, obra, tab, tipo_tarefa_filtro):
     fig_he_obra = update_layout_theme(fig_he_obra)
     fig_he_obra.update_layout(legend=dict(orientation="h", y=1.1, title=None))
     fig_he_obra.update_traces(hovertemplate='<b>%{x}</b><br>%{data.name}: R$ %{y:,.2f}<extra></extra>')
+    return fig_he_obra
+
+@lru_cache(maxsize=32)
+def figura_he_funcao(comp, obra):
+    import plotly.express as px
+    df_s, _ = filtrar_bases(comp, obra)
 
     # 4. HE Função
     df_he_func = df_s.melt(id_vars='Função', value_vars=['HE 50% (em tarefas)', 'HE 50% (fora tarefas)'], var_name='Tipo', value_name='Valor')
@@ -476,6 +623,12 @@ def update_dash(comp, obra, tab, tipo_tarefa_filtro):
     fig_he_func = update_layout_theme(fig_he_func)
     fig_he_func.update_layout(legend=dict(orientation="h", y=1.1, title=None))
     fig_he_func.update_traces(hovertemplate='<b>%{y}</b><br>%{data.name}: R$ %{x:,.2f}<extra></extra>')
+    return fig_he_func
+
+@lru_cache(maxsize=32)
+def figura_he_indireto_qtd(comp, obra):
+    import plotly.express as px
+    df_s, _ = filtrar_bases(comp, obra)
 
     # 4.1. TOP Indiretos QTD HE (Cálculo Estimado)
     df_ind_he = df_s[df_s['Tipo_MO'] == 'Indireto'].copy()
@@ -490,21 +643,93 @@ def update_dash(comp, obra, tab, tipo_tarefa_filtro):
         fig_he_ind_qtd.update_layout(yaxis=dict(autorange="reversed")) 
         fig_he_ind_qtd.update_traces(hovertemplate='<b>%{y}</b><br>Horas Extras: %{x:.1f}h<br>Valor: R$ %{customdata:.2f}<br>Salário Base: R$ %{text}<extra></extra>', customdata=df_top_ind_he['Total_HE_Val'], text=df_top_ind_he['Salario Base (R$)'].apply(fmt))
     else:
-        fig_he_ind_qtd = go.Figure(); fig_he_ind_qtd = update_layout_theme(fig_he_ind_qtd)
-
-    # 5. Top Tarefas
-    if not df_t.empty:
-        if tipo_tarefa_filtro == 'Produção': df_t_filt = df_t[df_t['Tipo'] == 'Produção']
-        elif tipo_tarefa_filtro == 'Outros': df_t_filt = df_t[df_t['Tipo'] != 'Produção']
-        else: df_t_filt = df_t.copy()
-        df_serv = df_t_filt.groupby('Descricao_Servico')['Valor_Tarefa'].sum().reset_index()
-        df_serv = df_serv.sort_values('Valor_Tarefa', ascending=False).head(15)
-        fig_tar = px.bar(df_serv, x='Valor_Tarefa', y='Descricao_Servico', orientation='h', color='Valor_Tarefa', color_continuous_scale=BLUE_NEON_SCALE)
-        fig_tar = update_layout_theme(fig_tar)
-        fig_tar.update_layout(yaxis=dict(autorange="reversed"))
-        fig_tar.update_traces(hovertemplate='<b>%{y}</b><br>Total: R$ %{x:,.2f}<extra></extra>')
-    else:
-        fig_tar = go.Figure(); fig_tar = update_layout_theme(fig_tar)
+        fig_he_ind_qtd = figura_vazia()
+    return fig_he_ind_qtd
+
+ETAPAS_SECAO_HE = (figura_he_obra, figura_he_funcao, figura_he_indireto_qtd)
+
+def calcular_secao_he(comp, obra):
+    return tuple(calcular(comp, obra) for calcular in ETAPAS_SECAO_HE)
+
+@lru_cache(maxsize=64)
+def calcular_secao_tarefas(comp, obra, tipo_tarefa_filtro, top_n='15'):
+    import plotly.express as px
+
+    # 5. Top Tarefas: lidas do índice ABC já ordenado (top-N = primeiras N linhas)
+    curva = indice_abc_competencia(comp)[0].get((comp, obra, tipo_tarefa_filtro))
+    if curva is None or curva.empty: return figura_vazia()
+    if top_n == 'pareto': return figura_pareto(curva)
+    df_serv = curva.head(int(top_n))
+    fig_tar = px.bar(df_serv, x='Valor_Tarefa', y='Descricao_Servico', orientation='h', color='Classe', color_discrete_map=CORES_CLASSE_ABC,
+                     category_orders={'Classe': ['A', 'B', 'C'], 'Descricao_Servico': list(df_serv['Descricao_Servico'])},
+                     custom_data=['id_servico', 'Pct', 'Pct_Acum'])
+    fig_tar = update_layout_theme(fig_tar)
+    fig_tar.update_layout(yaxis=dict(title=None), xaxis=dict(title=None), legend=dict(orientation="h", y=1.08, title=None))
+    fig_tar.update_traces(hovertemplate='<b>%{y}</b><br>Total: R$ %{x:,.2f}<br>%{customdata[1]:.1%} do total | acumulado %{customdata[2]:.1%}<extra>Classe %{fullData.name}</extra>')
+    return fig_tar
+
+def figura_pareto(curva):
+    # Curva completa: barras por posição + % acumulado no eixo secundário, com os cortes A/B
+    fig = go.Figure()
+    fig.add_bar(x=curva['Rank'], y=curva['Valor_Tarefa'], marker_color=curva['Classe'].map(CORES_CLASSE_ABC),
+                customdata=curva[['id_servico', 'Descricao_Servico', 'Classe', 'Pct_Acum']], name='Valor',
+                hovertemplate='<b>%{customdata[1]}</b><br>Total: R$ %{y:,.2f}<br>Classe %{customdata[2]} | acumulado %{customdata[3]:.1%}<extra></extra>')
+    fig.add_scatter(x=curva['Rank'], y=curva['Pct_Acum'] * 100, yaxis='y2', mode='lines', name='% acumulado',
+                    line=dict(color=COLORS['success']), hoverinfo='skip')
+    for limite in (LIMITE_CLASSE_A, LIMITE_CLASSE_B):
+        fig.add_hline(y=limite * 100, yref='y2', line_dash='dot', line_color=COLORS['subtext'])
+    fig = update_layout_theme(fig)
+    fig.update_layout(showlegend=False, xaxis=dict(title='Serviços (ordem de custo)'),
+                      yaxis2=dict(overlaying='y', side='right', range=[0, 105], ticksuffix='%', showgrid=False))
+    return fig
+
+SERVICO_NAO_ENCONTRADO = "Serviço não encontrado para este filtro. Clique em um serviço do gráfico atual."
+
+def aviso_detalhe(texto):
+    return html.Small(texto, style={'color': COLORS['subtext']})
+
+@lru_cache(maxsize=64)
+def calcular_detalhe_servico(comp, obra, tipo_tarefa_filtro, id_servico):
+    """
+    Drill-down de um serviço da curva ABC: funcionários e centros de custo por trás do valor.
+    Serviço fora da curva do filtro (ex.: clique num gráfico de outra obra) vira um aviso.
+    """
+    indice, detalhe = indice_abc_competencia(comp)
+    curva = indice.get((comp, obra, tipo_tarefa_filtro))
+    if curva is None or id_servico not in curva['id_servico'].values or (comp, id_servico) not in detalhe.index:
+        return aviso_detalhe(SERVICO_NAO_ENCONTRADO)
+    linhas = detalhe.loc[(comp, id_servico)]
+    if obra != 'TODAS': linhas = linhas[linhas['Obra'] == obra]
+    if tipo_tarefa_filtro != 'TODOS': linhas = linhas[linhas['Tipo'] == tipo_tarefa_filtro]
+    if linhas.empty:
+        return aviso_detalhe(SERVICO_NAO_ENCONTRADO)
+    df_det = linhas.groupby(['Funcionario', 'Funcao', 'Centro_Custo', 'Obra'], as_index=False)['Valor_Tarefa'].sum()
+    df_det = df_det.sort_values('Valor_Tarefa', ascending=False)
+    df_det['Pct'] = df_det['Valor_Tarefa'] / df_det['Valor_Tarefa'].sum() * 100
+    nome_servico = curva.set_index('id_servico').at[id_servico, 'Descricao_Servico']
+
+    cols = [
+        {"name": "Funcionário", "id": "Funcionario"}, {"name": "Função", "id": "Funcao"},
+        {"name": "Centro de Custo", "id": "Centro_Custo"}, {"name": "Obra", "id": "Obra"},
+        {"name": "Valor", "id": "Valor_Tarefa", "type": "numeric", "format": money_fmt},
+        {"name": "% do serviço", "id": "Pct", "type": "numeric", "format": Format(precision=1, scheme=Scheme.fixed, symbol=Symbol.yes, symbol_suffix='%')},
+    ]
+    return html.Div([
+        html.H6(f"{nome_servico}: {fmt(df_det['Valor_Tarefa'].sum())} em {df_det['Funcionario'].nunique()} funcionários e {df_det['Centro_Custo'].nunique()} centros de custo",
+                style={'color': COLORS['accent_main'], 'fontWeight': 'bold'}),
+        dash_table.DataTable(
+            data=df_det.head(100).to_dict('records'), columns=cols,
+            page_size=10, sort_action='native', style_as_list_view=True,
+            style_header={'backgroundColor': '#0f172a', 'color': COLORS['accent_main'], 'fontWeight': 'bold', 'borderBottom': '2px solid #334155'},
+            style_cell={'backgroundColor': 'transparent', 'color': '#cbd5e1', 'borderBottom': '1px solid #334155', 'textAlign': 'left', 'padding': '8px'},
+        )
+    ])
+
+@lru_cache(maxsize=32)
+def calcular_secao_scatter(comp, obra):
+    import plotly.express as px
+    df_s, _ = filtrar_bases(comp, obra)
+    df_direto_kpi = diretos_com_gap(df_s)
 
     # 6. Scatter
     df_direto_kpi['Status'] = df_direto_kpi['Gap'].apply(lambda x: 'Alta' if x > 0 else 'Baixa')
@@ -513,6 +738,12 @@ def update_dash(comp, obra, tab, tipo_tarefa_filtro):
     fig_sc.add_shape(type="line", x0=0, y0=0, x1=max_val, y1=max_val, line=dict(color="white", dash="dash"))
     fig_sc = update_layout_theme(fig_sc)
     fig_sc.update_traces(hovertemplate='<b>%{customdata[0]}</b><br>%{customdata[1]}<br>Base: R$ %{x:,.2f} | Prod: R$ %{y:,.2f}<extra></extra>')
+    return fig_sc
+
+@lru_cache(maxsize=32)
+def calcular_secao_rankings(comp, obra):
+    import plotly.express as px
+    df_s, _ = filtrar_bases(comp, obra)
 
     # 7. Rankings
     df_f_dir = df_s[df_s['Tipo_MO'] == 'Direto'].groupby('Função')['Salário bruto - faltas (R$)'].sum().reset_index()
@@ -528,10 +759,23 @@ def update_dash(comp, obra, tab, tipo_tarefa_filtro):
     fig_fun_ind = update_layout_theme(fig_fun_ind)
     fig_fun_ind.update_layout(yaxis=dict(autorange="reversed"))
     fig_fun_ind.update_traces(hovertemplate='<b>%{y}</b><br>Pago: R$ %{x:,.2f}<extra></extra>')
+    return fig_fun_dir, fig_fun_ind
+
+def preparar_base_tabela(comp, obra):
+    # Guardada na camada junto da partição da competência (uma cópia por obra)
+    return CAMADA.derivado(comp, ('tabela', obra), lambda _: montar_base_tabela(filtrar_bases(comp, obra)[0]))
+
+def montar_base_tabela(df_s):
+    df_s = df_s.copy()
 
     # Tabela
     df_s['Total_HE_Val'] = df_s['HE 50% (em tarefas)'] + df_s['HE 50% (fora tarefas)']
     df_s['Qtd_HE_Calc'] = df_s.apply(lambda x: x['Total_HE_Val'] / ((x['Salario Base (R$)']/220)*1.5) if x['Salario Base (R$)'] > 0 else 0, axis=1)
+    return df_s
+
+@lru_cache(maxsize=64)
+def calcular_secao_tabela(comp, obra, tab):
+    df_s = preparar_base_tabela(comp, obra)
 
     cols = [
         {"name": "Nome", "id": "Nome"}, {"name": "Função", "id": "Função"}, {"name": "Tipo", "id": "Tipo_MO"},
@@ -544,7 +788,19 @@ def update_dash(comp, obra, tab, tipo_tarefa_filtro):
         {"name": "Justificativa", "id": "Justificativa"}
     ]
 
-    if tab == "tab-alta":
+    if tab == "tab-anomalias":
+        # Resultado da reconciliação no filtro atual; esperado/encontrado em R$ ou horas, conforme a regra
+        df_tab = anomalias_competencia(comp)
+        if obra != 'TODAS': df_tab = df_tab[df_tab['Obra'] == obra]
+        df_tab = df_tab.sort_values(['Regra', 'Diferenca'], key=lambda col: col.abs() if col.name == 'Diferenca' else col, ascending=[True, False])
+        cols = [
+            {"name": "Regra", "id": "Regra"}, {"name": "Obra", "id": "Obra"}, {"name": "Nome", "id": "Nome"}, {"name": "Função", "id": "Função"},
+            {"name": "Esperado", "id": "Valor_Esperado", "type": "numeric", "format": num_fmt},
+            {"name": "Encontrado", "id": "Valor_Encontrado", "type": "numeric", "format": num_fmt},
+            {"name": "Diferença", "id": "Diferenca", "type": "numeric", "format": num_fmt},
+        ]
+        head_color = COLORS['accent_main']
+    elif tab == "tab-alta":
         df_tab = df_s[df_s['Tipo_MO'] == 'Direto'].copy()
         df_tab['Gap'] = df_tab['Valor das tarefas (R$)'] - df_tab['Salario Base (R$)']
         df_tab = df_tab[df_tab['Gap'] > 0].sort_values('Gap', ascending=False)
@@ -558,7 +814,7 @@ def update_dash(comp, obra, tab, tipo_tarefa_filtro):
         df_tab = df_s[df_s['Tipo_MO'] == 'Indireto'].sort_values('Salário bruto - faltas (R$)', ascending=False)
         head_color = COLORS['roxo']
 
-    tabela = dash_table.DataTable(
+    return dash_table.DataTable(
         data=df_tab.head(200).to_dict('records'), columns=cols,
         page_size=15, sort_action='native', style_as_list_view=True,
         style_header={'backgroundColor': '#0f172a', 'color': head_color, 'fontWeight': 'bold', 'borderBottom': '2px solid #334155'},
@@ -566,7 +822,182 @@ def update_dash(comp, obra, tab, tipo_tarefa_filtro):
         style_data_conditional=[{'if': {'row_index': 'odd'}, 'backgroundColor': 'rgba(255, 255, 255, 0.02)'}]
     )
 
-    return fmt(custo_total_geral), fmt(prod_direto), kpi_efic_comp, kpi_pct_bonif_fmt, kpi_res_comp, fmt(desperdicio), fig_roi, fig_stack, fig_pie, fig_he_obra, fig_he_func, fig_he_ind_qtd, fig_tar, fig_sc, fig_fun_dir, fig_fun_ind, tabela
+# --- CALLBACKS ---
+# O topo (KPIs + primeiros gráficos) é calculado assim que o dashboard abre.
+# As seções abaixo da dobra só são calculadas quando entram na tela: o script
+# assets/lazy_sections.js observa cada '.secao-lazy' e grava True no Store
+# '<id>-visivel' quando ela aparece. Até lá, o callback não roda.
+# Caches por filtro que dependem das bases carregadas (os derivados da camada saem com ela)
+FUNCOES_CACHEADAS = [calcular_topo, figura_he_obra, figura_he_funcao, figura_he_indireto_qtd,
+                     calcular_secao_tarefas, calcular_detalhe_servico, calcular_secao_scatter, calcular_secao_rankings,
+                     calcular_secao_tabela]
+
+def recarregar_se_publicado():
+    """
+    O ETL (ou o pipeline.py) grava versao_dados.json por último ao publicar. Se a versão
+    mudou, monta a camada de dados nova, troca e limpa os caches, sem reiniciar o app.
+    """
+    global CAMADA, ORIGEM_DADOS, ASSINATURA_DADOS, VERSAO_DADOS, obras, comps
+    CAMADA.garantir_leitor()  # Primeiro request deste worker: marca a pasta de partições como em uso
+    dados_versao = ler_versao_dados(PASTA_DADOS)
+    versao = dados_versao.get('versao', 0)
+    if versao == VERSAO_DADOS: return
+    with trava_recarga:
+        if versao == VERSAO_DADOS: return
+        camada_antiga = CAMADA
+        camada_nova, ORIGEM_DADOS = carregar_camada(dados_versao)
+        camada_nova.garantir_leitor()
+        aquecer_camada(camada_nova)  # Antes da troca: o primeiro filtro na versão nova já acha a curva ABC
+        CAMADA = camada_nova
+        obras, comps = CAMADA.obras, CAMADA.competencias
+        ASSINATURA_DADOS = assinatura_dados()
+        for funcao in FUNCOES_CACHEADAS: funcao.cache_clear()
+        VERSAO_DADOS = versao
+        # Este processo já não lê a versão anterior; se ninguém mais lê, as partições antigas saem
+        camada_antiga.liberar()
+        limpar_particoes_antigas(versao, PASTA_DADOS)
+    print(f"[DADOS] Versão {versao} publicada: bases recarregadas via {ORIGEM_DADOS} ({CAMADA.resumo()}).")
+
+@app.callback(
+    [Output('filtro-competencia', 'options'), Output('filtro-competencia', 'value'),
+     Output('filtro-obra', 'options'), Output('filtro-obra', 'value'), Output('versao-filtros', 'data')],
+    [Input('intervalo-versao', 'n_intervals')],
+    [State('versao-filtros', 'data'), State('filtro-competencia', 'value'), State('filtro-obra', 'value')]
+)
+def atualizar_filtros(_, versao_tela, comp, obra):
+    # Publicação nova (ex.: um mês a mais): opções dos filtros da versão nova, mantendo a
+    # seleção se ela ainda existir. Sem isso o mês novo só aparecia num novo login.
+    recarregar_se_publicado()
+    if VERSAO_DADOS == versao_tela: raise PreventUpdate
+    comp = comp if comp in comps else (comps[-1] if comps else None)
+    obra = obra if obra in obras else 'TODAS'
+    return opcoes_competencia(), comp, opcoes_obra(), obra, VERSAO_DADOS
+
+@app.callback(
+    [Output('kpi-custo-real', 'children'), Output('kpi-prod', 'children'),
+     Output('kpi-efic', 'children'), Output('kpi-pct-bonificada', 'children'),
+     Output('kpi-resultado', 'children'), Output('kpi-desperdicio', 'children'), 
+     Output('grafico-balanco-roi', 'figure'),
+     Output('grafico-obra-stack', 'figure'), Output('grafico-pie-mo', 'figure')],
+    [Input('filtro-competencia', 'value'), Input('filtro-obra', 'value'), Input('versao-filtros', 'data')]
+)
+def update_dash(comp, obra, _versao):
+    # A versão também é entrada: com o mesmo filtro, o topo é recalculado com os dados novos
+    recarregar_se_publicado()
+    if not comps: return "R$ 0", "R$ 0", "", "0%", "", "R$ 0", {}, {}, {}
+    return calcular_topo(comp, obra)
+
+def secao_visivel(visivel):
+    recarregar_se_publicado()
+    if not comps or not visivel: raise PreventUpdate
+
+def callback_pesado(secao, outputs, inputs, cancelar_em=()):
+    """
+    Registra o cálculo de uma seção pesada como job em segundo plano, com barra de
+    progresso e cancelamento quando os filtros mudam (ou algum Input de cancelar_em,
+    como a aba da própria seção). A função decorada recebe set_progress como primeiro
+    argumento. Sem gerenciador, vira um callback comum.
+    """
+    def decorar(func):
+        if background_manager is None:
+            return app.callback(outputs, inputs)(lambda *args: func(lambda _: None, *args))
+        return app.callback(
+            outputs, inputs, background=True,
+            progress=[Output(f'progresso-{secao}', 'value')],
+            running=[(Output(f'progresso-{secao}', 'style'), {'display': 'flex', 'height': '6px'}, {'display': 'none'})],
+            cancel=[Input('filtro-competencia', 'value'), Input('filtro-obra', 'value'), *cancelar_em],
+        )(func)
+    return decorar
+
+# Seções pesadas: um callback leve (síncrono) transforma filtros + visibilidade em
+# um "pedido". Só pedidos novos disparam o job em segundo plano, então voltar a
+# rolar até uma seção já carregada com o mesmo filtro não gera trabalho algum.
+@app.callback(
+    Output('secao-he-pedido', 'data'),
+    [Input('filtro-competencia', 'value'), Input('filtro-obra', 'value'), Input('secao-he-visivel', 'data')],
+    [State('secao-he-pedido', 'data')]
+)
+def pedir_secao_he(comp, obra, visivel, pedido_atual):
+    return novo_pedido(visivel, pedido_atual, comp=comp, obra=obra)
+
+@callback_pesado('he',
+    [Output('grafico-he-obra', 'figure'), Output('grafico-he-funcao', 'figure'), Output('grafico-he-indireto-qtd', 'figure')],
+    [Input('secao-he-pedido', 'data')]
+)
+def update_secao_he(set_progress, pedido):
+    if not pedido: raise PreventUpdate
+    figuras = []
+    for etapa, calcular in enumerate(ETAPAS_SECAO_HE):
+        set_progress(int(etapa / len(ETAPAS_SECAO_HE) * 100))
+        figuras.append(calcular(pedido['comp'], pedido['obra']))
+    return tuple(figuras)
+
+# Seções leves (síncronas): o mesmo pedido das pesadas, guardado junto da figura. Um
+# filtro já desenhado não reenvia a figura.
+def novo_pedido(visivel, pedido_atual, **filtros):
+    secao_visivel(visivel)
+    pedido = {**filtros, 'versao': VERSAO_DADOS}
+    if pedido == pedido_atual: raise PreventUpdate
+    return pedido
+
+@app.callback(
+    [Output('grafico-top-tarefas', 'figure'), Output('secao-tarefas-pedido', 'data')],
+    [Input('filtro-competencia', 'value'), Input('filtro-obra', 'value'),
+     Input('radio-tipo-tarefa', 'value'), Input('abc-top-n', 'value'), Input('secao-tarefas-visivel', 'data')],
+    [State('secao-tarefas-pedido', 'data')]
+)
+def update_secao_tarefas(comp, obra, tipo_tarefa_filtro, top_n, visivel, pedido_atual):
+    pedido = novo_pedido(visivel, pedido_atual, comp=comp, obra=obra, tipo=tipo_tarefa_filtro, top_n=top_n)
+    return calcular_secao_tarefas(comp, obra, tipo_tarefa_filtro, top_n), pedido
+
+@app.callback(
+    Output('abc-detalhe', 'children'),
+    [Input('grafico-top-tarefas', 'clickData'), Input('filtro-competencia', 'value'),
+     Input('filtro-obra', 'value'), Input('radio-tipo-tarefa', 'value')]
+)
+def update_detalhe_servico(click, comp, obra, tipo_tarefa_filtro):
+    # Mudou o filtro: o clique anterior não vale mais
+    if dash.callback_context.triggered_id != 'grafico-top-tarefas' or not click or 'customdata' not in click['points'][0]:
+        return aviso_detalhe("Clique em um serviço para ver os funcionários e centros de custo.")
+    return calcular_detalhe_servico(comp, obra, tipo_tarefa_filtro, int(click['points'][0]['customdata'][0]))
+
+@app.callback(
+    [Output('grafico-scatter', 'figure'), Output('secao-scatter-pedido', 'data')],
+    [Input('filtro-competencia', 'value'), Input('filtro-obra', 'value'), Input('secao-scatter-visivel', 'data')],
+    [State('secao-scatter-pedido', 'data')]
+)
+def update_secao_scatter(comp, obra, visivel, pedido_atual):
+    pedido = novo_pedido(visivel, pedido_atual, comp=comp, obra=obra)
+    return calcular_secao_scatter(comp, obra), pedido
+
+@app.callback(
+    [Output('grafico-funcao-direto', 'figure'), Output('grafico-funcao-indireto', 'figure'), Output('secao-rankings-pedido', 'data')],
+    [Input('filtro-competencia', 'value'), Input('filtro-obra', 'value'), Input('secao-rankings-visivel', 'data')],
+    [State('secao-rankings-pedido', 'data')]
+)
+def update_secao_rankings(comp, obra, visivel, pedido_atual):
+    pedido = novo_pedido(visivel, pedido_atual, comp=comp, obra=obra)
+    return (*calcular_secao_rankings(comp, obra), pedido)
+
+@app.callback(
+    Output('secao-tabela-pedido', 'data'),
+    [Input('filtro-competencia', 'value'), Input('filtro-obra', 'value'),
+     Input('tabs-tabelas', 'active_tab'), Input('secao-tabela-visivel', 'data')],
+    [State('secao-tabela-pedido', 'data')]
+)
+def pedir_secao_tabela(comp, obra, tab, visivel, pedido_atual):
+    return novo_pedido(visivel, pedido_atual, comp=comp, obra=obra, tab=tab)
+
+@callback_pesado('tabela', Output('conteudo-tabela', 'children'), [Input('secao-tabela-pedido', 'data')],
+                 cancelar_em=[Input('tabs-tabelas', 'active_tab')])
+def update_secao_tabela(set_progress, pedido):
+    if not pedido: raise PreventUpdate
+    set_progress(0)
+    preparar_base_tabela(pedido['comp'], pedido['obra'])
+    set_progress(60)
+    return calcular_secao_tabela(pedido['comp'], pedido['obra'], pedido['tab'])
+
+print(f"[STARTUP] Dados via {ORIGEM_DADOS} em {TEMPO_DADOS:.3f}s ({CAMADA.resumo()}) | app pronto em {time.perf_counter() - TEMPO_INICIO:.3f}s")
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
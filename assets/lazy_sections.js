@@ -0,0 +1,35 @@
+/* assets/lazy_sections.js */
+
+/*
+ * Carregamento sob demanda das seções do dashboard.
+ * Cada bloco com a classe "secao-lazy" tem um dcc.Store "<id>-visivel".
+ * Quando o bloco entra na tela, gravamos true no Store e o callback Python
+ * correspondente calcula os gráficos. Sair da tela não avisa o servidor: a
+ * seção já desenhada continua seguindo os filtros (o pedido guardado no
+ * servidor evita recalcular o mesmo filtro), então paramos de observá-la.
+ * O dashboard é montado depois do login, por isso observamos o DOM para
+ * registrar as seções assim que aparecem.
+ */
+(function () {
+    var MARGEM = '200px 0px'; // Começa a carregar um pouco antes de aparecer
+
+    function marcarVisibilidade(entradas) {
+        entradas.forEach(function (entrada) {
+            if (!entrada.isIntersecting) { return; }
+            if (!window.dash_clientside || !window.dash_clientside.set_props) { return; }
+            window.dash_clientside.set_props(entrada.target.id + '-visivel', { data: true });
+            observador.unobserve(entrada.target);
+        });
+    }
+
+    var observador = new IntersectionObserver(marcarVisibilidade, { rootMargin: MARGEM });
+
+    function registrarSecoes() {
+        document.querySelectorAll('.secao-lazy:not([data-observada])').forEach(function (secao) {
+            secao.setAttribute('data-observada', '1');
+            observador.observe(secao);
+        });
+    }
+
+    new MutationObserver(registrarSecoes).observe(document.documentElement, { childList: true, subtree: true });
+})();
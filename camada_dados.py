@@ -0,0 +1,197 @@
+"""
+Camada de dados em níveis do dashboard.
+
+- Quente: as competências mais recentes (MESES_EM_MEMORIA) ficam sempre em memória.
+- Fria: as demais ficam nas partições gravadas pelo ETL (dados_tratados/particoes_v<versão>,
+  parquet, uma por competência) e só são lidas quando um filtro pede. As lidas ficam num
+  LRU limitado por tamanho (LIMITE_CACHE_MB); passou do limite, a menos usada sai.
+- Derivados (anomalias, curva ABC, base da tabela...) ficam junto da partição de onde
+  saíram (derivado()): contam no mesmo limite e saem do LRU com ela. Os das competências
+  quentes (um por obra, no caso da tabela) ficam num LRU próprio, no mesmo limite: passou
+  dele, saem primeiro as partições frias e depois os derivados quentes menos usados.
+
+Uma consulta lê só a partição da competência filtrada. Bases antigas, sem partições
+(CSVs de um ETL anterior), entram inteiras como "quentes", como era antes.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from etl_processamento import SALARIOS, TAREFAS, caminho_particao, expandir_fatos, liberar_leitor_particoes, registrar_leitor_particoes
+
+MESES_EM_MEMORIA = int(os.environ.get("DASH_MESES_EM_MEMORIA", "3"))
+LIMITE_CACHE_MB = float(os.environ.get("DASH_LIMITE_CACHE_MB", "256"))
+
+def tamanho_mb(objeto, categorias_vistas=None):
+    # DataFrames/Series, soltos ou dentro de tuplas, listas e dicts (ex.: índice ABC).
+    # Os recortes de uma coluna Categorical (nomes vindos das dimensões) compartilham as
+    # categorias: elas contam uma vez só, não uma vez por recorte.
+    vistas = set() if categorias_vistas is None else categorias_vistas
+    if isinstance(objeto, pd.DataFrame):
+        return (objeto.index.memory_usage(deep=True) / 1e6
+                + sum(tamanho_mb(objeto.iloc[:, posicao], vistas) for posicao in range(objeto.shape[1])))
+    if isinstance(objeto, pd.Series):
+        if not isinstance(objeto.dtype, pd.CategoricalDtype):
+            return objeto.memory_usage(index=False, deep=True) / 1e6
+        categorias = objeto.cat.categories
+        tamanho = objeto.cat.codes.memory_usage(index=False)
+        if id(categorias) not in vistas:
+            vistas.add(id(categorias))
+            tamanho += categorias.memory_usage(deep=True)
+        return tamanho / 1e6
+    if isinstance(objeto, dict):
+        return sum(tamanho_mb(valor, vistas) for valor in objeto.values())
+    if isinstance(objeto, (tuple, list)):
+        return sum(tamanho_mb(valor, vistas) for valor in objeto)
+    return 0.0
+
+class CamadaDados:
+    """
+    obter(competencia) -> (df_salarios, df_tarefas) da competência, vindo da memória
+    (quentes ou LRU) ou da partição em disco. ler_particao(competencia) faz a leitura fria.
+    derivado(competencia, nome, calcular) -> calcular(partição), guardado junto da partição.
+    """
+    def __init__(self, competencias, obras, ler_particao, meses_em_memoria=MESES_EM_MEMORIA, limite_mb=LIMITE_CACHE_MB):
+        self.competencias = sorted(competencias)
+        self.obras = sorted(obras)
+        self.ler_particao = ler_particao
+        self.limite_mb = limite_mb
+        self.lru = OrderedDict()
+        self.tamanho_lru_mb = 0.0
+        self.leituras_disco = 0
+        self.pasta = None  # Pasta de partições em uso (de_pasta), liberada ao trocar de versão
+        self.leitor_pid = None  # Processo que deixou o marcador de leitor na pasta
+        self.trava = threading.Lock()
+        recentes = self.competencias[-meses_em_memoria:] if meses_em_memoria > 0 else []
+        self.quentes = {comp: ler_particao(comp) for comp in recentes}
+        self.derivados_quentes = OrderedDict()  # (competência, nome) -> (valor, tamanho)
+        self.tamanho_derivados_quentes_mb = 0.0
+
+    @classmethod
+    def de_pasta(cls, pasta, dims, tratar=None, **kwargs):
+        """
+        Camada sobre as partições do ETL (manifesto.json + um arquivo por competência e tabela).
+        """
+        with open(os.path.join(pasta, "manifesto.json"), encoding='utf-8') as f:
+            manifesto = json.load(f)
+        formato = manifesto.get('formato', 'parquet')
+        ler = pd.read_parquet if formato == 'parquet' else pd.read_pickle
+
+        def ler_particao(competencia):
+            sal = expandir_fatos(ler(caminho_particao(pasta, competencia, 'salarios', formato)), dims, SALARIOS)
+            tar = expandir_fatos(ler(caminho_particao(pasta, competencia, 'tarefas', formato)), dims, TAREFAS)
+            return tratar(sal, tar) if tratar else (sal, tar)
+
+        competencias = manifesto['competencias']
+        obras = {obra for info in competencias.values() for obra in info['obras']}
+        camada = cls(list(competencias), obras, ler_particao, **kwargs)
+        camada.pasta = pasta
+        return camada
+
+    @classmethod
+    def de_bases(cls, df_sal, df_tar):
+        # Sem partições: tudo fica em memória, separado por competência
+        sal_por_comp = dict(tuple(df_sal.groupby('Competencia', sort=False))) if not df_sal.empty else {}
+        tar_por_comp = dict(tuple(df_tar.groupby('Competencia', sort=False))) if not df_tar.empty else {}
+
+        def ler_particao(competencia):
+            return sal_por_comp[competencia], tar_por_comp.get(competencia, df_tar.iloc[:0])
+
+        obras = df_sal['Obra'].unique() if not df_sal.empty else []
+        return cls(list(sal_por_comp), obras, ler_particao, meses_em_memoria=len(sal_por_comp))
+
+    def obter(self, competencia):
+        if competencia in self.quentes:
+            return self.quentes[competencia]
+        if competencia not in self.competencias:
+            return self.vazio()
+        with self.trava:
+            if competencia in self.lru:
+                self.lru.move_to_end(competencia)
+                return self.lru[competencia]['particao']
+            self.garantir_leitor()
+            particao = self.ler_particao(competencia)
+            self.leituras_disco += 1
+            tamanho = tamanho_mb(particao)
+            self.lru[competencia] = {'particao': particao, 'tamanho': tamanho, 'derivados': {}}
+            self.tamanho_lru_mb += tamanho
+            self.respeitar_limite()
+            return particao
+
+    def derivado(self, competencia, nome, calcular):
+        """
+        Resultado de calcular(partição) guardado junto da partição da competência: fica
+        enquanto ela estiver em memória e sai do LRU com ela (o tamanho conta no limite).
+        Nas competências quentes, fica no LRU de derivados quentes, no mesmo limite.
+        """
+        particao = self.obter(competencia)
+        quente = competencia in self.quentes
+        with self.trava:
+            if quente and (competencia, nome) in self.derivados_quentes:
+                self.derivados_quentes.move_to_end((competencia, nome))
+                return self.derivados_quentes[(competencia, nome)][0]
+            entrada = None if quente else self.lru.get(competencia)
+            if entrada is not None and nome in entrada['derivados']:
+                return entrada['derivados'][nome]
+        valor = calcular(particao)
+        with self.trava:
+            if quente:
+                if (competencia, nome) not in self.derivados_quentes:
+                    tamanho = tamanho_mb(valor)
+                    self.derivados_quentes[(competencia, nome)] = (valor, tamanho)
+                    self.tamanho_derivados_quentes_mb += tamanho
+                    self.respeitar_limite(manter=(competencia, nome))
+                return valor
+            entrada = self.lru.get(competencia)
+            # Se a partição já saiu do LRU enquanto calculava, devolve sem guardar
+            if entrada is not None and nome not in entrada['derivados']:
+                tamanho = tamanho_mb(valor)
+                entrada['derivados'][nome] = valor
+                entrada['tamanho'] += tamanho
+                self.tamanho_lru_mb += tamanho
+                self.respeitar_limite(manter=competencia)
+        return valor
+
+    def respeitar_limite(self, manter=None):
+        # Chamado com a trava. Passou do limite: saem as partições frias menos usadas, depois os
+        # derivados quentes menos usados. Nunca sai o que está em uso (a última lida ou 'manter':
+        # uma competência do LRU ou a chave (competência, nome) de um derivado quente).
+        manter = manter or next(reversed(self.lru), None)
+        frias = [competencia for competencia in self.lru if competencia != manter]
+        derivados = [chave for chave in self.derivados_quentes if chave != manter]
+        while self.tamanho_usado_mb() > self.limite_mb and (frias or derivados):
+            if frias:
+                self.tamanho_lru_mb -= self.lru.pop(frias.pop(0))['tamanho']
+            else:
+                self.tamanho_derivados_quentes_mb -= self.derivados_quentes.pop(derivados.pop(0))[1]
+
+    def tamanho_usado_mb(self):
+        # O que conta no limite: partições frias (com seus derivados) + derivados das quentes
+        return self.tamanho_lru_mb + self.tamanho_derivados_quentes_mb
+
+    def garantir_leitor(self):
+        # Marca a pasta como em uso por este processo (o ETL não apaga versão com leitor vivo).
+        # Feito no primeiro uso, não ao montar: com gunicorn --preload a camada nasce no master,
+        # que nunca lê partição fria, e cada worker registra o próprio pid.
+        if self.pasta and self.leitor_pid != os.getpid():
+            registrar_leitor_particoes(self.pasta)
+            self.leitor_pid = os.getpid()
+
+    def liberar(self):
+        # Chamado quando o app troca de versão: a pasta antiga pode ser apagada pelo ETL
+        if self.pasta and self.leitor_pid == os.getpid():
+            liberar_leitor_particoes(self.pasta)
+            self.leitor_pid = None
+
+    def vazio(self):
+        # Mesmas colunas de uma partição real, sem linhas (filtro sem competência válida)
+        referencia = next(iter(self.quentes.values()), None) or self.obter(self.competencias[-1])
+        return referencia[0].iloc[:0], referencia[1].iloc[:0]
+
+    def resumo(self):
+        return (f"{len(self.competencias)} competências, {len(self.quentes)} em memória "
+                f"({tamanho_mb(self.quentes):.1f} MB), LRU {len(self.lru)} + {len(self.derivados_quentes)} derivados "
+                f"({self.tamanho_usado_mb():.1f}/{self.limite_mb:.0f} MB)")
@@ -2,6 +2,16 @@ import pandas as pd
 import os
 import re
 import glob
+import hashlib
+import json
+import shutil
+from datetime import datetime
+from importlib.util import find_spec
+
+# Partições por competência em parquet (colunar); sem pyarrow, cada partição vira um pickle.
+# Só verifica se está instalado: o pandas importa o pyarrow ao gravar/ler a partição, e o
+# dashboard importa este módulo no boot (sem pagar o import do pyarrow na partida).
+FORMATO_PARTICAO = "parquet" if find_spec("pyarrow") else "pkl"
 
 # --- CONFIGURAÇÕES ---
 DIRETORIO_ATUAL = os.getcwd()
@@ -11,6 +21,27 @@ PASTA_SAIDA = os.path.join(DIRETORIO_ATUAL, "dados_tratados")
 if not os.path.exists(PASTA_SAIDA):
     os.makedirs(PASTA_SAIDA)
 
+# --- CLASSIFICAÇÃO DE MÃO DE OBRA (compartilhada com o dashboard) ---
+TERMOS_INDIRETOS = [
+    'MESTRE', 'ENCARREGADO', 'ESTAGIARIO', 'ESTAGIÁRIO', 'ENGENHEIRO', 'TECNICO', 'TÉCNICO', 
+    'ANALISTA', 'ASSISTENTE', 'AUXILIAR', 'COORDENADOR', 'GERENTE', 'ALMOXARIFE', 
+    'ADMINISTRATIVO', 'APONTADOR', 'VIGIA', 'GUARITA'
+]
+
+ARQUIVOS_CSV = ("base_salarios_consolidada.csv", "base_tarefas_detalhada.csv")
+
+def classificar_mo(funcao):
+    if pd.isna(funcao): return 'Direto'
+    if any(termo in str(funcao).upper() for termo in TERMOS_INDIRETOS): return 'Indireto'
+    return 'Direto'
+
+def classificar_mo_serie(funcoes):
+    """
+    Versão vetorizada de classificar_mo para uma coluna inteira (mesmo resultado).
+    """
+    eh_indireto = funcoes.astype(str).str.upper().str.contains('|'.join(TERMOS_INDIRETOS), regex=True) & funcoes.notna()
+    return eh_indireto.map({True: 'Indireto', False: 'Direto'})
+
 def limpar_moeda(valor):
     """
     Transforma strings financeiras BR (ex: '1.250,00') em float python (1250.0).
@@ -86,6 +117,434 @@ def processar_servicos(row, nome_obra, competencia):
             })
     return tarefas_extraidas
 
+def preparar_salarios_dashboard(final_sal):
+    sal = final_sal.copy()
+    # Mesmo comportamento da leitura do CSV: justificativa vazia vira NaN
+    if 'Justificativa' in sal.columns:
+        sal['Justificativa'] = sal['Justificativa'].mask(sal['Justificativa'] == '')
+    sal['Tipo_MO'] = classificar_mo_serie(sal['Função']) if 'Função' in sal.columns else 'Direto'
+    return sal
+
+# LISTA DE COLUNAS EXATAS PARA LER DO EXCEL
+COLUNAS_NUMERICAS_SALARIOS = [
+    'Salario Base (R$)', 
+    'HE 50% (em tarefas)', 
+    'HE 50% (fora tarefas)',
+    'Valor das tarefas (R$)', 
+    'Saldo de tarefas', 
+    'Adicional',
+    'Salário bruto (R$)',          # Bruto antes dos descontos
+    'Salário bruto - faltas (R$)', # Valor Líquido/Pago pela empresa (KPI Principal)
+    'Valor total de prêmios (R$)'  # <--- COLUNA FALTANTE ADICIONADA
+]
+
+COLUNAS_JUSTIFICATIVA = ['Justificativa', 'Justificativas', 'Observação', 'Obs']
+COLUNAS_TAREFAS = ['Competencia', 'Obra', 'Funcionario', 'Funcao', 'Tipo', 'Descricao_Servico', 'Centro_Custo', 'Valor_Tarefa']
+
+# Marcador de publicação: gravado por último, depois de CSVs e partições. O dashboard
+# compara a versão e recarrega os dados sozinho, sem precisar reiniciar.
+NOME_VERSAO = "versao_dados.json"
+
+def processar_arquivo(arquivo):
+    """
+    Lê um relatório .xlsx e devolve (df_salarios, lista_de_tarefas) já tratados.
+    Retorna None se o arquivo não puder ser lido. Usado pelo main_etl e pelo pipeline,
+    que processa cada arquivo assim que o download termina.
+    """
+    nome_arquivo = os.path.basename(arquivo)
+    print(f"Lendo: {nome_arquivo}...")
+    
+    try:
+        obra, competencia = extrair_metadados_nome_arquivo(nome_arquivo)
+        
+        # Leitura do Excel com tentativas de engine
+        try:
+            df = pd.read_excel(arquivo, engine='openpyxl')
+            if 'Nome' not in df.columns:
+                 df = pd.read_excel(arquivo, engine='openpyxl', skiprows=1)
+        except Exception as e:
+            print(f" -> Erro leitura Excel: {e}")
+            return None
+        
+        # Normaliza colunas (remove espaços extras no nome)
+        df.columns = [c.strip() for c in df.columns]
+
+        # --- PROCESSAR SALÁRIOS ---
+        df_sal = df.copy()
+        df_sal['Obra'] = obra
+        df_sal['Competencia'] = competencia
+        
+        # Tratamento Numérico (Limpeza de Moeda)
+        for col in COLUNAS_NUMERICAS_SALARIOS:
+            if col in df_sal.columns:
+                df_sal[col] = df_sal[col].apply(limpar_moeda)
+            else:
+                # Se não achar a coluna, cria zerada para não quebrar o padrão
+                # (mas avisa no print para você saber)
+                # print(f" -> Aviso: Coluna '{col}' não encontrada em {nome_arquivo}")
+                df_sal[col] = 0.0
+
+        # Tratamento de Justificativas (Concatena possíveis colunas de obs)
+        df_sal['Justificativa_Final'] = ""
+        for col_txt in COLUNAS_JUSTIFICATIVA:
+            if col_txt in df_sal.columns:
+                df_sal['Justificativa_Final'] += df_sal[col_txt].fillna('').astype(str) + " "
+        df_sal['Justificativa_Final'] = df_sal['Justificativa_Final'].str.strip()
+
+        # Seleção Final
+        cols_export = ['Competencia', 'Obra', 'Nome', 'Função', 'Justificativa_Final'] + COLUNAS_NUMERICAS_SALARIOS
+        # Filtra apenas colunas que realmente existem no DF agora
+        cols_export = [c for c in cols_export if c in df_sal.columns]
+
+        # --- PROCESSAR TAREFAS ---
+        tarefas = []
+        if 'Descrição dos serviços' in df.columns:
+            for _, row in df.iterrows():
+                tarefas.extend(processar_servicos(row, obra, competencia))
+
+        return df_sal[cols_export], tarefas
+            
+    except Exception as e:
+        print(f" -> [ERRO] Falha no arquivo {nome_arquivo}: {e}")
+        return None
+
+# --- DIMENSÕES (OBRAS, FUNCIONÁRIOS, FUNÇÕES E SERVIÇOS COM ID INTEIRO) ---
+# Cada dimensão fica em dados_tratados/dim_<nome>.csv com id, chave normalizada (sem acento,
+# maiúscula, espaços simples) e o nome exibido. Os ids nunca mudam entre execuções: valores
+# novos recebem o próximo id. Grafias diferentes da mesma chave viram a mesma entidade.
+DIMENSOES = {
+    # dimensão: (coluna em salários, coluna em tarefas)
+    'obra': ('Obra', 'Obra'),
+    'funcionario': ('Nome', 'Funcionario'),
+    'funcao': ('Função', 'Funcao'),
+    'servico': (None, 'Descricao_Servico'),
+}
+SALARIOS, TAREFAS = 0, 1  # Posição da coluna em DIMENSOES
+
+def normalizar_texto(serie):
+    return (serie.astype('string').str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+            .str.upper().str.replace(r'\s+', ' ', regex=True).str.strip())
+
+def carregar_dimensoes(pasta=PASTA_SAIDA):
+    dims = {}
+    for dim in DIMENSOES:
+        caminho = os.path.join(pasta, f"dim_{dim}.csv")
+        if os.path.exists(caminho):
+            dims[dim] = pd.read_csv(caminho, sep=';', encoding='utf-8-sig', dtype={'id': 'int32', 'chave': str, 'nome': str}, keep_default_na=False)
+        else:
+            dims[dim] = pd.DataFrame({'id': pd.Series(dtype='int32'), 'chave': pd.Series(dtype=str), 'nome': pd.Series(dtype=str)})
+    return dims
+
+def atualizar_dimensoes(dims, final_sal, final_tar):
+    """
+    Acrescenta às dimensões as chaves ainda não vistas. O nome exibido de uma chave nova
+    é a grafia mais frequente dela no lote. A normalização roda só nos valores únicos.
+    """
+    for dim, colunas in DIMENSOES.items():
+        valores = [df[col] for df, col in zip((final_sal, final_tar), colunas) if col and col in df.columns]
+        if not valores:
+            continue
+        contagem = pd.concat(valores).dropna().value_counts()
+        grafias = pd.DataFrame({'nome': contagem.index.astype(str).str.strip(), 'qtd': contagem.values})
+        grafias['chave'] = normalizar_texto(grafias['nome']).values
+        grafias = grafias[grafias['chave'] != '']
+        grafias = grafias.sort_values(['chave', 'qtd', 'nome'], ascending=[True, False, True]).drop_duplicates('chave')
+        novas = grafias[~grafias['chave'].isin(dims[dim]['chave'])]
+        if novas.empty:
+            continue
+        proximo = int(dims[dim]['id'].max()) + 1 if len(dims[dim]) else 1
+        novas = pd.DataFrame({'id': pd.RangeIndex(proximo, proximo + len(novas)).astype('int32'),
+                              'chave': novas['chave'].values, 'nome': novas['nome'].values})
+        dims[dim] = pd.concat([dims[dim], novas], ignore_index=True)
+    return dims
+
+def aplicar_dimensoes(dims, df, posicao):
+    """
+    Acrescenta as colunas id_<dimensão> (int32; 0 = não informado) e troca o texto pelo nome
+    da dimensão, unificando grafias. posicao é SALARIOS ou TAREFAS.
+    """
+    df = df.copy()
+    for dim, colunas in DIMENSOES.items():
+        col = colunas[posicao]
+        if not col or col not in df.columns:
+            continue
+        tabela = dims[dim]
+        unicos = pd.Series(df[col].dropna().unique())
+        ids = normalizar_texto(unicos.astype(str)).map(pd.Series(tabela['id'].values, index=tabela['chave']))
+        df[f'id_{dim}'] = df[col].map(pd.Series(ids.values, index=unicos.values)).fillna(0).astype('int32')
+        df[col] = df[f'id_{dim}'].map(pd.Series(tabela['nome'].values, index=tabela['id']))
+    return df
+
+def salvar_dimensoes(dims):
+    for dim, tabela in dims.items():
+        salvar_csv_atomico(tabela, f"dim_{dim}.csv")
+
+def compactar_fatos(df, posicao):
+    # Nas partições os fatos guardam só os ids; o texto vem das dimensões (expandir_fatos)
+    return df.drop(columns=[colunas[posicao] for dim, colunas in DIMENSOES.items()
+                            if colunas[posicao] and f'id_{dim}' in df.columns])
+
+def expandir_fatos(df, dims, posicao):
+    """
+    Reconstrói as colunas de texto (Obra, Nome, Função...) a partir dos ids e das dimensões.
+    Cada coluna vira um Categorical com os nomes presentes em ordem alfabética: o texto fica
+    uma vez por entidade (não uma vez por linha) e ordenar/agrupar dá o mesmo resultado que
+    com strings. Id 0 (não informado) ou fora da dimensão vira NaN.
+    """
+    for dim, colunas in DIMENSOES.items():
+        col = colunas[posicao]
+        if col and f'id_{dim}' in df.columns and col not in df.columns:
+            nomes = pd.Series(dims[dim]['nome'].values, index=dims[dim]['id'].values)
+            presentes = nomes[nomes.index.isin(df[f'id_{dim}'].unique())].sort_values()
+            codigos = pd.Series(range(len(presentes)), index=presentes.index)
+            df[col] = pd.Categorical.from_codes(df[f'id_{dim}'].map(codigos).fillna(-1).astype('int32'),
+                                                categories=presentes.values)
+    return df
+
+# --- RECONCILIAÇÃO (CONFERÊNCIA DAS BASES CONSOLIDADAS) ---
+NOME_ANOMALIAS = "anomalias_reconciliacao.csv"
+TOLERANCIA_TAREFAS_RS = 1.00   # Diferença aceita entre soma das linhas e tarefas + prêmios (arredondamento)
+TOLERANCIA_TAREFAS_PCT = 0.01
+LIMITE_HORAS_HE_MES = 60       # Acima disso a estimativa base/220*1.5 não é plausível para um mês
+COLUNAS_ANOMALIAS = ['Competencia', 'Obra', 'Nome', 'Função', 'Regra', 'Valor_Esperado', 'Valor_Encontrado', 'Diferenca']
+
+def reconciliar(final_sal, final_tar):
+    """
+    Confere as bases consolidadas e devolve uma tabela de anomalias (uma linha por funcionário e regra):
+    - a soma das linhas extraídas por processar_servicos bate com 'Valor das tarefas (R$)' +
+      'Valor total de prêmios (R$)' (os prêmios também vêm como linhas em 'Descrição dos serviços');
+    - 'Salário bruto - faltas (R$)' fica entre 0 e 'Salário bruto (R$)';
+    - as horas de HE estimadas como valor / (base/220 * 1.5), como no dashboard, são plausíveis.
+    Tudo com groupby/merge e operações de coluna, sem laço por linha. Usa os ids das
+    dimensões (aplicar_dimensoes) para juntar tarefas e salários.
+    """
+    if final_sal.empty:
+        return pd.DataFrame(columns=COLUNAS_ANOMALIAS)
+    chave = ['Competencia', 'id_obra', 'id_funcionario']
+    sal = final_sal.groupby(chave, sort=False).agg(**{
+        'Obra': ('Obra', 'first'),
+        'Nome': ('Nome', 'first'),
+        'Função': ('Função', 'first'),
+        'Valor_Tarefas': ('Valor das tarefas (R$)', 'sum'),
+        'Premios': ('Valor total de prêmios (R$)', 'sum'),
+        'Bruto': ('Salário bruto (R$)', 'sum'),
+        'Custo_Real': ('Salário bruto - faltas (R$)', 'sum'),
+        'Base': ('Salario Base (R$)', 'sum'),
+        'HE': ('HE 50% (em tarefas)', 'sum'),
+        'HE_Fora': ('HE 50% (fora tarefas)', 'sum'),
+    }).reset_index()
+
+    # 1. Linhas da descrição x total declarado (funcionário sem nenhuma linha conta como 0).
+    # As linhas incluem os prêmios ("Prêmio > ..."), então o esperado é tarefas + prêmios.
+    soma_tarefas = final_tar.groupby(chave, sort=False)['Valor_Tarefa'].sum()
+    sal = sal.merge(soma_tarefas.rename('Soma_Linhas').reset_index(), on=chave, how='left')
+    sal['Soma_Linhas'] = sal['Soma_Linhas'].fillna(0.0)
+    esperado = sal['Valor_Tarefas'] + sal['Premios']
+    tolerancia = (esperado.abs() * TOLERANCIA_TAREFAS_PCT).clip(lower=TOLERANCIA_TAREFAS_RS)
+    tarefas = sal[(sal['Soma_Linhas'] - esperado).abs() > tolerancia]
+    tarefas = tarefas.assign(Regra='Tarefas + prêmios ≠ linhas', Valor_Esperado=esperado[tarefas.index], Valor_Encontrado=tarefas['Soma_Linhas'])
+
+    # 2. Custo real (bruto - faltas) acima do bruto ou negativo
+    custo = sal[(sal['Custo_Real'] > sal['Bruto'] + 0.01) | (sal['Custo_Real'] < 0)]
+    custo = custo.assign(Regra='Bruto - faltas fora do bruto', Valor_Esperado=custo['Bruto'], Valor_Encontrado=custo['Custo_Real'])
+
+    # 3. Horas de HE estimadas (mesma fórmula do dashboard)
+    valor_he = sal['HE'] + sal['HE_Fora']
+    horas = valor_he / (sal['Base'] / 220 * 1.5).where(sal['Base'] > 0)
+    sem_base = (valor_he > 0) & (sal['Base'] <= 0)
+    he = sal[(horas > LIMITE_HORAS_HE_MES) | sem_base]
+    he = he.assign(Regra=sem_base[he.index].map({True: 'HE sem salário base', False: 'Horas de HE implausíveis'}),
+                   Valor_Esperado=float(LIMITE_HORAS_HE_MES), Valor_Encontrado=horas[he.index].fillna(valor_he[he.index]))
+
+    anomalias = pd.concat([tarefas, custo, he], ignore_index=True)
+    anomalias['Diferenca'] = anomalias['Valor_Encontrado'] - anomalias['Valor_Esperado']
+    return anomalias[COLUNAS_ANOMALIAS].round(2)
+
+# --- CURVA ABC (ÍNDICE PRÉ-CALCULADO DOS SERVIÇOS) ---
+LIMITE_CLASSE_A = 0.80  # Serviços que formam os primeiros 80% do custo
+LIMITE_CLASSE_B = 0.95
+
+def montar_indice_abc(final_tar):
+    """
+    Curva ABC de serviços pré-calculada para cada (competência, obra, tipo), incluindo as
+    combinações obra 'TODAS' e tipo 'TODOS' (tipo é 'Produção' ou 'Outros').
+    Devolve (indice, detalhe):
+    - indice[(comp, obra, tipo)]: serviços em ordem decrescente de valor, com Pct, Pct_Acum,
+      Classe e Rank; o top-N é um head(N) e a curva completa é a tabela inteira;
+    - detalhe: valor por obra, tipo, funcionário e centro de custo, indexado por
+      (competência, id_servico) para o drill-down de um serviço.
+    """
+    if final_tar.empty or 'id_servico' not in final_tar.columns:
+        return {}, pd.DataFrame()
+    tar = final_tar.assign(Tipo=final_tar['Tipo'].where(final_tar['Tipo'] == 'Produção', 'Outros'))
+    chave = ['Competencia', 'Obra', 'Tipo']
+
+    base = tar.groupby(chave + ['id_servico'], sort=False)['Valor_Tarefa'].sum().reset_index()
+    variantes = pd.concat([base, base.assign(Obra='TODAS'), base.assign(Tipo='TODOS'), base.assign(Obra='TODAS', Tipo='TODOS')])
+    curva = variantes.groupby(chave + ['id_servico'], sort=False)['Valor_Tarefa'].sum().reset_index()
+    curva = curva.sort_values(chave + ['Valor_Tarefa'], ascending=[True, True, True, False], ignore_index=True)
+
+    grupos = curva.groupby(chave, sort=False)['Valor_Tarefa']
+    total = grupos.transform('sum').where(lambda s: s != 0)
+    curva['Pct'] = curva['Valor_Tarefa'] / total
+    acumulado = grupos.cumsum()
+    curva['Pct_Acum'] = acumulado / total
+    # Fatia acumulada antes do serviço, dividida direto do valor: Pct_Acum - Pct erra no último
+    # bit (0.95 - 0.15 < 0.80) e jogava para a classe de cima quem começa exatamente no corte
+    acumulado_antes = (acumulado - curva['Valor_Tarefa']) / total
+    curva['Classe'] = pd.Series('C', index=curva.index).mask(acumulado_antes < LIMITE_CLASSE_B, 'B').mask(acumulado_antes < LIMITE_CLASSE_A, 'A')
+    curva['Rank'] = grupos.cumcount() + 1
+    nomes_servico = tar.drop_duplicates('id_servico').set_index('id_servico')['Descricao_Servico']
+    curva['Descricao_Servico'] = curva['id_servico'].map(nomes_servico)
+    indice = {tuple(chave_grupo): grupo.reset_index(drop=True) for chave_grupo, grupo in curva.groupby(chave, sort=False)}
+
+    detalhe = tar.groupby(['Competencia', 'id_servico', 'Obra', 'Tipo', 'id_funcionario', 'Centro_Custo'], sort=False)['Valor_Tarefa'].sum().reset_index()
+    nomes_func = tar.drop_duplicates('id_funcionario').set_index('id_funcionario')[['Funcionario', 'Funcao']]
+    detalhe = detalhe.join(nomes_func, on='id_funcionario').set_index(['Competencia', 'id_servico']).sort_index()
+    return indice, detalhe
+
+def salvar_csv_atomico(df, nome):
+    caminho = os.path.join(PASTA_SAIDA, nome)
+    df.to_csv(caminho + ".tmp", sep=';', index=False, encoding='utf-8-sig', decimal=',')
+    os.replace(caminho + ".tmp", caminho)
+
+def ler_versao_dados(pasta=PASTA_SAIDA):
+    try:
+        with open(os.path.join(pasta, NOME_VERSAO), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {'versao': 0}
+
+def caminho_particao(pasta, competencia, tabela, formato=FORMATO_PARTICAO):
+    return os.path.join(pasta, f"{competencia}_{tabela}.{formato}")
+
+# Cada processo do dashboard que lê uma pasta de partições deixa um marcador leitores/<pid>
+# nela. Versões antigas só são apagadas sem leitor vivo (um worker do gunicorn que ainda
+# não recarregou continua lendo as partições frias da sua versão).
+PASTA_LEITORES = "leitores"
+
+def registrar_leitor_particoes(pasta):
+    os.makedirs(os.path.join(pasta, PASTA_LEITORES), exist_ok=True)
+    open(os.path.join(pasta, PASTA_LEITORES, str(os.getpid())), 'w').close()
+
+def liberar_leitor_particoes(pasta):
+    try:
+        os.remove(os.path.join(pasta, PASTA_LEITORES, str(os.getpid())))
+    except FileNotFoundError:
+        pass
+
+def particoes_em_uso(pasta):
+    import psutil
+    pasta_leitores = os.path.join(pasta, PASTA_LEITORES)
+    vivos = 0
+    for nome in os.listdir(pasta_leitores) if os.path.isdir(pasta_leitores) else []:
+        if nome.isdigit() and psutil.pid_exists(int(nome)):
+            vivos += 1
+        else:
+            os.remove(os.path.join(pasta_leitores, nome))  # processo que morreu sem liberar
+    return vivos > 0
+
+def limpar_particoes_antigas(versao, pasta_saida=PASTA_SAIDA):
+    """
+    Apaga as pastas particoes_v<k> com k < versao - 1 que nenhum processo está lendo.
+    Roda ao publicar e de novo quando o dashboard recarrega, então a pasta de uma versão
+    sai assim que o último leitor troca de versão.
+    """
+    for antiga in glob.glob(os.path.join(pasta_saida, "particoes_v*")):
+        numero = os.path.basename(antiga).replace("particoes_v", "")
+        if numero.isdigit() and int(numero) < versao - 1 and not particoes_em_uso(antiga):
+            shutil.rmtree(antiga, ignore_errors=True)
+
+def hash_csvs(pasta=PASTA_SAIDA):
+    # Conteúdo (não tamanho nem mtime, que um checkout/deploy muda) dos CSVs gravados junto das
+    # partições: o dashboard compara para saber se alguém editou um CSV depois do ETL
+    hashes = {}
+    for nome in ARQUIVOS_CSV:
+        caminho = os.path.join(pasta, nome)
+        if os.path.exists(caminho):
+            with open(caminho, 'rb') as f:
+                hashes[nome] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
+
+def salvar_particoes(final_sal, final_tar, versao):
+    """
+    Grava os fatos compactos (só ids) em uma partição por competência, numa pasta nova
+    particoes_v<versão>, com um manifesto.json (competências, obras e linhas de cada uma, e o
+    hash dos CSVs publicados junto).
+    O dashboard mantém as competências recentes em memória e lê as antigas sob demanda.
+    Uma pasta por versão: quem ainda está lendo a versão anterior não vê arquivos trocados.
+    """
+    nome = f"particoes_v{versao}"
+    pasta = os.path.join(PASTA_SAIDA, nome)
+    os.makedirs(pasta, exist_ok=True)
+    sal = compactar_fatos(preparar_salarios_dashboard(final_sal), SALARIOS)
+    tar = compactar_fatos(final_tar, TAREFAS)
+    tarefas_por_comp = dict(tuple(tar.groupby('Competencia', sort=False)))
+    obras_por_comp = final_sal.groupby('Competencia')['Obra'].unique()
+    manifesto = {'formato': FORMATO_PARTICAO, 'competencias': {}, 'csvs': hash_csvs()}
+    for competencia, sal_comp in sal.groupby('Competencia', sort=True):
+        tar_comp = tarefas_por_comp.get(competencia, tar.iloc[:0])
+        for tabela, df in (('salarios', sal_comp), ('tarefas', tar_comp)):
+            df = df.reset_index(drop=True)
+            if FORMATO_PARTICAO == "parquet":
+                df.to_parquet(caminho_particao(pasta, competencia, tabela), index=False)
+            else:
+                df.to_pickle(caminho_particao(pasta, competencia, tabela))
+        manifesto['competencias'][competencia] = {'salarios': len(sal_comp), 'tarefas': len(tar_comp),
+                                                  'obras': sorted(str(obra) for obra in obras_por_comp[competencia])}
+    with open(os.path.join(pasta, "manifesto.json"), 'w') as f:
+        json.dump(manifesto, f, indent=4, ensure_ascii=False)
+
+    # Mantém a versão nova, a anterior e as que algum dashboard ainda está lendo
+    limpar_particoes_antigas(versao)
+    print(f"[SUCESSO] Partições: {len(manifesto['competencias'])} competências em {nome} ({FORMATO_PARTICAO})")
+    return nome
+
+def publicar_versao(final_sal, final_tar, numero, pasta_particoes=None):
+    # Último passo da publicação: grava a versão que o dashboard observa
+    versao = {'versao': numero,
+              'publicado_em': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+              'salarios': len(final_sal), 'tarefas': len(final_tar), 'particoes': pasta_particoes}
+    caminho = os.path.join(PASTA_SAIDA, NOME_VERSAO)
+    with open(caminho + ".tmp", 'w') as f:
+        json.dump(versao, f, indent=4)
+    os.replace(caminho + ".tmp", caminho)
+    print(f"[SUCESSO] Dados publicados: versão {versao['versao']}")
+
+def consolidar_e_publicar(lista_salarios, lista_tarefas):
+    """
+    Junta os resultados de processar_arquivo e publica: CSVs, partições e por fim a versão.
+    Cada arquivo é gravado em .tmp e trocado com os.replace, então o dashboard nunca lê
+    uma base pela metade.
+    """
+    if not lista_salarios:
+        print("[ERRO] Nenhum arquivo processado. Nada foi publicado.")
+        return
+
+    final_sal = pd.concat(lista_salarios, ignore_index=True)
+    final_sal.rename(columns={'Justificativa_Final': 'Justificativa'}, inplace=True)
+    final_tar = pd.DataFrame(lista_tarefas) if lista_tarefas else pd.DataFrame(columns=COLUNAS_TAREFAS)
+
+    dims = atualizar_dimensoes(carregar_dimensoes(), final_sal, final_tar)
+    final_sal = aplicar_dimensoes(dims, final_sal, SALARIOS)
+    final_tar = aplicar_dimensoes(dims, final_tar, TAREFAS)
+    salvar_dimensoes(dims)
+    print("[SUCESSO] Dimensões: " + ", ".join(f"{dim} {len(tabela)}" for dim, tabela in dims.items()))
+
+    salvar_csv_atomico(final_sal, "base_salarios_consolidada.csv")
+    print(f"[SUCESSO] Salários Consolidados: {len(final_sal)} registros.")
+
+    if lista_tarefas:
+        salvar_csv_atomico(final_tar, "base_tarefas_detalhada.csv")
+        print(f"[SUCESSO] Tarefas Detalhadas: {len(final_tar)} registros.")
+
+    anomalias = reconciliar(final_sal, final_tar)
+    salvar_csv_atomico(anomalias, NOME_ANOMALIAS)
+    print(f"[RECONCILIAÇÃO] {len(anomalias)} anomalias: " + (", ".join(f"{regra}: {qtd}" for regra, qtd in anomalias['Regra'].value_counts().items()) or "nenhuma"))
+
+    numero = ler_versao_dados().get('versao', 0) + 1
+    publicar_versao(final_sal, final_tar, numero, salvar_particoes(final_sal, final_tar, numero))
+
 def main_etl():
     print(f">>> INICIANDO ETL (LEITURA EXATA DAS COLUNAS) <<<")
     arquivos = glob.glob(os.path.join(PASTA_RAW, "*.xlsx"))
@@ -96,93 +555,14 @@ def main_etl():
     
     lista_salarios = []
     lista_tarefas = []
-    
-    # LISTA DE COLUNAS EXATAS PARA LER DO EXCEL
-    colunas_numericas_salarios = [
-        'Salario Base (R$)', 
-        'HE 50% (em tarefas)', 
-        'HE 50% (fora tarefas)',
-        'Valor das tarefas (R$)', 
-        'Saldo de tarefas', 
-        'Adicional',
-        'Salário bruto (R$)',          # Bruto antes dos descontos
-        'Salário bruto - faltas (R$)', # Valor Líquido/Pago pela empresa (KPI Principal)
-        'Valor total de prêmios (R$)'  # <--- COLUNA FALTANTE ADICIONADA
-    ]
-    
-    colunas_justificativa = ['Justificativa', 'Justificativas', 'Observação', 'Obs']
 
     for arquivo in arquivos:
-        nome_arquivo = os.path.basename(arquivo)
-        print(f"Lendo: {nome_arquivo}...")
-        
-        try:
-            obra, competencia = extrair_metadados_nome_arquivo(nome_arquivo)
-            
-            # Leitura do Excel com tentativas de engine
-            try:
-                df = pd.read_excel(arquivo, engine='openpyxl')
-                if 'Nome' not in df.columns:
-                     df = pd.read_excel(arquivo, engine='openpyxl', skiprows=1)
-            except Exception as e:
-                print(f" -> Erro leitura Excel: {e}")
-                continue
-            
-            # Normaliza colunas (remove espaços extras no nome)
-            df.columns = [c.strip() for c in df.columns]
-
-            # --- PROCESSAR SALÁRIOS ---
-            df_sal = df.copy()
-            df_sal['Obra'] = obra
-            df_sal['Competencia'] = competencia
-            
-            # Tratamento Numérico (Limpeza de Moeda)
-            for col in colunas_numericas_salarios:
-                if col in df_sal.columns:
-                    df_sal[col] = df_sal[col].apply(limpar_moeda)
-                else:
-                    # Se não achar a coluna, cria zerada para não quebrar o padrão
-                    # (mas avisa no print para você saber)
-                    # print(f" -> Aviso: Coluna '{col}' não encontrada em {nome_arquivo}")
-                    df_sal[col] = 0.0
-
-            # Tratamento de Justificativas (Concatena possíveis colunas de obs)
-            df_sal['Justificativa_Final'] = ""
-            for col_txt in colunas_justificativa:
-                if col_txt in df_sal.columns:
-                    df_sal['Justificativa_Final'] += df_sal[col_txt].fillna('').astype(str) + " "
-            df_sal['Justificativa_Final'] = df_sal['Justificativa_Final'].str.strip()
-
-            # Seleção Final
-            cols_export = ['Competencia', 'Obra', 'Nome', 'Função', 'Justificativa_Final'] + colunas_numericas_salarios
-            # Filtra apenas colunas que realmente existem no DF agora
-            cols_export = [c for c in cols_export if c in df_sal.columns]
-            
-            lista_salarios.append(df_sal[cols_export])
-
-            # --- PROCESSAR TAREFAS ---
-            if 'Descrição dos serviços' in df.columns:
-                for _, row in df.iterrows():
-                    tarefas = processar_servicos(row, obra, competencia)
-                    lista_tarefas.extend(tarefas)
-                
-        except Exception as e:
-            print(f" -> [ERRO] Falha no arquivo {nome_arquivo}: {e}")
-
-    # Salvar Arquivos Finais
-    if lista_salarios:
-        final_sal = pd.concat(lista_salarios, ignore_index=True)
-        final_sal.rename(columns={'Justificativa_Final': 'Justificativa'}, inplace=True)
-        
-        caminho_sal = os.path.join(PASTA_SAIDA, "base_salarios_consolidada.csv")
-        final_sal.to_csv(caminho_sal, sep=';', index=False, encoding='utf-8-sig', decimal=',')
-        print(f"[SUCESSO] Salários Consolidados: {len(final_sal)} registros.")
+        resultado = processar_arquivo(arquivo)
+        if resultado is not None:
+            lista_salarios.append(resultado[0])
+            lista_tarefas.extend(resultado[1])
 
-    if lista_tarefas:
-        final_tar = pd.DataFrame(lista_tarefas)
-        caminho_tar = os.path.join(PASTA_SAIDA, "base_tarefas_detalhada.csv")
-        final_tar.to_csv(caminho_tar, sep=';', index=False, encoding='utf-8-sig', decimal=',')
-        print(f"[SUCESSO] Tarefas Detalhadas: {len(final_tar)} registros.")
+    consolidar_e_publicar(lista_salarios, lista_tarefas)
 
 if __name__ == "__main__":
-    main_etl()
\ No newline at end of file
+    main_etl()
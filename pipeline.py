@@ -0,0 +1,104 @@
+"""
+Pipeline completo num comando só: download (rpa_sucesso) -> ETL -> publicação para o dashboard.
+
+O ETL roda numa thread consumidora: cada relatório entra na fila assim que o RPA grava o
+arquivo em dados_raw e é processado enquanto o próximo download acontece. Quando o RPA
+termina, só falta juntar os resultados e publicar (CSVs + partições + versao_dados.json).
+O dashboard percebe a versão nova e recarrega as bases sozinho, sem reiniciar.
+
+Uso:
+    python pipeline.py                 # baixa, processa e publica
+    python pipeline.py --sem-download  # só reprocessa dados_raw e publica
+"""
+import argparse
+import glob
+import os
+import queue
+import threading
+import time
+
+import etl_processamento as etl
+
+FIM = None  # Sentinela: o produtor terminou
+
+def assinatura_arquivo(caminho):
+    # Um arquivo baixado de novo (mesmo nome) muda de tamanho/mtime e é processado outra vez
+    estado = os.stat(caminho)
+    return estado.st_mtime_ns, estado.st_size
+
+class ConsumidorETL(threading.Thread):
+    """
+    Consome caminhos de .xlsx da fila e guarda o resultado do etl.processar_arquivo por arquivo.
+    """
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.fila = queue.Queue()
+        self.resultados = {}  # caminho -> (assinatura, df_salarios, tarefas)
+        self.tempo_processando = 0.0
+
+    def run(self):
+        while True:
+            caminho = self.fila.get()
+            if caminho is FIM:
+                break
+            try:
+                self.processar(caminho)
+            except Exception as e:
+                print(f"[PIPELINE] Falha ao processar {os.path.basename(caminho)}: {e}")
+
+    def processar(self, caminho):
+        if not os.path.exists(caminho):
+            return
+        assinatura = assinatura_arquivo(caminho)
+        if caminho in self.resultados and self.resultados[caminho][0] == assinatura:
+            return
+        inicio = time.perf_counter()
+        resultado = etl.processar_arquivo(caminho)
+        self.tempo_processando += time.perf_counter() - inicio
+        if resultado is not None:
+            self.resultados[caminho] = (assinatura,) + resultado
+
+    def finalizar(self):
+        """
+        Espera a fila esvaziar e devolve (lista_salarios, lista_tarefas) na ordem dos arquivos,
+        só com os que ainda existem em dados_raw.
+        """
+        self.fila.put(FIM)
+        self.join()
+        lista_salarios, lista_tarefas = [], []
+        for caminho in sorted(self.resultados):
+            if os.path.exists(caminho):
+                _, df_sal, tarefas = self.resultados[caminho]
+                lista_salarios.append(df_sal)
+                lista_tarefas.extend(tarefas)
+        return lista_salarios, lista_tarefas
+
+def main():
+    parser = argparse.ArgumentParser(description="Download + ETL + publicação do dashboard.")
+    parser.add_argument('--sem-download', action='store_true', help="Não roda o RPA; só processa dados_raw e publica")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    consumidor = ConsumidorETL()
+    consumidor.start()
+
+    # O que já está em dados_raw vai sendo processado desde já; com o incremental,
+    # a maior parte desses arquivos nem é baixada de novo
+    for arquivo in sorted(glob.glob(os.path.join(etl.PASTA_RAW, "*.xlsx"))):
+        consumidor.fila.put(arquivo)
+
+    if not args.sem_download:
+        import rpa_sucesso as rpa
+        rpa.OUVINTES_DOWNLOAD.append(consumidor.fila.put)
+        rpa.main()
+    tempo_download = time.perf_counter() - inicio
+
+    lista_salarios, lista_tarefas = consumidor.finalizar()
+    etl.consolidar_e_publicar(lista_salarios, lista_tarefas)
+
+    total = time.perf_counter() - inicio
+    print(f"[PIPELINE] Total {total:.1f}s | download {tempo_download:.1f}s | ETL {consumidor.tempo_processando:.1f}s (em paralelo) "
+          f"| publicação após o download {total - tempo_download:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Site simulado do sistema de Folha de Pagamento, para testar o rpa_sucesso.py localmente.
+
+Reproduz só o que o robô usa: tela de login, menu Folha > Folha Pagamento, lista de
+obras/competências, página Consultar com o botão exportarRelatorioFolhaPagamento e o
+download do .xlsx (servindo os próprios arquivos de dados_raw, com ETag e 304 no GET
+condicional). Pode simular lentidão e pop-ups aleatórios.
+
+Uso:
+    python rpa_site_simulado.py --porta 8765 --atraso 0.5 --chance-popup 0.2
+    RPA_URL_BASE=http://localhost:8765 RPA_SESSOES=4 python rpa_sucesso.py
+"""
+import argparse
+import glob
+import os
+import random
+import re
+import secrets
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+PASTA_RAW = os.path.join(os.getcwd(), "dados_raw")
+COMPETENCIA_PADRAO = "2025/12"
+
+CONFIG = {'atraso': 0.0, 'chance_popup': 0.0}
+SESSOES = set()
+ITENS = {}  # id -> {'nome', 'competencia', 'arquivo'}
+
+def carregar_itens():
+    """
+    Monta a lista de obras a partir dos arquivos de dados_raw (um item por arquivo).
+    """
+    arquivos = sorted(glob.glob(os.path.join(PASTA_RAW, "*.xlsx")))
+    for indice, arquivo in enumerate(arquivos, start=101):
+        partes = os.path.basename(arquivo).replace('.xlsx', '').split(' - ')
+        nome = partes[-2] if len(partes) >= 2 else f"OBRA {indice}"
+        competencia = partes[-1].replace('-', '/') if re.match(r'^\d{4}-\d{2}$', partes[-1]) else COMPETENCIA_PADRAO
+        ITENS[str(indice)] = {'nome': nome, 'competencia': competencia, 'arquivo': arquivo}
+
+def pagina(titulo, corpo):
+    return f"""<!DOCTYPE html><html><head><meta charset="utf-8"><title>{titulo}</title></head>
+<body>{corpo}</body></html>""".encode('utf-8')
+
+POPUP = """
+<div class="modal" id="modalAviso" style="display:block">
+  <div class="modal-header"><span>Aviso</span><button class="close" onclick="document.getElementById('modalAviso').style.display='none'">x</button></div>
+  <div class="modal-body">Ocorreu uma instabilidade. Tente novamente.</div>
+  <div class="modal-footer"><button onclick="document.getElementById('modalAviso').style.display='none'">OK</button></div>
+</div>"""
+
+def nao_modificado(cabecalhos, etag, modificado):
+    """
+    GET condicional: If-None-Match tem prioridade sobre If-Modified-Since, como no HTTP/1.1.
+    """
+    if cabecalhos.get('If-None-Match'):
+        return etag in [valor.strip() for valor in cabecalhos['If-None-Match'].split(',')]
+    if cabecalhos.get('If-Modified-Since'):
+        try:
+            return int(modificado) <= parsedate_to_datetime(cabecalhos['If-Modified-Since']).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+class SiteSimulado(BaseHTTPRequestHandler):
+    def log_message(self, formato, *args):
+        pass
+
+    def logado(self):
+        cookies = self.headers.get('Cookie', '')
+        match = re.search(r'sessao=([0-9a-f]+)', cookies)
+        return bool(match and match.group(1) in SESSOES)
+
+    def responder(self, conteudo, status=200, tipo='text/html; charset=utf-8', extras=None):
+        self.send_response(status)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(conteudo)))
+        for chave, valor in (extras or {}).items():
+            self.send_header(chave, valor)
+        self.end_headers()
+        if self.command != 'HEAD' and status != 304:
+            self.wfile.write(conteudo)
+
+    def redirecionar(self, destino, extras=None):
+        self.send_response(302)
+        self.send_header('Location', destino)
+        for chave, valor in (extras or {}).items():
+            self.send_header(chave, valor)
+        self.end_headers()
+
+    def do_POST(self):
+        if self.path.startswith('/Acesso/Entrar'):
+            tamanho = int(self.headers.get('Content-Length', 0))
+            dados = parse_qs(self.rfile.read(tamanho).decode('utf-8'))
+            if dados.get('usuario', [''])[0] and dados.get('senha', [''])[0]:
+                token = secrets.token_hex(16)
+                SESSOES.add(token)
+                return self.redirecionar('/', {'Set-Cookie': f'sessao={token}; Path=/'})
+            return self.redirecionar('/Acesso/Entrar')
+        self.responder(b'', 404)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        if CONFIG['atraso']:
+            time.sleep(CONFIG['atraso'])
+
+        if self.path.startswith('/Acesso/Entrar'):
+            return self.responder(pagina("Entrar", """
+<form method="post" action="/Acesso/Entrar">
+  <input type="text" name="usuario"><input type="password" name="senha">
+  <button type="submit">Entrar</button>
+</form>"""))
+
+        if not self.logado():
+            return self.redirecionar('/Acesso/Entrar?ReturnUrl=%2F')
+
+        if self.path == '/':
+            return self.responder(pagina("Início", """
+<ul class="menu">
+  <li><span class="title" onclick="document.getElementById('submenu').style.display='block'">Folha</span>
+    <ul id="submenu" style="display:none"><li><a href="/FolhaPagamento"><span class="title">Folha Pagamento</span></a></li></ul>
+  </li>
+</ul>"""))
+
+        if self.path.rstrip('/') == '/FolhaPagamento':
+            linhas = ''.join(
+                f"<tr><td>{id_item}</td><td>{item['nome']}</td><td>{item['competencia']}</td>"
+                f"<td><a href=\"/FolhaPagamento/Consultar/{id_item}\"><i class=\"fa fa-eye\"></i></a></td></tr>"
+                for id_item, item in ITENS.items()
+            )
+            return self.responder(pagina("Folha Pagamento", f"<table><tr><th>Código</th><th>Obra</th><th>Competência</th><th></th></tr>{linhas}</table>"))
+
+        match = re.match(r'^/FolhaPagamento/Consultar/(\d+)', self.path)
+        if match and match.group(1) in ITENS:
+            id_item = match.group(1)
+            popup = POPUP if random.random() < CONFIG['chance_popup'] else ''
+            return self.responder(pagina("Folha de Pagamento - Consultar", f"""
+<h3>{ITENS[id_item]['nome']} - {ITENS[id_item]['competencia']}</h3>
+<a id="exportarRelatorioFolhaPagamento" class="btn" href="/FolhaPagamento/ExportarRelatorio/{id_item}">Exportar</a>
+{popup}"""))
+
+        match = re.match(r'^/FolhaPagamento/ExportarRelatorio/(\d+)', self.path)
+        if match and match.group(1) in ITENS:
+            arquivo = ITENS[match.group(1)]['arquivo']
+            with open(arquivo, 'rb') as f:
+                conteudo = f.read()
+            # ETag/Last-Modified seguem o arquivo em dados_raw: editar o arquivo simula mudança na folha
+            modificado = os.path.getmtime(arquivo)
+            validadores = {'ETag': f'"{int(modificado)}-{len(conteudo)}"', 'Last-Modified': formatdate(modificado, usegmt=True)}
+            if nao_modificado(self.headers, validadores['ETag'], modificado):
+                return self.responder(b'', 304, extras=validadores)
+            return self.responder(conteudo, tipo='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                                  extras={'Content-Disposition': 'attachment; filename="RelatorioFolhaPagamento.xlsx"', **validadores})
+
+        self.responder(pagina("Erro", "<h1>Erro 404</h1>"), 404)
+
+def main():
+    parser = argparse.ArgumentParser(description="Site simulado da Folha de Pagamento para testar o RPA.")
+    parser.add_argument('--porta', type=int, default=8765)
+    parser.add_argument('--atraso', type=float, default=0.0, help="Segundos de espera em cada GET")
+    parser.add_argument('--chance-popup', type=float, default=0.0, help="Probabilidade (0-1) de pop-up na tela Consultar")
+    args = parser.parse_args()
+
+    CONFIG['atraso'] = args.atraso
+    CONFIG['chance_popup'] = args.chance_popup
+    carregar_itens()
+    print(f"Site simulado com {len(ITENS)} itens em http://localhost:{args.porta}")
+    ThreadingHTTPServer(('127.0.0.1', args.porta), SiteSimulado).serve_forever()
+
+if __name__ == "__main__":
+    main()
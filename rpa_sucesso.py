@@ -1,35 +1,118 @@
+import argparse
 import json
 import os
 import re
-import glob
-from time import sleep
+import hashlib
+import zipfile
+import queue
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from time import sleep, perf_counter
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import TimeoutException, UnexpectedAlertPresentException, NoAlertPresentException, StaleElementReferenceException
 from webdriver_manager.chrome import ChromeDriverManager
 
+# Detecção de download por eventos do sistema de arquivos (inotify no Linux, ReadDirectoryChangesW
+# no Windows). Sem o watchdog instalado, cai para uma varredura leve da pasta da sessão.
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
 # --- CONFIGURAÇÕES E FUNÇÕES AUXILIARES (MANTENHA IGUAL AO ANTERIOR) ---
 ARQUIVO_HISTORICO = "historico_downloads.json"
 PASTA_DOWNLOAD = os.path.join(os.getcwd(), "dados_raw")
 MAX_TENTATIVAS = 3 
 
+# Endereço do sistema. Pode apontar para o site simulado local (rpa_site_simulado.py) em testes.
+URL_BASE = os.environ.get("RPA_URL_BASE", "https://ebmsucesso.codefi.com.br")
+URL_LOGIN = f"{URL_BASE}/Acesso/Entrar?ReturnUrl=%2F"
+URL_FOLHA = f"{URL_BASE}/FolhaPagamento"
+USUARIO_SITE = os.environ.get("RPA_USUARIO", "rubens.prudencini")
+SENHA_SITE = os.environ.get("RPA_SENHA", "rLSP@0711")
+
+# Modo pool: N sessões do Chrome (headless), cada uma logada e com pasta de download própria
+NUM_SESSOES = int(os.environ.get("RPA_SESSOES", "1"))
+PASTA_SESSOES = os.path.join(PASTA_DOWNLOAD, "_sessoes")
+trava_historico = threading.Lock()
+
+# Caminho rápido: baixa os relatórios direto por HTTP reaproveitando os cookies do login.
+# Itens que falharem voltam para o fluxo pelo navegador. RPA_HTTP_DIRETO=0 desliga.
+USAR_HTTP_DIRETO = os.environ.get("RPA_HTTP_DIRETO", "1") == "1"
+MAX_CONEXOES_HTTP = int(os.environ.get("RPA_CONEXOES_HTTP", "4"))
+# Modelo da URL de exportação com '{id}' (opcional). Se vazio, é descoberto no botão exportar.
+URL_EXPORTACAO = os.environ.get("RPA_URL_EXPORTACAO", "")
+
+# Sincronização incremental: por HTTP, item com arquivo íntegro vai com GET condicional (ETag/
+# Last-Modified) e o 304 evita o download. No navegador, competências fechadas já baixadas
+# (arquivo íntegro e linha da lista igual) são puladas; só as MESES_ABERTOS mais recentes são
+# sempre baixadas de novo.
+MODO_INCREMENTAL = os.environ.get("RPA_INCREMENTAL", "1") == "1"
+MESES_ABERTOS = int(os.environ.get("RPA_MESES_ABERTOS", "2"))
+
+# Fila persistente (checkpoint): estado de cada item da rodada gravado em disco a cada mudança.
+# Se a execução cair, a próxima retoma de onde parou sem reler a lista, desde que ela não
+# tenha mais de VALIDADE_LISTA_HORAS. Falhas voltam para a fila com espera exponencial.
+ARQUIVO_CHECKPOINT = "fila_rpa.json"
+VALIDADE_LISTA_HORAS = float(os.environ.get("RPA_VALIDADE_LISTA_HORAS", "12"))
+RELER_LISTA = os.environ.get("RPA_RELER_LISTA", "0") == "1"
+MAX_RODADAS_ITEM = int(os.environ.get("RPA_MAX_RODADAS_ITEM", "3"))  # cada rodada já faz MAX_TENTATIVAS
+ESPERA_RETENTATIVA_SEG = float(os.environ.get("RPA_ESPERA_RETENTATIVA", "30"))
+FORMATO_DATA = "%Y-%m-%d %H:%M:%S"
+trava_checkpoint = threading.Lock()
+
+# Log estruturado: uma linha JSON por etapa e por item em logs_rpa/rpa_<execução>.jsonl.
+# "python rpa_sucesso.py --resumo" junta todas as execuções e ranqueia as obras mais lentas.
+PASTA_LOGS = os.path.join(os.getcwd(), "logs_rpa")
+ID_EXECUCAO = datetime.now().strftime("%Y%m%d_%H%M%S")
+trava_log = threading.Lock()
+
+# Funções chamadas com o caminho de cada relatório assim que ele é gravado em dados_raw
+# (o pipeline.py usa para mandar o arquivo ao ETL enquanto o próximo download acontece)
+OUVINTES_DOWNLOAD = []
+
 if not os.path.exists(PASTA_DOWNLOAD):
     os.makedirs(PASTA_DOWNLOAD)
 
 def carregar_historico():
-    if os.path.exists(ARQUIVO_HISTORICO):
+    """
+    Histórico por chave '<id>_<competencia>'. Entradas antigas (só o horário em texto)
+    são convertidas para o formato atual: {'baixado_em', 'arquivo', 'tamanho', 'sha256', 'remoto'}.
+    """
+    if not os.path.exists(ARQUIVO_HISTORICO):
+        return {}
+    try:
         with open(ARQUIVO_HISTORICO, 'r') as f:
-            return json.load(f)
-    return {}
+            dados = json.load(f)
+    except json.JSONDecodeError as e:
+        print(f"[AVISO] Histórico ilegível ({e}). Começando do zero.")
+        return {}
+    return {chave: ({'baixado_em': valor} if isinstance(valor, str) else valor) for chave, valor in dados.items()}
+
+def salvar_json_atomico(caminho, dados):
+    # Grava em arquivo temporário e troca de uma vez: um crash no meio nunca corrompe o arquivo
+    caminho_tmp = caminho + ".tmp"
+    with open(caminho_tmp, 'w') as f:
+        json.dump(dados, f, indent=4, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(caminho_tmp, caminho)
 
 def salvar_historico(dados):
-    with open(ARQUIVO_HISTORICO, 'w') as f:
-        json.dump(dados, f, indent=4)
+    salvar_json_atomico(ARQUIVO_HISTORICO, dados)
 
 def limpar_nome_arquivo(nome):
     return re.sub(r'[\\/*?:"<>|]', "", nome)
@@ -40,241 +123,1040 @@ def extrair_detalhes(texto_linha):
         return match.group(1).strip(), match.group(2).strip(), match.group(3).strip()
     return None, None, None
 
-def obter_arquivos_xlsx():
-    return set(glob.glob(os.path.join(PASTA_DOWNLOAD, "*.xlsx")))
+def nome_arquivo_final(nome_obra, competencia):
+    comp_arquivo = competencia.replace('/', '-')
+    return limpar_nome_arquivo(f"Relatorio Folha de Pagamento - {nome_obra} - {comp_arquivo}.xlsx")
+
+def hash_arquivo(caminho):
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+def registrar_download(historico, item, caminho_arquivo=None, remoto=None):
+    """
+    Registra o item no histórico com tamanho/hash do arquivo e os metadados remotos
+    (linha da lista e, no caminho HTTP, ETag/Last-Modified/Content-Length).
+    """
+    chave_hist = f"{item['id']}_{item['competencia']}"
+    registro = {'baixado_em': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'remoto': {'linha': item.get('linha', ''), **(remoto or {})}}
+    if caminho_arquivo and os.path.exists(caminho_arquivo):
+        registro.update({'arquivo': os.path.basename(caminho_arquivo), 'tamanho': os.path.getsize(caminho_arquivo), 'sha256': hash_arquivo(caminho_arquivo)})
+    # Várias sessões gravam no mesmo histórico: serializa a escrita
+    with trava_historico:
+        anterior = historico.get(chave_hist, {})
+        if anterior.get('sha256') and anterior.get('sha256') == registro.get('sha256'):
+            print(f" -> Sem alterações desde {anterior.get('baixado_em')}.")
+        historico[chave_hist] = registro
+        salvar_historico(historico)
+    if caminho_arquivo:
+        for ouvinte in OUVINTES_DOWNLOAD:
+            ouvinte(caminho_arquivo)
+
+# --- FILA PERSISTENTE (CHECKPOINT DA RODADA) ---
+# Estados: pendente -> em_andamento -> concluido | falhou. Um item 'em_andamento' no
+# arquivo significa que a execução caiu no meio dele: na retomada ele volta a ser feito.
+def chave_item(item):
+    return f"{item['id']}_{item['competencia']}"
+
+def carregar_checkpoint():
+    if not os.path.exists(ARQUIVO_CHECKPOINT):
+        return {'lista_lida_em': None, 'itens': {}}
+    try:
+        with open(ARQUIVO_CHECKPOINT, 'r') as f:
+            return json.load(f)
+    except json.JSONDecodeError as e:
+        print(f"[AVISO] Checkpoint ilegível ({e}). Começando rodada nova.")
+        return {'lista_lida_em': None, 'itens': {}}
+
+def salvar_checkpoint(checkpoint):
+    salvar_json_atomico(ARQUIVO_CHECKPOINT, checkpoint)
+
+def pode_retentar(registro):
+    return registro['estado'] != 'concluido' and registro['tentativas'] < MAX_RODADAS_ITEM
+
+def lista_desatualizada(checkpoint):
+    """
+    A lista precisa ser lida de novo se nunca foi lida, se passou da validade,
+    se foi pedido (RPA_RELER_LISTA=1) ou se a rodada anterior já terminou.
+    """
+    if RELER_LISTA or not checkpoint.get('lista_lida_em'):
+        return True
+    idade = datetime.now() - datetime.strptime(checkpoint['lista_lida_em'], FORMATO_DATA)
+    if idade.total_seconds() > VALIDADE_LISTA_HORAS * 3600:
+        return True
+    return not any(pode_retentar(registro) for registro in checkpoint['itens'].values())
+
+def iniciar_rodada(checkpoint, itens):
+    checkpoint['lista_lida_em'] = datetime.now().strftime(FORMATO_DATA)
+    checkpoint['itens'] = {chave_item(item): {'item': item, 'estado': 'pendente', 'tentativas': 0, 'ultimo_erro': None,
+                                              'atualizado_em': checkpoint['lista_lida_em'], 'proxima_tentativa': None}
+                           for item in itens}
+    salvar_checkpoint(checkpoint)
+
+def itens_da_rodada(checkpoint):
+    # Tudo que ainda não terminou: pendentes, interrompidos no meio e falhas com rodadas sobrando
+    return [registro['item'] for registro in checkpoint['itens'].values() if pode_retentar(registro)]
+
+def marcar_item(checkpoint, item, estado, erro=None):
+    """
+    Atualiza o estado do item e grava o checkpoint. Cada início conta uma tentativa;
+    uma falha agenda a próxima com espera exponencial (ESPERA_RETENTATIVA_SEG, 2x, 4x...).
+    """
+    if checkpoint is None:
+        return
+    with trava_checkpoint:
+        registro = checkpoint['itens'].setdefault(chave_item(item), {'item': item, 'tentativas': 0, 'ultimo_erro': None, 'proxima_tentativa': None})
+        agora = datetime.now()
+        registro['estado'] = estado
+        registro['atualizado_em'] = agora.strftime(FORMATO_DATA)
+        if estado == 'em_andamento':
+            registro['tentativas'] += 1
+        elif estado == 'falhou':
+            registro['ultimo_erro'] = erro
+            espera = ESPERA_RETENTATIVA_SEG * 2 ** (registro['tentativas'] - 1)
+            registro['proxima_tentativa'] = datetime.fromtimestamp(agora.timestamp() + espera).strftime(FORMATO_DATA)
+        elif estado == 'concluido':
+            registro['proxima_tentativa'] = None
+        salvar_checkpoint(checkpoint)
+
+def segundos_ate_retentativa(checkpoint, item):
+    registro = checkpoint['itens'].get(chave_item(item), {})
+    if not registro.get('proxima_tentativa'):
+        return 0
+    proxima = datetime.strptime(registro['proxima_tentativa'], FORMATO_DATA)
+    return max(0.0, (proxima - datetime.now()).total_seconds())
+
+def resumo_checkpoint(checkpoint):
+    contagem = Counter(registro['estado'] for registro in checkpoint['itens'].values())
+    return ", ".join(f"{estado}: {qtd}" for estado, qtd in sorted(contagem.items())) or "vazia"
+
+# --- LOG ESTRUTURADO (JSON LINES) ---
+def registrar_evento(evento, item, **campos):
+    """
+    Acrescenta um evento ('etapa' ou 'item') ao log JSON desta execução.
+    """
+    linha = {'ts': datetime.now().strftime(FORMATO_DATA), 'execucao': ID_EXECUCAO, 'evento': evento,
+             'item': chave_item(item), 'obra': item['nome'], 'competencia': item['competencia'], **campos}
+    with trava_log:
+        os.makedirs(PASTA_LOGS, exist_ok=True)
+        with open(os.path.join(PASTA_LOGS, f"rpa_{ID_EXECUCAO}.jsonl"), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(linha, ensure_ascii=False) + "\n")
+
+def ler_logs(pasta=PASTA_LOGS):
+    eventos = []
+    for nome in sorted(os.listdir(pasta)) if os.path.isdir(pasta) else []:
+        if not nome.endswith('.jsonl'):
+            continue
+        with open(os.path.join(pasta, nome), encoding='utf-8') as f:
+            for linha in f:
+                try:
+                    eventos.append(json.loads(linha))
+                except json.JSONDecodeError:
+                    pass  # linha cortada por uma execução interrompida
+    return eventos
+
+COLUNAS_LOG_ITEM = ['execucao', 'item', 'obra', 'ok', 'tentativas', 'duracao', 'popups', 'refreshes', 'tamanho']
+
+def resumo_logs(top=10):
+    """
+    Comando --resumo: por obra, somando todas as execuções, quantos downloads, tempo médio
+    e máximo, retentativas, pop-ups e refreshes; e em que etapa o tempo foi gasto.
+    """
+    import pandas as pd
+
+    eventos = pd.DataFrame(ler_logs())
+    if eventos.empty:
+        print(f"Nenhum log em {PASTA_LOGS}.")
+        return
+    # Execução interrompida só tem etapas; itens do HTTP não têm popups/refreshes
+    itens = eventos[eventos['evento'] == 'item'].reindex(columns=COLUNAS_LOG_ITEM)
+    etapas = eventos[eventos['evento'] == 'etapa']
+    if itens.empty:
+        print(f"Nenhum item finalizado nos logs de {PASTA_LOGS} ({len(etapas)} etapas registradas).")
+        return
+    itens['popups'] = itens['popups'].apply(lambda popups: popups if isinstance(popups, list) else [])
+    itens['refreshes'] = pd.to_numeric(itens['refreshes']).fillna(0)
+    itens['tamanho'] = pd.to_numeric(itens['tamanho'])
+    itens['duracao'] = pd.to_numeric(itens['duracao'])
+    itens['retentativas'] = pd.to_numeric(itens['tentativas']).fillna(1) - 1
+    itens['qtd_popups'] = itens['popups'].str.len()
+
+    por_obra = itens.groupby('obra').agg(
+        execucoes=('execucao', 'nunique'), itens=('item', 'size'), falhas=('ok', lambda s: int((~s.astype(bool)).sum())),
+        seg_medio=('duracao', 'mean'), seg_max=('duracao', 'max'), retentativas=('retentativas', 'sum'),
+        popups=('qtd_popups', 'sum'), refreshes=('refreshes', 'sum'), mb_medio=('tamanho', lambda s: s.mean() / 1e6),
+    ).round(2)
+
+    print(f"=== {itens['execucao'].nunique()} execuções, {len(itens)} itens ===")
+    print(f"\n--- Obras mais lentas (seg. médio por item) ---\n{por_obra.sort_values('seg_medio', ascending=False).head(top).to_string()}")
+    print(f"\n--- Obras com mais retentativas ---\n{por_obra.sort_values(['retentativas', 'falhas'], ascending=False).head(top).to_string()}")
+    if not etapas.empty:
+        tempo_etapas = etapas.pivot_table(index='obra', columns='etapa', values='duracao', aggfunc='sum').fillna(0).round(1)
+        tempo_etapas = tempo_etapas.loc[por_obra.sort_values('seg_medio', ascending=False).head(top).index.intersection(tempo_etapas.index)]
+        print(f"\n--- Onde o tempo das obras mais lentas foi gasto (s, soma das execuções) ---\n{tempo_etapas.to_string()}")
+    seletores = itens['popups'].explode().dropna()
+    if not seletores.empty:
+        print(f"\n--- Seletores de pop-up acionados ---\n{seletores.value_counts().to_string()}")
+
+# --- CAMADA DE ESPERA (CONDIÇÕES EXPLÍCITAS NO LUGAR DE SLEEP FIXO) ---
+# Cada etapa espera uma condição real da página, com timeout próprio. Se a página já
+# está pronta, segue na hora; se estourar o tempo, levanta TimeoutException com o nome da etapa.
+TIMEOUTS = {
+    'login': 20,           # Sair da tela de login
+    'lista': 20,           # Lista de obras carregada
+    'consulta': 15,        # Tela Consultar da obra aberta
+    'pagina': 15,          # Página pronta após refresh/back
+    'popup_fechar': 3,     # Modal sumir depois do clique
+    'download_inicio': 15, # Arquivo (ou .crdownload) aparecer na pasta
+}
+INTERVALO_CHECAGEM = 0.1
+XPATH_LINKS_LISTA = "//a[contains(@href, '/FolhaPagamento/Consultar/')]"
+
+class Cronometro:
+    """
+    Acumula a duração de cada etapa de um item (navegação, pop-ups, exportação, download...).
+    Com um item, também grava cada etapa e o resultado final no log estruturado.
+    """
+    def __init__(self, item=None):
+        self.item = item
+        self.etapas = {}
+        self.tentativa = 1
+        self.popups = []  # nome do seletor de cada pop-up fechado
+        self.refreshes = 0
+        self.inicio = perf_counter()
+
+    @contextmanager
+    def etapa(self, nome):
+        inicio = perf_counter()
+        erro = None
+        try:
+            yield
+        except Exception as e:
+            erro = type(e).__name__
+            raise
+        finally:
+            duracao = perf_counter() - inicio
+            self.etapas[nome] = self.etapas.get(nome, 0.0) + duracao
+            if self.item is not None:
+                registrar_evento('etapa', self.item, etapa=nome, tentativa=self.tentativa, duracao=round(duracao, 3), erro=erro)
+
+    def popup(self, nome):
+        # Repassa o retorno de fechar_popup_se_existir, anotando qual seletor disparou
+        if nome:
+            self.popups.append(nome)
+        return nome
+
+    def resumo(self):
+        return " | ".join(f"{nome} {tempo:.1f}s" for nome, tempo in self.etapas.items())
+
+    def finalizar(self, ok, caminho='navegador', arquivo=None, erro=None):
+        print(f" -> Tempos: {self.resumo()}")
+        if self.item is not None:
+            registrar_evento('item', self.item, ok=ok, caminho=caminho, tentativas=self.tentativa,
+                             duracao=round(perf_counter() - self.inicio, 3),
+                             etapas={nome: round(tempo, 3) for nome, tempo in self.etapas.items()},
+                             popups=self.popups, refreshes=self.refreshes,
+                             tamanho=os.path.getsize(arquivo) if arquivo and os.path.exists(arquivo) else None, erro=erro)
+
+def esperar(driver, condicao, etapa, timeout=None):
+    timeout = timeout or TIMEOUTS[etapa]
+    try:
+        try:
+            return WebDriverWait(driver, timeout, poll_frequency=INTERVALO_CHECAGEM).until(condicao)
+        except UnexpectedAlertPresentException as e:
+            # O driver já aceitou o alert ('accept and notify'): conta e espera de novo
+            registrar_alerta_nativo(e)
+            return WebDriverWait(driver, timeout, poll_frequency=INTERVALO_CHECAGEM).until(condicao)
+    except TimeoutException:
+        raise TimeoutException(f"Timeout na etapa '{etapa}' ({timeout}s)")
+
+def pagina_pronta(driver):
+    """
+    Documento carregado e sem requisições AJAX pendentes (jQuery.active == 0, quando a página usa jQuery).
+    """
+    return driver.execute_script(
+        "return document.readyState === 'complete' && (!window.jQuery || window.jQuery.active === 0);"
+    )
+
+def esperar_pagina_pronta(driver, etapa='pagina'):
+    esperar(driver, pagina_pronta, etapa)
+
+def esperar_lista(driver):
+    esperar(driver, EC.presence_of_element_located((By.XPATH, XPATH_LINKS_LISTA)), 'lista')
+    esperar_pagina_pronta(driver, 'lista')
+
+# --- MOTOR DE POP-UPS ---
+# Registro declarativo dos botões que fecham modais/avisos, em ordem de prioridade.
+# Para tratar um pop-up novo, basta acrescentar uma entrada aqui.
+SELETORES_POPUP = [
+    # Botões com texto explícito
+    ('botao_OK', "//button[contains(text(), 'OK')]"),
+    ('botao_Ok', "//button[contains(text(), 'Ok')]"),
+    ('botao_ok', "//button[contains(text(), 'ok')]"),
+    ('botao_confirmar', "//button[contains(text(), 'Confirmar')]"),
+    ('botao_entendi', "//button[contains(text(), 'Entendi')]"),
+    ('botao_fechar', "//button[contains(text(), 'Fechar')]"),
+    ('botao_sim', "//button[contains(text(), 'Sim')]"),
+
+    # Links estilizados como botões (comum em Bootstrap/Metronic)
+    ('link_btn_ok', "//a[contains(@class, 'btn') and contains(text(), 'OK')]"),
+    ('link_btn_confirmar', "//a[contains(@class, 'btn') and contains(text(), 'Confirmar')]"),
+
+    # Botões pelo ID ou Classe comuns
+    ('id_btnOk', "//*[@id='btnOk']"),
+    ('id_btnConfirmar', "//*[@id='btnConfirmar']"),
+    ('sweetalert_confirm', "//button[contains(@class, 'confirm')]"),
+    ('sweetalert_button', "//button[contains(@class, 'swal-button')]"),
+
+    # Botão de fechar (X) no topo de modais
+    ('modal_close', "//button[@class='close']"),
+    ('aria_close', "//button[@aria-label='Close']"),
+    ('modal_header_botao', "//div[@class='modal-header']//button"),
+
+    # Botão genérico no rodapé do modal (último recurso)
+    ('modal_footer_botao', "//div[contains(@class, 'modal-footer')]//button[1]"),
+]
+
+# Avalia todos os seletores dentro do navegador e clica no primeiro botão visível e habilitado.
+# Uma única chamada ao WebDriver, tenha pop-up ou não.
+SCRIPT_POPUP = """
+var xpaths = arguments[0];
+function visivel(el) {
+    if (!(el.offsetWidth || el.offsetHeight || el.getClientRects().length)) return false;
+    var estilo = window.getComputedStyle(el);
+    return estilo.visibility !== 'hidden' && estilo.display !== 'none';
+}
+for (var i = 0; i < xpaths.length; i++) {
+    var achados = document.evaluate(xpaths[i], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    for (var j = 0; j < achados.snapshotLength; j++) {
+        var el = achados.snapshotItem(j);
+        if (visivel(el) && !el.disabled) { el.click(); return [i, el]; }
+    }
+}
+return null;
+"""
+
+ESTATISTICAS_POPUP = Counter()  # nome do seletor -> quantas vezes fechou um pop-up
+trava_estatisticas = threading.Lock()
+
+def contar_popup(nome):
+    with trava_estatisticas:
+        ESTATISTICAS_POPUP[nome] += 1
+
+def resumo_popups():
+    if not ESTATISTICAS_POPUP:
+        return "nenhum pop-up"
+    return ", ".join(f"{nome}: {qtd}" for nome, qtd in ESTATISTICAS_POPUP.most_common())
+
+def registrar_alerta_nativo(erro):
+    print(f" -> [ALERT NATIVO] Aceito pelo driver. Texto: {erro.alert_text}")
+    contar_popup('alerta_nativo')
+    return 'alerta_nativo'
 
 def fechar_popup_se_existir(driver):
     """
     Versão Turbo: Tenta fechar qualquer tipo de modal, alerta ou aviso.
-    Retorna True se encontrou e fechou algo.
+    Retorna o nome do seletor (ou 'alerta_nativo') se encontrou e fechou algo, senão None.
     """
     try:
-        # Lista expandida de seletores para pegar qualquer variação de botão de fechar
-        xpaths_botoes = [
-            # Botões com texto explícito
-            "//button[contains(text(), 'OK')]",
-            "//button[contains(text(), 'Ok')]",
-            "//button[contains(text(), 'ok')]",
-            "//button[contains(text(), 'Confirmar')]",
-            "//button[contains(text(), 'Entendi')]",
-            "//button[contains(text(), 'Fechar')]",
-            "//button[contains(text(), 'Sim')]",
-            
-            # Links estilizados como botões (comum em Bootstrap/Metronic)
-            "//a[contains(@class, 'btn') and contains(text(), 'OK')]",
-            "//a[contains(@class, 'btn') and contains(text(), 'Confirmar')]",
-            
-            # Botões pelo ID ou Classe comuns
-            "//*[@id='btnOk']",
-            "//*[@id='btnConfirmar']",
-            "//button[contains(@class, 'confirm')]", # SweetAlert
-            "//button[contains(@class, 'swal-button')]", # SweetAlert moderno
-            
-            # Botão de fechar (X) no topo de modais
-            "//button[@class='close']",
-            "//button[@aria-label='Close']",
-            "//div[@class='modal-header']//button",
-            
-            # Botão genérico no rodapé do modal (último recurso)
-            "//div[contains(@class, 'modal-footer')]//button[1]" 
-        ]
-
-        for xpath in xpaths_botoes:
-            # Procura elementos visíveis
-            elementos = driver.find_elements(By.XPATH, xpath)
-            for btn in elementos:
-                if btn.is_displayed() and btn.is_enabled():
-                    print(f" -> [POP-UP DETECTADO] Clicando em: {xpath}")
-                    # Tenta clique JS (mais forte)
-                    driver.execute_script("arguments[0].click();", btn)
-                    sleep(2) # Espera o modal sumir
-                    return True
-        
-        # Tenta fechar ALERT nativo do navegador (aquelas caixas cinzas do topo)
+        achado = driver.execute_script(SCRIPT_POPUP, [xpath for _, xpath in SELETORES_POPUP])
+    except UnexpectedAlertPresentException as e:
+        # ALERT nativo do navegador (aquelas caixas cinzas do topo) bloqueia o script.
+        # O driver sobe com 'accept and notify': o alert já foi aceito e a sessão segue livre.
+        # Se ainda estiver aberto (outra configuração do driver), aceita aqui.
         try:
-            alert = driver.switch_to.alert
-            print(f" -> [ALERT NATIVO] Texto: {alert.text}")
-            alert.accept()
-            sleep(1)
-            return True
-        except:
+            driver.switch_to.alert.accept()
+        except NoAlertPresentException:
             pass
-
+        return registrar_alerta_nativo(e)
     except Exception as e:
         print(f" -> Erro ao tentar fechar popup: {e}")
-        pass
-    
-    return False
+        return None
 
-def esperar_novo_arquivo_e_renomear(arquivos_antes, nome_obra, competencia):
-    print(" -> Aguardando novo arquivo...")
-    tempo_limite = 60
-    tempo_decorrido = 0
-    
-    while tempo_decorrido < tempo_limite:
-        arquivos_agora = obter_arquivos_xlsx()
-        novos_arquivos = arquivos_agora - arquivos_antes
-        
-        if novos_arquivos:
-            arquivo_novo = list(novos_arquivos)[0]
-            if not arquivo_novo.endswith('.crdownload'):
+    if not achado:
+        return None
+    indice, btn = achado
+    nome, xpath = SELETORES_POPUP[indice]
+    print(f" -> [POP-UP DETECTADO] Clicou em: {nome} ({xpath})")
+    contar_popup(nome)
+    # Espera o modal sumir (ou a página trocar) em vez de um tempo fixo
+    try: esperar(driver, EC.invisibility_of_element(btn), 'popup_fechar')
+    except (TimeoutException, StaleElementReferenceException): pass
+    return nome
+
+def xlsx_completo(caminho):
+    """
+    O .xlsx é um zip: se o diretório central (gravado no fim) abre e tem o [Content_Types].xml,
+    o arquivo terminou de ser escrito.
+    """
+    try:
+        with zipfile.ZipFile(caminho) as arquivo_zip:
+            return '[Content_Types].xml' in arquivo_zip.namelist()
+    except (zipfile.BadZipFile, OSError):
+        return False
+
+class DetectorDownload(FileSystemEventHandler):
+    """
+    Observa a pasta de download de UMA sessão (que só contém downloads em andamento).
+    Deve ser aberto antes do clique em exportar para não perder o evento:
+
+        with DetectorDownload(pasta) as detector:
+            clicar()
+            detector.esperar_inicio() and esperar_novo_arquivo_e_renomear(detector, ...)
+
+    Com watchdog, o .xlsx é entregue no instante em que o Chrome renomeia o .crdownload.
+    Sem watchdog, a pasta é varrida a cada INTERVALO_CHECAGEM.
+    """
+    def __init__(self, pasta):
+        self.pasta = pasta
+        self.vistos = set(os.listdir(pasta))
+        self.iniciou = threading.Event()
+        self.candidatos = queue.Queue()
+        self.observador = None
+
+    def __enter__(self):
+        if Observer is not None:
+            self.observador = Observer()
+            self.observador.schedule(self, self.pasta, recursive=False)
+            self.observador.start()
+        return self
+
+    def __exit__(self, *args):
+        if self.observador is not None:
+            self.observador.stop()
+            self.observador.join()
+
+    def _novo_caminho(self, caminho):
+        self.iniciou.set()
+        if caminho.lower().endswith('.xlsx'):
+            self.candidatos.put(caminho)
+
+    # Eventos do watchdog: criação direta do .xlsx ou o rename final do download parcial
+    def on_created(self, evento):
+        if not evento.is_directory: self._novo_caminho(evento.src_path)
+
+    def on_moved(self, evento):
+        if not evento.is_directory: self._novo_caminho(evento.dest_path)
+
+    def _varrer(self):
+        for entrada in os.scandir(self.pasta):
+            if entrada.name not in self.vistos:
+                self.vistos.add(entrada.name)
+                self._novo_caminho(entrada.path)
+
+    def esperar_inicio(self, timeout=None):
+        """
+        True assim que qualquer arquivo novo (inclusive .crdownload) aparece na pasta.
+        """
+        limite = perf_counter() + (timeout or TIMEOUTS['download_inicio'])
+        while not self.iniciou.is_set() and perf_counter() < limite:
+            if self.observador is None: self._varrer()
+            self.iniciou.wait(INTERVALO_CHECAGEM)
+        return self.iniciou.is_set()
+
+    def esperar_arquivo(self, timeout):
+        """
+        Devolve o caminho do primeiro .xlsx novo e completo, ou None no timeout.
+        """
+        limite = perf_counter() + timeout
+        incompletos = {}  # caminho -> tamanho na última conferência
+        while perf_counter() < limite:
+            if self.observador is None: self._varrer()
+            try:
+                caminho = self.candidatos.get(timeout=INTERVALO_CHECAGEM)
+                if xlsx_completo(caminho):
+                    return caminho
+                if os.path.exists(caminho): incompletos[caminho] = os.path.getsize(caminho)
+                continue
+            except queue.Empty:
+                pass
+            # Ainda sendo escritos: conferidos a cada INTERVALO_CHECAGEM (a espera do get acima),
+            # e o zip só é reaberto quando o tamanho parou de mudar
+            for caminho, tamanho_anterior in list(incompletos.items()):
                 try:
-                    if os.path.getsize(arquivo_novo) > 0:
-                        sleep(1) 
-                        comp_arquivo = competencia.replace('/', '-')
-                        novo_nome = f"Relatorio Folha de Pagamento - {nome_obra} - {comp_arquivo}.xlsx"
-                        novo_nome = limpar_nome_arquivo(novo_nome)
-                        caminho_final = os.path.join(PASTA_DOWNLOAD, novo_nome)
-                        
-                        if os.path.exists(caminho_final):
-                            try: os.remove(caminho_final)
-                            except: pass
-                        
-                        os.rename(arquivo_novo, caminho_final)
-                        print(f" -> SUCESSO: {novo_nome}")
-                        return True
-                except:
-                    pass
-        sleep(1)
-        tempo_decorrido += 1
-    return False
+                    tamanho = os.path.getsize(caminho)
+                except OSError:
+                    del incompletos[caminho]  # sumiu
+                    continue
+                if tamanho == tamanho_anterior and xlsx_completo(caminho):
+                    return caminho
+                incompletos[caminho] = tamanho
+        return None
 
-# --- MAIN ATUALIZADO ---
-def main():
+def esperar_novo_arquivo_e_renomear(detector, nome_obra, competencia, tempo_limite=60):
+    """
+    Espera o download terminar na pasta da sessão e move para PASTA_DOWNLOAD com o nome padrão.
+    Cada sessão baixa na própria pasta, então um arquivo novo nunca é de outra obra.
+    Retorna o caminho final do arquivo, ou False se nada chegou no tempo limite.
+    """
+    print(" -> Aguardando novo arquivo...")
+    arquivo_novo = detector.esperar_arquivo(tempo_limite)
+    if not arquivo_novo:
+        return False
+    novo_nome = nome_arquivo_final(nome_obra, competencia)
+    caminho_final = os.path.join(PASTA_DOWNLOAD, novo_nome)
+    os.replace(arquivo_novo, caminho_final)
+    print(f" -> SUCESSO: {novo_nome}")
+    return caminho_final
+
+# --- ETAPAS DO FLUXO (USADAS PELO MODO SEQUENCIAL E PELO POOL) ---
+def pasta_da_sessao(indice):
+    """
+    Pasta de download exclusiva da sessão. Só guarda downloads em andamento (o arquivo
+    pronto vai para dados_raw), então detectar um download novo não depende do tamanho de dados_raw.
+    """
+    pasta = os.path.join(PASTA_SESSOES, f"sessao_{indice}")
+    os.makedirs(pasta, exist_ok=True)
+    return pasta
+
+def criar_driver(pasta_download, headless=False):
     options = Options()
     prefs = {
-        "download.default_directory": PASTA_DOWNLOAD,
+        "download.default_directory": pasta_download,
         "download.prompt_for_download": False,
         "download.directory_upgrade": True,
         "safebrowsing.enabled": True
     }
     options.add_experimental_option("prefs", prefs)
+    # Alert nativo inesperado é aceito pelo próprio driver, que avisa com UnexpectedAlertPresentException
+    # uma vez (o padrão do chromedriver é dispensar). Com 'ignore' o alert travaria a sessão.
+    options.unhandled_prompt_behavior = 'accept and notify'
+    # Log de rede do Chrome: é nele que descobrir_url_exportacao acha a requisição do botão exportar
+    options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    if headless:
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1920,1080")
     
     service = Service(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=options)
+    return webdriver.Chrome(service=service, options=options)
+
+def fazer_login(driver, wait):
+    driver.get(URL_LOGIN)
+    wait.until(EC.element_to_be_clickable((By.XPATH, "//input[@type='text']"))).send_keys(USUARIO_SITE)
+    driver.find_element(By.XPATH, "//input[@type='password']").send_keys(SENHA_SITE)
+    driver.find_element(By.XPATH, "//button[contains(., 'Entrar')]").click()
+    esperar(driver, lambda d: "/Acesso/Entrar" not in d.current_url, 'login')
+    esperar_pagina_pronta(driver, 'login')
+
+def abrir_menu_folha(driver, wait):
+    print("Acessando Menu Folha...")
+    wait.until(EC.element_to_be_clickable((By.XPATH, "//span[contains(@class, 'title') and normalize-space(text())='Folha']"))).click()
+    wait.until(EC.element_to_be_clickable((By.XPATH, "//span[contains(@class, 'title') and contains(text(), 'Folha Pagamento')]"))).click()
+    esperar_lista(driver)
+
+def ler_itens_para_processar(driver):
+    print("Lendo lista...")
+    elementos_lista = driver.find_elements(By.XPATH, "//tr | //div[contains(@class, 'list')]//div[contains(@class, 'item')]")
+    
+    itens_para_processar = []
+    for elem in elementos_lista:
+        texto = elem.text.strip()
+        if not texto: continue
+        id_obra, nome_obra, competencia = extrair_detalhes(texto)
+        if competencia and competencia >= '2025/12':
+            itens_para_processar.append({'id': id_obra, 'nome': nome_obra, 'competencia': competencia, 'linha': texto})
+    return itens_para_processar
+
+def processar_item(driver, wait, item, historico, pasta_download, checkpoint=None):
+    """
+    Baixa o relatório de um item (obra + competência) com até MAX_TENTATIVAS.
+    Retorna True se baixou ou se não havia dados para exportar.
+    Com checkpoint, o estado do item (e o último erro) fica gravado na fila persistente.
+    """
+    print(f"--- Processando: {item['nome']} ({item['competencia']}) ---")
+    cronometro = Cronometro(item)
+    marcar_item(checkpoint, item, 'em_andamento')
+    ultimo_erro = None
+    
+    for tentativa in range(1, MAX_TENTATIVAS + 1):
+        cronometro.tentativa = tentativa
+        try:
+            with cronometro.etapa('popup'):
+                cronometro.popup(fechar_popup_se_existir(driver))
+
+            xpath_link = f"//a[contains(@href, '/FolhaPagamento/Consultar/{item['id']}')]"
+            
+            with cronometro.etapa('navegacao'):
+                try:
+                    link_obra = wait.until(EC.presence_of_element_located((By.XPATH, xpath_link)))
+                except TimeoutException:
+                    print(" -> Link sumiu. Recarregando lista...")
+                    driver.get(URL_FOLHA)
+                    esperar_lista(driver)
+                    link_obra = driver.find_element(By.XPATH, xpath_link)
+
+                driver.execute_script("arguments[0].click();", link_obra)
+                esperar(driver, EC.url_contains(f"/FolhaPagamento/Consultar/{item['id']}"), 'consulta')
+                esperar_pagina_pronta(driver, 'consulta')
+
+            # --- AQUI ESTÁ A CORREÇÃO DO BUG DO SISTEMA ---
+            # Verifica se apareceu pop-up logo ao entrar
+            with cronometro.etapa('popup'):
+                popup_na_entrada = cronometro.popup(fechar_popup_se_existir(driver))
+            if popup_na_entrada:
+                print(" -> [BUG DETECTADO] Pop-up encontrado. Aplicando Refresh (F5)...")
+                with cronometro.etapa('refresh'):
+                    cronometro.refreshes += 1
+                    driver.refresh()
+                    esperar_pagina_pronta(driver) # Espera recarregar a página
+                # Verifica se o pop-up voltou após o refresh (as vezes volta)
+                with cronometro.etapa('popup'):
+                    cronometro.popup(fechar_popup_se_existir(driver))
+
+            # Verifica erro crítico
+            if "Erro" in driver.title:
+                raise Exception("Tela de erro crítico.")
+
+            # Tenta Exportar
+            try:
+                with cronometro.etapa('exportar'):
+                    btn_exportar = WebDriverWait(driver, 8, poll_frequency=INTERVALO_CHECAGEM).until(EC.presence_of_element_located((By.ID, "exportarRelatorioFolhaPagamento")))
+            except TimeoutException:
+                print(" -> [AVISO] Sem dados para exportar.")
+                driver.back()
+                esperar_lista(driver)
+                cronometro.finalizar(True)
+                marcar_item(checkpoint, item, 'concluido')
+                return True
+
+            with cronometro.etapa('popup'):
+                cronometro.popup(fechar_popup_se_existir(driver)) # Check final antes do clique
+            
+            with cronometro.etapa('download'), DetectorDownload(pasta_download) as detector:
+                driver.execute_script("arguments[0].click();", btn_exportar)
+                caminho_baixado = detector.esperar_inicio() and \
+                    esperar_novo_arquivo_e_renomear(detector, item['nome'], item['competencia'])
+
+            if caminho_baixado:
+                registrar_download(historico, item, caminho_baixado)
+                with cronometro.etapa('navegacao'):
+                    driver.back()
+                    esperar_lista(driver)
+                cronometro.finalizar(True, arquivo=caminho_baixado)
+                marcar_item(checkpoint, item, 'concluido')
+                return True
+
+            # Se não baixou, verifica se apareceu pop-up AO CLICAR
+            if cronometro.popup(fechar_popup_se_existir(driver)):
+                print(" -> Erro apareceu ao tentar baixar. Tentando refresh...")
+                with cronometro.etapa('refresh'):
+                    cronometro.refreshes += 1
+                    driver.refresh()
+                    esperar_pagina_pronta(driver)
+                # Lança erro para cair no 'except' e tentar de novo no loop de tentativa
+                raise Exception("Pop-up ao baixar. Necessário retry.")
+            raise Exception("Download não iniciou.")
+
+        except Exception as e:
+            ultimo_erro = str(e)[:300]
+            if isinstance(e, UnexpectedAlertPresentException):
+                cronometro.popup(registrar_alerta_nativo(e))
+            print(f" -> Tentativa {tentativa} falhou: {str(e)[:100]}...") # Log curto
+            with cronometro.etapa('recuperacao'):
+                try:
+                    if "FolhaPagamento" not in driver.current_url:
+                        driver.get(URL_FOLHA)
+                        esperar_lista(driver)
+                    else:
+                        cronometro.refreshes += 1
+                        driver.refresh()
+                        esperar_pagina_pronta(driver)
+                except TimeoutException as erro_espera:
+                    print(f" -> {erro_espera.msg}")
+                except UnexpectedAlertPresentException as alerta:
+                    # Alert no meio da recuperação: o driver já aceitou, a próxima tentativa segue
+                    cronometro.popup(registrar_alerta_nativo(alerta))
+    
+    cronometro.finalizar(False, erro=ultimo_erro)
+    print(f" [FALHA] Ignorando {item['nome']} após erros.")
+    marcar_item(checkpoint, item, 'falhou', ultimo_erro)
+    return False
+
+# --- CAMINHO RÁPIDO: EXPORTAÇÃO DIRETA VIA HTTP ---
+TIPOS_XLSX = ('spreadsheetml', 'ms-excel')
+
+def requisicao_exportacao_do_log(entradas):
+    """
+    Procura no log de performance do Chrome (driver.get_log('performance')) a requisição que
+    devolveu o relatório: resposta com tipo de planilha ou Content-Disposition de anexo, ou
+    uma URL que virou download. Devolve (método, url) ou None.
+    """
+    requisicoes = {}  # requestId -> (método, url)
+    exportacoes, downloads = [], set()
+    for entrada in entradas:
+        try:
+            mensagem = json.loads(entrada['message'])['message']
+        except (KeyError, TypeError, ValueError):
+            continue
+        metodo, params = mensagem.get('method'), mensagem.get('params', {})
+        if metodo == 'Network.requestWillBeSent':
+            requisicao = params.get('request', {})
+            requisicoes[params.get('requestId')] = (requisicao.get('method', 'GET'), requisicao.get('url', ''))
+        elif metodo == 'Network.responseReceived':
+            resposta = params.get('response', {})
+            cabecalhos = {chave.lower(): valor for chave, valor in resposta.get('headers', {}).items()}
+            tipo = (resposta.get('mimeType') or cabecalhos.get('content-type', '')).lower()
+            if any(parte in tipo for parte in TIPOS_XLSX) or 'attachment' in cabecalhos.get('content-disposition', '').lower():
+                exportacoes.append(params.get('requestId'))
+        elif metodo in ('Page.downloadWillBegin', 'Browser.downloadWillBegin'):
+            downloads.add(params.get('url'))
+    for id_requisicao in exportacoes:
+        if id_requisicao in requisicoes:
+            return requisicoes[id_requisicao]
+    return next(((metodo, url) for metodo, url in requisicoes.values() if url in downloads), None)
+
+def modelo_da_url(url, item):
+    # Troca o código da obra por '{id}': só como segmento do caminho ou valor de parâmetro
+    return re.sub(rf"(?<=[/=]){re.escape(item['id'])}(?=$|[/?&#])", "{id}", url or "")
+
+def descobrir_url_exportacao(driver, item, pasta_download):
+    """
+    Abre a tela Consultar de um item no navegador e descobre para onde o botão exportar aponta.
+    Primeiro pelos atributos (href, data-url, formaction ou action do form); se o botão só
+    exporta por JavaScript, clica nele e lê a requisição no log de rede do Chrome (o arquivo
+    baixado nessa descoberta é descartado). Devolve um modelo com '{id}' no lugar do código
+    da obra; levanta RuntimeError com o motivo se a exportação não puder ser refeita por GET.
+    """
+    if URL_EXPORTACAO:
+        return URL_EXPORTACAO
+    driver.get(f"{URL_FOLHA}/Consultar/{item['id']}")
+    esperar_pagina_pronta(driver, 'consulta')
+    fechar_popup_se_existir(driver)
+    try:
+        btn = WebDriverWait(driver, 8, poll_frequency=INTERVALO_CHECAGEM).until(EC.presence_of_element_located((By.ID, "exportarRelatorioFolhaPagamento")))
+    except TimeoutException:
+        raise RuntimeError(f"botão exportar não apareceu na consulta de {item['nome']} ({item['competencia']})")
+    url = driver.execute_script("""
+        var b = arguments[0];
+        var url = b.href || b.getAttribute('data-url') || b.getAttribute('formaction') || (b.form && b.form.action) || '';
+        return url ? new URL(url, document.baseURI).href : '';
+    """, btn)
+    modelo = modelo_da_url(url, item)
+    if "{id}" in modelo:
+        return modelo
+
+    driver.get_log('performance')  # descarta o que a navegação até aqui gerou
+    with DetectorDownload(pasta_download) as detector:
+        driver.execute_script("arguments[0].click();", btn)
+        baixado = detector.esperar_inicio() and detector.esperar_arquivo(60)
+        requisicao = requisicao_exportacao_do_log(driver.get_log('performance'))
+    if baixado:
+        os.remove(baixado)
+    if requisicao is None:
+        raise RuntimeError("nenhuma requisição de .xlsx no log de rede ao clicar em exportar")
+    metodo, url = requisicao
+    if metodo.upper() != 'GET':
+        raise RuntimeError(f"a exportação é um {metodo} ({url}); só GET pode ser refeito direto")
+    modelo = modelo_da_url(url, item)
+    if "{id}" not in modelo:
+        raise RuntimeError(f"o código {item['id']} não aparece na URL de exportação ({url})")
+    return modelo
+
+def criar_sessao_http(driver):
+    """
+    requests.Session com os cookies e o User-Agent do navegador logado, pool de conexões
+    do tamanho da concorrência e retry com backoff para erros 5xx/conexão.
+    """
+    sessao = requests.Session()
+    for cookie in driver.get_cookies():
+        sessao.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'), path=cookie.get('path', '/'))
+    sessao.headers['User-Agent'] = driver.execute_script("return navigator.userAgent;")
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504], allowed_methods=["GET"])
+    adaptador = HTTPAdapter(pool_connections=MAX_CONEXOES_HTTP, pool_maxsize=MAX_CONEXOES_HTTP, max_retries=retry)
+    sessao.mount("http://", adaptador)
+    sessao.mount("https://", adaptador)
+    return sessao
+
+def metadados_remotos(resposta):
+    # O que o servidor informa sobre o arquivo; usado para detectar mudança sem baixar de novo
+    return {campo: resposta.headers[campo] for campo in ('ETag', 'Last-Modified', 'Content-Length') if resposta.headers.get(campo)}
+
+def cabecalhos_condicionais(registro, item):
+    """
+    If-None-Match/If-Modified-Since do último download, se o arquivo local ainda está íntegro
+    e a linha da lista não mudou. Com eles o site responde 304 sem mandar o arquivo de novo.
+    """
+    if not MODO_INCREMENTAL or not registro or not arquivo_local_integro(registro) or remoto_mudou(registro, item):
+        return {}
+    remoto = registro.get('remoto', {})
+    return {cabecalho: remoto[campo] for cabecalho, campo in (('If-None-Match', 'ETag'), ('If-Modified-Since', 'Last-Modified'))
+            if remoto.get(campo)}
+
+def baixar_relatorio_http(sessao, modelo_url, item, historico):
+    """
+    Baixa um relatório direto para dados_raw (arquivo .part + os.replace), com GET condicional
+    quando já há uma cópia íntegra: 304 mantém o arquivo e conta como sucesso.
+    Só aceita a resposta se for um .xlsx de verdade (zip começando com 'PK'); uma página
+    HTML aqui normalmente é a tela de login (sessão expirada) ou de erro.
+    """
+    url = modelo_url.replace("{id}", item['id'])
+    caminho_final = os.path.join(PASTA_DOWNLOAD, nome_arquivo_final(item['nome'], item['competencia']))
+    caminho_tmp = caminho_final + ".part"
+    condicionais = cabecalhos_condicionais(historico.get(f"{item['id']}_{item['competencia']}"), item)
+    inicio = perf_counter()
+    try:
+        with sessao.get(url, headers=condicionais, stream=True, timeout=(10, 60)) as resposta:
+            if resposta.status_code == 304 and condicionais:
+                print(f" -> [HTTP] Sem mudança no site: {item['nome']} ({item['competencia']})")
+                registrar_evento('item', item, ok=True, caminho='http', tentativas=1, duracao=round(perf_counter() - inicio, 3),
+                                 popups=[], refreshes=0, tamanho=0, nao_modificado=True)
+                return True
+            resposta.raise_for_status()
+            blocos = resposta.iter_content(chunk_size=64 * 1024)
+            primeiro = next(blocos, b"")
+            if not primeiro.startswith(b"PK"):
+                raise ValueError(f"resposta não é xlsx ({resposta.headers.get('Content-Type', '?')})")
+            with open(caminho_tmp, "wb") as f:
+                f.write(primeiro)
+                for bloco in blocos:
+                    f.write(bloco)
+            remoto = metadados_remotos(resposta)
+        os.replace(caminho_tmp, caminho_final)
+    except Exception as e:
+        print(f" -> [HTTP] Falha em {item['nome']} ({item['competencia']}): {str(e)[:100]}")
+        if os.path.exists(caminho_tmp):
+            os.remove(caminho_tmp)
+        # Só uma etapa: o item ainda vai para o navegador, que grava o evento 'item' final
+        registrar_evento('etapa', item, etapa='http', tentativa=1, duracao=round(perf_counter() - inicio, 3), erro=str(e)[:300])
+        return False
+    print(f" -> [HTTP] SUCESSO: {os.path.basename(caminho_final)}")
+    registrar_evento('item', item, ok=True, caminho='http', tentativas=1, duracao=round(perf_counter() - inicio, 3),
+                     popups=[], refreshes=0, tamanho=os.path.getsize(caminho_final))
+    registrar_download(historico, item, caminho_final, remoto)
+    return True
+
+def preparar_http(driver, itens, pasta_download):
+    """
+    Descobre a URL de exportação e monta a sessão HTTP a partir do navegador logado.
+    Retorna (sessao, modelo_url) ou (None, None) se o caminho rápido não estiver disponível;
+    nesse caso o motivo sai como [ERRO] no console e como etapa 'http' no log.
+    """
+    if not itens:
+        return None, None
+    inicio = perf_counter()
+    try:
+        modelo_url = descobrir_url_exportacao(driver, itens[0], pasta_download)
+    except Exception as e:
+        print(f"[ERRO] [HTTP] Exportação direta desligada: {e}. Defina RPA_URL_EXPORTACAO (com '{{id}}') "
+              f"para usar o caminho rápido. Seguindo só pelo navegador.")
+        registrar_evento('etapa', itens[0], etapa='http', tentativa=1, duracao=round(perf_counter() - inicio, 3),
+                         erro=f"descoberta da URL de exportação: {str(e)[:300]}")
+        return None, None
+    finally:
+        driver.get(URL_FOLHA)
+        esperar_lista(driver)
+    return criar_sessao_http(driver), modelo_url
+
+def exportar_via_http(sessao, modelo_url, itens, historico):
+    """
+    Tenta baixar todos os itens por HTTP, com até MAX_CONEXOES_HTTP downloads simultâneos.
+    Retorna os itens que falharam, para o fluxo pelo navegador tentar em seguida.
+    """
+    if sessao is None or not itens:
+        return itens
+    print(f"[HTTP] Exportação direta: {modelo_url} ({MAX_CONEXOES_HTTP} conexões)")
+    with ThreadPoolExecutor(max_workers=MAX_CONEXOES_HTTP) as executor:
+        resultados = list(executor.map(lambda item: baixar_relatorio_http(sessao, modelo_url, item, historico), itens))
+    pendentes = [item for item, ok in zip(itens, resultados) if not ok]
+    print(f"[HTTP] {len(itens) - len(pendentes)} baixados, {len(pendentes)} para o navegador.")
+    return pendentes
+
+# --- SINCRONIZAÇÃO INCREMENTAL ---
+def competencia_aberta(competencia, hoje=None):
+    """
+    Competência 'AAAA/MM' dentro das MESES_ABERTOS mais recentes (mês atual incluso):
+    a folha ainda pode mudar, então é sempre baixada de novo.
+    """
+    hoje = hoje or datetime.now()
+    indice_hoje = hoje.year * 12 + hoje.month - 1
+    ano, mes = (int(parte) for parte in competencia.split('/'))
+    return ano * 12 + mes - 1 > indice_hoje - MESES_ABERTOS
+
+def arquivo_local_integro(registro):
+    caminho = os.path.join(PASTA_DOWNLOAD, registro.get('arquivo', ''))
+    return bool(registro.get('arquivo')) and os.path.exists(caminho) and os.path.getsize(caminho) == registro.get('tamanho')
+
+def remoto_mudou(registro, item):
+    # O texto da linha na lista é o que o site mostra sem abrir o item
+    return registro.get('remoto', {}).get('linha') != item.get('linha', '')
+
+def selecionar_itens_incrementais(itens, historico):
+    """
+    Mantém só o que precisa ser baixado pelo navegador: competências abertas, itens nunca
+    baixados (ou do histórico antigo, sem hash), arquivos locais ausentes/alterados e itens
+    cuja linha na lista mudou.
+    """
+    def precisa_baixar(item):
+        registro = historico.get(f"{item['id']}_{item['competencia']}")
+        return competencia_aberta(item['competencia']) or not registro or not arquivo_local_integro(registro) \
+            or remoto_mudou(registro, item)
+
+    selecionados = [item for item in itens if precisa_baixar(item)]
+    print(f"[INCREMENTAL] {len(selecionados)} de {len(itens)} itens precisam de download.")
+    return selecionados
+
+def sincronizar_via_http(driver, itens, historico, pasta_download):
+    """
+    Etapa comum aos modos sequencial e pool: baixa o que der por HTTP e filtra o incremental
+    no que sobrou para o navegador. Por HTTP todo item vai com GET condicional (o 304 custa o
+    mesmo que a antiga checagem HEAD e já pega mudança que não aparece na linha da lista).
+    """
+    sessao, modelo_url = preparar_http(driver, itens, pasta_download) if USAR_HTTP_DIRETO else (None, None)
+    pendentes = exportar_via_http(sessao, modelo_url, itens, historico)
+    if MODO_INCREMENTAL:
+        pendentes = selecionar_itens_incrementais(pendentes, historico)
+    return pendentes
+
+def preparar_rodada(driver, wait, historico, checkpoint, pasta_download):
+    """
+    Etapa comum aos modos sequencial e pool, logo após o login. Retoma a rodada do checkpoint
+    (sem reler a lista) ou, se ela estiver desatualizada, lê a lista e começa uma nova.
+    Itens resolvidos pelo incremental/HTTP já saem como concluídos; retorna o resto para o navegador.
+    """
+    if lista_desatualizada(checkpoint):
+        abrir_menu_folha(driver, wait)
+        iniciar_rodada(checkpoint, ler_itens_para_processar(driver))
+    else:
+        print(f"[CHECKPOINT] Retomando rodada de {checkpoint['lista_lida_em']} ({resumo_checkpoint(checkpoint)}).")
+        driver.get(URL_FOLHA)
+        esperar_lista(driver)
+
+    itens = itens_da_rodada(checkpoint)
+    restantes = sincronizar_via_http(driver, itens, historico, pasta_download)
+    chaves_restantes = {chave_item(item) for item in restantes}
+    for item in itens:
+        if chave_item(item) not in chaves_restantes:
+            marcar_item(checkpoint, item, 'concluido')
+    return restantes
+
+def consumir_fila(driver, wait, fila, historico, resultados, pasta_download, checkpoint, rotulo=""):
+    """
+    Processa itens da fila até ela esvaziar. Um item que falhou volta para o fim da fila enquanto
+    tiver rodadas sobrando; antes de retentar, espera o tempo agendado no checkpoint (backoff).
+    """
+    while True:
+        try:
+            item = fila.get_nowait()
+        except queue.Empty:
+            break
+        espera = segundos_ate_retentativa(checkpoint, item)
+        if espera > 0:
+            if not fila.empty():
+                # Ainda não é a vez dele: adianta os outros itens
+                fila.put(item)
+                sleep(min(espera, 1.0))
+                continue
+            print(f"{rotulo}Aguardando {espera:.0f}s para retentar {item['nome']} ({item['competencia']})...")
+            sleep(espera)
+        print(f"{rotulo}{item['nome']} ({item['competencia']})")
+        ok = processar_item(driver, wait, item, historico, pasta_download, checkpoint)
+        resultados[chave_item(item)] = ok
+        if not ok and pode_retentar(checkpoint['itens'][chave_item(item)]):
+            fila.put(item)
+
+# --- MODO POOL (VÁRIAS SESSÕES EM PARALELO) ---
+def trabalhador_sessao(indice, fila, historico, resultados, checkpoint, driver=None):
+    """
+    Uma sessão do pool: abre o próprio Chrome (headless) com pasta de download exclusiva,
+    faz login e consome itens da fila compartilhada até ela esvaziar.
+    """
+    pasta_sessao = pasta_da_sessao(indice)
+    try:
+        if driver is None:
+            driver = criar_driver(pasta_sessao, headless=True)
+            wait = WebDriverWait(driver, 15)
+            fazer_login(driver, wait)
+            abrir_menu_folha(driver, wait)
+        else:
+            wait = WebDriverWait(driver, 15)
+
+        consumir_fila(driver, wait, fila, historico, resultados, pasta_sessao, checkpoint, rotulo=f"[SESSÃO {indice}] ")
+    except Exception as e:
+        print(f"[SESSÃO {indice}] ERRO GERAL: {e}")
+    finally:
+        if driver is not None:
+            driver.quit()
+
+def main_pool(num_sessoes=NUM_SESSOES):
+    """
+    Lê a lista uma vez (sessão 0) e distribui os itens entre num_sessoes navegadores.
+    Cada sessão baixa em dados_raw/_sessoes/sessao_N e o arquivo final é movido para dados_raw.
+    """
+    historico = carregar_historico()
+    checkpoint = carregar_checkpoint()
+    fila = queue.Queue()
+    resultados = {}
+
+    driver_0 = criar_driver(pasta_da_sessao(0), headless=True)
+    try:
+        wait = WebDriverWait(driver_0, 15)
+        fazer_login(driver_0, wait)
+        itens_para_processar = preparar_rodada(driver_0, wait, historico, checkpoint, pasta_da_sessao(0))
+    except Exception as e:
+        print(f"ERRO GERAL: {e} (checkpoint mantido: a próxima execução retoma daqui)")
+        driver_0.quit()
+        return resultados
+
+    for item in itens_para_processar:
+        fila.put(item)
+    # Não abre mais navegadores do que itens restantes (no incremental costuma sobrar pouco)
+    num_sessoes = max(1, min(num_sessoes, len(itens_para_processar)))
+    print(f"Total a processar: {len(itens_para_processar)} em {num_sessoes} sessões")
+
+    # A sessão 0 já está logada e também trabalha; as demais abrem o próprio navegador
+    threads = [threading.Thread(target=trabalhador_sessao, args=(0, fila, historico, resultados, checkpoint, driver_0))]
+    threads += [threading.Thread(target=trabalhador_sessao, args=(i, fila, historico, resultados, checkpoint)) for i in range(1, num_sessoes)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    falhas = [chave for chave, ok in resultados.items() if not ok]
+    print(f"Concluído: {len(resultados) - len(falhas)} ok, {len(falhas)} falhas.")
+    print(f"Pop-ups fechados: {resumo_popups()}")
+    print(f"Checkpoint: {resumo_checkpoint(checkpoint)}")
+    return resultados
+
+# --- MAIN ATUALIZADO ---
+def main():
+    if NUM_SESSOES > 1:
+        main_pool(NUM_SESSOES)
+        return
+
+    pasta_download = pasta_da_sessao(0)
+    driver = criar_driver(pasta_download)
     wait = WebDriverWait(driver, 15)
 
     try:
         # Login e Setup (Mantidos)
         driver.set_window_position(2000, 0)
-        sleep(0.5)
         driver.maximize_window()
-        driver.get("https://ebmsucesso.codefi.com.br/Acesso/Entrar?ReturnUrl=%2F")
-        wait.until(EC.element_to_be_clickable((By.XPATH, "//input[@type='text']"))).send_keys("rubens.prudencini")
-        driver.find_element(By.XPATH, "//input[@type='password']").send_keys("rLSP@0711")
-        driver.find_element(By.XPATH, "//button[contains(., 'Entrar')]").click()
-        sleep(5) 
-        
-        print("Acessando Menu Folha...")
-        wait.until(EC.element_to_be_clickable((By.XPATH, "//span[contains(@class, 'title') and normalize-space(text())='Folha']"))).click()
-        sleep(1)
-        wait.until(EC.element_to_be_clickable((By.XPATH, "//span[contains(@class, 'title') and contains(text(), 'Folha Pagamento')]"))).click()
-        sleep(4)
-
-        print("Lendo lista...")
-        elementos_lista = driver.find_elements(By.XPATH, "//tr | //div[contains(@class, 'list')]//div[contains(@class, 'item')]")
-        
-        itens_para_processar = []
-        historico = carregar_historico()
+        fazer_login(driver, wait)
 
-        for elem in elementos_lista:
-            texto = elem.text.strip()
-            if not texto: continue
-            id_obra, nome_obra, competencia = extrair_detalhes(texto)
-            if competencia and competencia >= '2025/12':
-                itens_para_processar.append({'id': id_obra, 'nome': nome_obra, 'competencia': competencia})
+        historico = carregar_historico()
+        checkpoint = carregar_checkpoint()
+        itens_para_processar = preparar_rodada(driver, wait, historico, checkpoint, pasta_download)
 
         print(f"Total a processar: {len(itens_para_processar)}")
 
+        fila = queue.Queue()
         for item in itens_para_processar:
-            chave_hist = f"{item['id']}_{item['competencia']}"
-            
-            # if chave_hist in historico: continue
+            fila.put(item)
+        consumir_fila(driver, wait, fila, historico, {}, pasta_download, checkpoint)
 
-            print(f"--- Processando: {item['nome']} ({item['competencia']}) ---")
-            
-            sucesso_item = False
-            
-            for tentativa in range(1, MAX_TENTATIVAS + 1):
-                try:
-                    fechar_popup_se_existir(driver)
-                    arquivos_antes = obter_arquivos_xlsx()
-
-                    xpath_link = f"//a[contains(@href, '/FolhaPagamento/Consultar/{item['id']}')]"
-                    
-                    try:
-                        link_obra = wait.until(EC.presence_of_element_located((By.XPATH, xpath_link)))
-                    except TimeoutException:
-                        print(" -> Link sumiu. Recarregando lista...")
-                        driver.get("https://ebmsucesso.codefi.com.br/FolhaPagamento")
-                        sleep(4)
-                        link_obra = driver.find_element(By.XPATH, xpath_link)
-
-                    driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", link_obra)
-                    sleep(1)
-                    driver.execute_script("arguments[0].click();", link_obra)
-                    sleep(3) 
-
-                    # --- AQUI ESTÁ A CORREÇÃO DO BUG DO SISTEMA ---
-                    # Verifica se apareceu pop-up logo ao entrar
-                    if fechar_popup_se_existir(driver):
-                        print(" -> [BUG DETECTADO] Pop-up encontrado. Aplicando Refresh (F5)...")
-                        driver.refresh()
-                        sleep(5) # Espera recarregar a página
-                        # Verifica se o pop-up voltou após o refresh (as vezes volta)
-                        fechar_popup_se_existir(driver)
-
-                    # Verifica erro crítico
-                    if "Erro" in driver.title:
-                        raise Exception("Tela de erro crítico.")
-
-                    # Tenta Exportar
-                    try:
-                        wait_botao = WebDriverWait(driver, 8)
-                        btn_exportar = wait_botao.until(EC.presence_of_element_located((By.ID, "exportarRelatorioFolhaPagamento")))
-                        
-                        fechar_popup_se_existir(driver) # Check final antes do clique
-                        
-                        driver.execute_script("arguments[0].click();", btn_exportar)
-                        
-                        if esperar_novo_arquivo_e_renomear(arquivos_antes, item['nome'], item['competencia']):
-                            historico[chave_hist] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            salvar_historico(historico)
-                            sucesso_item = True
-                            driver.back()
-                            sleep(1)
-                            break 
-                        else:
-                            # Se não baixou, verifica se apareceu pop-up AO CLICAR
-                            if fechar_popup_se_existir(driver):
-                                print(" -> Erro apareceu ao tentar baixar. Tentando refresh...")
-                                driver.refresh()
-                                sleep(4)
-                                # Lança erro para cair no 'except' e tentar de novo no loop de tentativa
-                                raise Exception("Pop-up ao baixar. Necessário retry.")
-                            else:
-                                raise Exception("Download não iniciou.")
-
-                    except TimeoutException:
-                        print(" -> [AVISO] Sem dados para exportar.")
-                        sucesso_item = True
-                        driver.back()
-                        sleep(1)
-                        break
-
-                except Exception as e:
-                    print(f" -> Tentativa {tentativa} falhou: {str(e)[:100]}...") # Log curto
-                    if "FolhaPagamento" not in driver.current_url:
-                        driver.get("https://ebmsucesso.codefi.com.br/FolhaPagamento")
-                    else:
-                        driver.refresh()
-                    sleep(4)
-            
-            if not sucesso_item:
-                print(f" [FALHA] Ignorando {item['nome']} após erros.")
+        print(f"Pop-ups fechados: {resumo_popups()}")
+        print(f"Checkpoint: {resumo_checkpoint(checkpoint)}")
 
     except Exception as e:
-        print(f"ERRO GERAL: {e}")
+        print(f"ERRO GERAL: {e} (checkpoint mantido: a próxima execução retoma daqui)")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="RPA de download das folhas de pagamento.")
+    parser.add_argument('--resumo', action='store_true', help="Só mostra o resumo dos logs de execuções anteriores")
+    parser.add_argument('--top', type=int, default=10, help="Quantas obras listar no resumo")
+    args = parser.parse_args()
+    if args.resumo:
+        resumo_logs(args.top)
+    else:
+        main()
@@ -0,0 +1,76 @@
+"""
+Fixtures dos testes do RPA: sobem o rpa_site_simulado.py numa porta livre e isolam os
+arquivos que o robô grava (dados_raw, histórico, checkpoint, logs) numa pasta temporária.
+Sem selenium/requests, só os testes do RPA são pulados (os do ETL e da camada de dados rodam).
+"""
+import io
+import os
+import sys
+import threading
+import zipfile
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rpa_site_simulado as site  # noqa: E402
+
+OBRAS = ["OBRA ALFA", "OBRA BETA", "OBRA GAMA"]
+
+def xlsx_falso(texto):
+    # Só o que o robô confere: zip começando com 'PK' e com o [Content_Types].xml
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as arquivo_zip:
+        arquivo_zip.writestr('[Content_Types].xml', texto)
+    return buffer.getvalue()
+
+@pytest.fixture
+def site_simulado(tmp_path, monkeypatch):
+    """
+    Site simulado com um item por obra de OBRAS (ids 101, 102...), competência 2025/12.
+    Devolve a URL base; site.CONFIG pode ser alterado pelo teste (atraso, chance_popup).
+    """
+    pasta_raw = tmp_path / "site_raw"
+    pasta_raw.mkdir()
+    for obra in OBRAS:
+        (pasta_raw / f"Relatorio Folha de Pagamento - EMPRESA SPE - {obra} - 2025-12.xlsx").write_bytes(xlsx_falso(obra))
+    monkeypatch.setattr(site, "PASTA_RAW", str(pasta_raw))
+    monkeypatch.setattr(site, "CONFIG", {'atraso': 0.0, 'chance_popup': 0.0})
+    monkeypatch.setattr(site, "ITENS", {})
+    monkeypatch.setattr(site, "SESSOES", set())
+    site.carregar_itens()
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), site.SiteSimulado)
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{servidor.server_address[1]}"
+    servidor.shutdown()
+    servidor.server_close()
+
+@pytest.fixture
+def rpa(site_simulado, tmp_path, monkeypatch):
+    """
+    Módulo rpa_sucesso apontando para o site simulado, gravando tudo em tmp_path.
+    """
+    pytest.importorskip("selenium")
+    pytest.importorskip("requests")
+    import rpa_sucesso
+
+    monkeypatch.chdir(tmp_path)  # historico_downloads.json e fila_rpa.json são relativos
+    pasta_download = tmp_path / "dados_raw"
+    pasta_download.mkdir()
+    monkeypatch.setattr(rpa_sucesso, "URL_BASE", site_simulado)
+    monkeypatch.setattr(rpa_sucesso, "URL_LOGIN", f"{site_simulado}/Acesso/Entrar?ReturnUrl=%2F")
+    monkeypatch.setattr(rpa_sucesso, "URL_FOLHA", f"{site_simulado}/FolhaPagamento")
+    monkeypatch.setattr(rpa_sucesso, "PASTA_DOWNLOAD", str(pasta_download))
+    monkeypatch.setattr(rpa_sucesso, "PASTA_SESSOES", str(pasta_download / "_sessoes"))
+    monkeypatch.setattr(rpa_sucesso, "PASTA_LOGS", str(tmp_path / "logs_rpa"))
+    monkeypatch.setattr(rpa_sucesso, "OUVINTES_DOWNLOAD", [])
+    return rpa_sucesso
+
+@pytest.fixture
+def itens_site(site_simulado):
+    # Itens no formato de ler_itens_para_processar, na ordem do site
+    return [{'id': id_item, 'nome': item['nome'], 'competencia': item['competencia'], 'linha': ''}
+            for id_item, item in site.ITENS.items()]
@@ -0,0 +1,162 @@
+"""
+Camada de dados em níveis (camada_dados.CamadaDados): LRU das partições frias limitado em
+MB, derivados (inclusive os das competências quentes) no mesmo limite, partição vazia e o
+marcador de leitor das partições do ETL.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import etl_processamento as etl
+from camada_dados import CamadaDados, tamanho_mb
+
+COMPETENCIAS = [f"2025-{mes:02d}" for mes in range(1, 7)]
+LINHAS = 12_500  # 0,1 MB por coluna float64
+
+def particao_falsa(competencia, linhas=LINHAS):
+    sal = pd.DataFrame({'Competencia': competencia, 'Valor': np.zeros(linhas)})
+    return sal, sal.iloc[:0]
+
+@pytest.fixture
+def leituras():
+    return []
+
+def nova_camada(leituras, limite_mb, meses_em_memoria=2):
+    def ler_particao(competencia):
+        leituras.append(competencia)
+        return particao_falsa(competencia)
+    return CamadaDados(COMPETENCIAS, ['OBRA ALFA'], ler_particao, meses_em_memoria=meses_em_memoria, limite_mb=limite_mb)
+
+def test_quentes_ficam_em_memoria_e_frias_sao_lidas_uma_vez(leituras):
+    camada = nova_camada(leituras, limite_mb=10)
+    assert list(camada.quentes) == COMPETENCIAS[-2:]
+
+    camada.obter(COMPETENCIAS[0])
+    camada.obter(COMPETENCIAS[0])
+    camada.obter(COMPETENCIAS[-1])
+
+    assert leituras == COMPETENCIAS[-2:] + [COMPETENCIAS[0]]
+    assert camada.leituras_disco == 1
+
+def test_lru_descarta_a_menos_usada_ao_passar_do_limite(leituras):
+    tamanho = tamanho_mb(particao_falsa(COMPETENCIAS[0]))
+    camada = nova_camada(leituras, limite_mb=tamanho * 2.5)
+
+    camada.obter(COMPETENCIAS[0])
+    camada.obter(COMPETENCIAS[1])
+    camada.obter(COMPETENCIAS[0])  # vira a mais recente
+    camada.obter(COMPETENCIAS[2])
+
+    assert list(camada.lru) == [COMPETENCIAS[0], COMPETENCIAS[2]]
+    assert camada.tamanho_lru_mb == pytest.approx(tamanho * 2)
+    assert camada.tamanho_usado_mb() <= camada.limite_mb
+
+def test_particao_em_uso_nunca_sai_mesmo_maior_que_o_limite(leituras):
+    camada = nova_camada(leituras, limite_mb=0.05)
+
+    camada.obter(COMPETENCIAS[0])
+    camada.derivado(COMPETENCIAS[0], 'dobro', lambda particao: particao[0] * 2)
+
+    assert list(camada.lru) == [COMPETENCIAS[0]]
+    assert 'dobro' in camada.lru[COMPETENCIAS[0]]['derivados']
+
+def test_derivado_frio_conta_no_limite_e_sai_com_a_particao(leituras):
+    tamanho = tamanho_mb(particao_falsa(COMPETENCIAS[0]))
+    camada = nova_camada(leituras, limite_mb=tamanho * 2.5)
+
+    camada.obter(COMPETENCIAS[0])
+    camada.derivado(COMPETENCIAS[0], 'copia', lambda particao: particao[0].copy())
+    camada.obter(COMPETENCIAS[1])
+
+    assert list(camada.lru) == [COMPETENCIAS[1]]
+    assert camada.tamanho_lru_mb == pytest.approx(tamanho)
+
+def test_derivados_quentes_respeitam_o_limite_e_mantem_o_pedido(leituras):
+    tamanho = tamanho_mb(particao_falsa(COMPETENCIAS[0]))
+    camada = nova_camada(leituras, limite_mb=tamanho * 2.5)
+    quente = COMPETENCIAS[-1]
+    calculos = []
+
+    def por_obra(obra):
+        def calcular(particao):
+            calculos.append(obra)
+            return particao[0].copy()
+        return calcular
+
+    for obra in ['A', 'B', 'C', 'D']:
+        camada.derivado(quente, ('tabela', obra), por_obra(obra))
+    camada.derivado(quente, ('tabela', 'D'), por_obra('D'))  # em memória: não recalcula
+
+    assert list(camada.derivados_quentes) == [(quente, ('tabela', 'C')), (quente, ('tabela', 'D'))]
+    assert calculos == ['A', 'B', 'C', 'D']
+    assert camada.tamanho_usado_mb() <= camada.limite_mb
+    assert "2 derivados" in camada.resumo()
+
+def test_frias_saem_antes_dos_derivados_quentes(leituras):
+    tamanho = tamanho_mb(particao_falsa(COMPETENCIAS[0]))
+    camada = nova_camada(leituras, limite_mb=tamanho * 2.5)
+
+    camada.derivado(COMPETENCIAS[-1], 'abc', lambda particao: particao[0].copy())
+    camada.obter(COMPETENCIAS[0])
+    camada.obter(COMPETENCIAS[1])
+
+    assert list(camada.lru) == [COMPETENCIAS[1]]
+    assert list(camada.derivados_quentes) == [(COMPETENCIAS[-1], 'abc')]
+
+def test_vazio_tem_as_colunas_de_uma_particao(leituras):
+    camada = nova_camada(leituras, limite_mb=10)
+
+    sal, tar = camada.obter("1999-01")
+
+    assert sal.empty and tar.empty
+    assert list(sal.columns) == ['Competencia', 'Valor']
+    assert camada.leituras_disco == 0
+
+def test_vazio_sem_quentes_usa_a_ultima_competencia(leituras):
+    camada = nova_camada(leituras, limite_mb=10, meses_em_memoria=0)
+
+    sal, _ = camada.vazio()
+
+    assert sal.empty and list(sal.columns) == ['Competencia', 'Valor']
+    assert leituras == [COMPETENCIAS[-1]]
+
+@pytest.fixture
+def pasta_particoes(tmp_path, monkeypatch):
+    # Partições reais do ETL: duas competências, uma obra
+    monkeypatch.setattr(etl, "PASTA_SAIDA", str(tmp_path))
+    sal = pd.DataFrame({'Competencia': ['2025-11', '2025-12'], 'Obra': 'OBRA ALFA', 'Nome': 'ANA', 'Função': 'PEDREIRO',
+                        'Justificativa': '', 'Salario Base (R$)': 2000.0})
+    tar = pd.DataFrame({'Competencia': ['2025-11', '2025-12'], 'Obra': 'OBRA ALFA', 'Funcionario': 'ANA', 'Funcao': 'PEDREIRO',
+                        'Tipo': 'Produção', 'Descricao_Servico': 'Reboco', 'Centro_Custo': 'Geral', 'Valor_Tarefa': 100.0})
+    dims = etl.atualizar_dimensoes(etl.carregar_dimensoes(str(tmp_path)), sal, tar)
+    nome = etl.salvar_particoes(etl.aplicar_dimensoes(dims, sal, etl.SALARIOS), etl.aplicar_dimensoes(dims, tar, etl.TAREFAS), 1)
+    return os.path.join(str(tmp_path), nome), dims
+
+def leitores(pasta):
+    pasta_leitores = os.path.join(pasta, etl.PASTA_LEITORES)
+    return os.listdir(pasta_leitores) if os.path.isdir(pasta_leitores) else []
+
+def test_leitor_registrado_no_primeiro_uso_pelo_processo(pasta_particoes):
+    pasta, dims = pasta_particoes
+
+    camada = CamadaDados.de_pasta(pasta, dims, meses_em_memoria=1)
+    assert leitores(pasta) == []  # montar a camada (ex.: no master do gunicorn --preload) não registra
+
+    camada.obter('2025-11')  # leitura fria
+    assert leitores(pasta) == [str(os.getpid())]
+    assert camada.obter('2025-11')[0]['Obra'].tolist() == ['OBRA ALFA']
+
+    camada.liberar()
+    assert leitores(pasta) == []
+
+def test_liberar_nao_apaga_marcador_de_outro_processo(pasta_particoes):
+    pasta, dims = pasta_particoes
+    camada = CamadaDados.de_pasta(pasta, dims, meses_em_memoria=1)
+    camada.garantir_leitor()
+    camada.leitor_pid = -1  # camada herdada de outro processo (fork)
+
+    camada.liberar()
+
+    assert leitores(pasta) == [str(os.getpid())]
@@ -0,0 +1,82 @@
+"""
+Dimensões com id inteiro (etl_processamento): normalização das chaves, ids estáveis entre
+execuções do ETL e fatos compactados (só ids) expandidos de volta para os nomes.
+"""
+import pandas as pd
+import pytest
+
+import etl_processamento as etl
+
+def salarios(*linhas):
+    return pd.DataFrame(linhas, columns=['Obra', 'Nome', 'Função'])
+
+def tarefas(*linhas):
+    return pd.DataFrame(linhas, columns=['Obra', 'Funcionario', 'Funcao', 'Descricao_Servico'])
+
+@pytest.fixture
+def pasta_dims(tmp_path, monkeypatch):
+    monkeypatch.setattr(etl, "PASTA_SAIDA", str(tmp_path))
+    return str(tmp_path)
+
+def rodar_etl(pasta, sal, tar):
+    # O que consolidar_e_publicar faz com as dimensões, do disco para o disco
+    dims = etl.atualizar_dimensoes(etl.carregar_dimensoes(pasta), sal, tar)
+    etl.salvar_dimensoes(dims)
+    return etl.carregar_dimensoes(pasta)
+
+def ids(dims, dim):
+    return dict(zip(dims[dim]['chave'], dims[dim]['id']))
+
+def test_normalizar_texto_ignora_acento_caixa_e_espacos():
+    serie = pd.Series(["  Pedreiro ", "PEDREIRO", "José  da  Silva", "Técnico\tEm Segurança", None])
+
+    normalizado = etl.normalizar_texto(serie)
+
+    assert normalizado[:4].tolist() == ["PEDREIRO", "PEDREIRO", "JOSE DA SILVA", "TECNICO EM SEGURANCA"]
+    assert pd.isna(normalizado[4])
+
+def test_grafias_da_mesma_chave_viram_uma_entidade_com_o_nome_mais_frequente(pasta_dims):
+    sal = salarios(["Obra Alfa", "Ana", "Pedreiro"], ["OBRA ALFA", "Bia", "pedreiro"], ["Obra  Alfa", "Caio", "Pedreiro"],
+                   ["Obra Alfa", "Davi", "Pedreiro"])
+
+    dims = rodar_etl(pasta_dims, sal, tarefas())
+    aplicado = etl.aplicar_dimensoes(dims, sal, etl.SALARIOS)
+
+    assert dims['obra']['nome'].tolist() == ["Obra Alfa"]
+    assert dims['funcao']['nome'].tolist() == ["Pedreiro"]
+    assert set(aplicado['id_obra']) == {1} and set(aplicado['Obra']) == {"Obra Alfa"}
+
+def test_ids_estaveis_entre_execucoes_e_novos_no_fim(pasta_dims):
+    primeira = rodar_etl(pasta_dims, salarios(["OBRA BETA", "Ana", "Servente"], ["OBRA ALFA", "Bia", "Pedreiro"]), tarefas())
+    # Segunda execução: ALFA some do lote, BETA volta com outra grafia e GAMA é nova
+    segunda = rodar_etl(pasta_dims, salarios(["Obra Beta", "Ana", "Servente"], ["OBRA GAMA", "Caio", "Pedreiro"]), tarefas())
+
+    antes, depois = ids(primeira, 'obra'), ids(segunda, 'obra')
+    assert {chave: depois[chave] for chave in antes} == antes
+    assert depois['OBRA GAMA'] == max(antes.values()) + 1
+    assert segunda['obra'].set_index('chave').at['OBRA BETA', 'nome'] == "OBRA BETA"  # o nome gravado não muda
+    assert ids(segunda, 'funcionario')['CAIO'] == 3
+
+def test_vazio_vira_id_zero(pasta_dims):
+    tar = tarefas(["OBRA ALFA", "Ana", "Pedreiro", None], ["OBRA ALFA", "Ana", "Pedreiro", "Reboco"])
+
+    dims = rodar_etl(pasta_dims, salarios(), tar)
+    aplicado = etl.aplicar_dimensoes(dims, tar, etl.TAREFAS)
+
+    assert aplicado['id_servico'].tolist() == [0, 1]
+    assert aplicado['id_servico'].dtype == 'int32'
+
+def test_expandir_fatos_devolve_categorical_com_os_nomes(pasta_dims):
+    tar = tarefas(["OBRA BETA", "Bia", "Servente", "Reboco"], ["OBRA ALFA", "Ana", "Pedreiro", None],
+                  ["OBRA BETA", "Ana", "Pedreiro", "Alvenaria"])
+    dims = rodar_etl(pasta_dims, salarios(), tar)
+    aplicado = etl.aplicar_dimensoes(dims, tar, etl.TAREFAS)
+
+    expandido = etl.expandir_fatos(etl.compactar_fatos(aplicado, etl.TAREFAS), dims, etl.TAREFAS)
+
+    for coluna in ['Obra', 'Funcionario', 'Funcao', 'Descricao_Servico']:
+        assert isinstance(expandido[coluna].dtype, pd.CategoricalDtype)
+        assert list(expandido[coluna].cat.categories) == sorted(expandido[coluna].dropna().unique())
+    assert expandido['Obra'].tolist() == aplicado['Obra'].tolist()
+    assert expandido['Descricao_Servico'].tolist()[::2] == ["Reboco", "Alvenaria"]
+    assert pd.isna(expandido['Descricao_Servico'][1])
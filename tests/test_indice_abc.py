@@ -0,0 +1,75 @@
+"""
+Curva ABC pré-calculada (etl_processamento.montar_indice_abc): cortes das classes A/B/C,
+índice por (competência, obra, tipo) e detalhe por serviço para o drill-down.
+"""
+import pandas as pd
+import pytest
+
+import etl_processamento as etl
+
+COMP = "2025-12"
+
+def tarefa(obra, id_servico, valor, tipo='Produção', id_funcionario=1, centro='Geral'):
+    return {'Competencia': COMP, 'Obra': obra, 'Tipo': tipo, 'id_servico': id_servico, 'Descricao_Servico': f"Serviço {id_servico}",
+            'id_funcionario': id_funcionario, 'Funcionario': f"Funcionário {id_funcionario}", 'Funcao': 'PEDREIRO',
+            'Centro_Custo': centro, 'Valor_Tarefa': float(valor)}
+
+def curva(tarefas, obra='TODAS', tipo='TODOS'):
+    indice, _ = etl.montar_indice_abc(pd.DataFrame(tarefas))
+    return indice[(COMP, obra, tipo)]
+
+@pytest.mark.parametrize('valores, classes', [
+    ([80, 15, 5], ['A', 'B', 'C']),          # começa exatamente em 80% -> B; em 95% -> C
+    ([79, 16, 5], ['A', 'A', 'C']),          # começa em 79% -> ainda A
+    ([70, 20, 6, 4], ['A', 'A', 'B', 'C']),  # começa em 90% -> B; em 96% -> C
+    ([100], ['A']),
+], ids=['nos_cortes', 'abaixo_do_corte_a', 'entre_os_cortes', 'servico_unico'])
+def test_classes_pelos_cortes_do_acumulado_anterior(valores, classes):
+    tarefas = [tarefa('OBRA ALFA', id_servico, valor) for id_servico, valor in enumerate(valores, start=1)]
+
+    resultado = curva(tarefas)
+
+    assert resultado['Classe'].tolist() == classes
+    assert resultado['Rank'].tolist() == list(range(1, len(valores) + 1))
+    assert resultado['Pct_Acum'].iloc[-1] == pytest.approx(1.0)
+
+def test_curva_ordenada_por_valor_com_nome_do_servico():
+    resultado = curva([tarefa('OBRA ALFA', 1, 10), tarefa('OBRA ALFA', 2, 60), tarefa('OBRA ALFA', 2, 30)])
+
+    assert resultado['id_servico'].tolist() == [2, 1]
+    assert resultado['Valor_Tarefa'].tolist() == [90.0, 10.0]
+    assert resultado['Descricao_Servico'].tolist() == ["Serviço 2", "Serviço 1"]
+    assert resultado['Pct'].tolist() == pytest.approx([0.9, 0.1])
+
+def test_indice_por_obra_e_tipo_com_todas_e_todos():
+    tarefas = [tarefa('OBRA ALFA', 1, 50), tarefa('OBRA ALFA', 2, 10, tipo='Prêmio'),
+               tarefa('OBRA BETA', 1, 30), tarefa('OBRA BETA', 3, 40)]
+
+    indice, _ = etl.montar_indice_abc(pd.DataFrame(tarefas))
+
+    assert set(indice) == {(COMP, obra, tipo) for obra in ['OBRA ALFA', 'OBRA BETA', 'TODAS']
+                           for tipo in ['Produção', 'Outros', 'TODOS']} - {(COMP, 'OBRA BETA', 'Outros')}
+    por_servico = lambda chave: dict(zip(indice[chave]['id_servico'], indice[chave]['Valor_Tarefa']))
+    assert por_servico((COMP, 'OBRA ALFA', 'Produção')) == {1: 50.0}
+    assert por_servico((COMP, 'OBRA ALFA', 'Outros')) == {2: 10.0}  # tipos fora de Produção viram 'Outros'
+    assert por_servico((COMP, 'OBRA BETA', 'TODOS')) == {3: 40.0, 1: 30.0}
+    assert por_servico((COMP, 'TODAS', 'Produção')) == {1: 80.0, 3: 40.0}
+    assert por_servico((COMP, 'TODAS', 'TODOS')) == {1: 80.0, 3: 40.0, 2: 10.0}
+    # Classe calculada dentro de cada curva, não na competência inteira
+    assert indice[(COMP, 'OBRA ALFA', 'TODOS')]['Classe'].tolist() == ['A', 'B']  # 2 começa em 50/60
+    assert indice[(COMP, 'OBRA ALFA', 'Outros')]['Classe'].tolist() == ['A']      # e sozinho é A
+
+def test_detalhe_por_servico_com_funcionario_e_centro_de_custo():
+    tarefas = [tarefa('OBRA ALFA', 1, 50, id_funcionario=1), tarefa('OBRA ALFA', 1, 20, id_funcionario=1),
+               tarefa('OBRA BETA', 1, 30, id_funcionario=2, centro='Fachada'), tarefa('OBRA BETA', 3, 40, id_funcionario=2)]
+
+    _, detalhe = etl.montar_indice_abc(pd.DataFrame(tarefas))
+    linhas = detalhe.loc[(COMP, 1)].sort_values('Valor_Tarefa')
+
+    assert linhas[['Obra', 'Funcionario', 'Centro_Custo', 'Valor_Tarefa']].values.tolist() == [
+        ['OBRA BETA', 'Funcionário 2', 'Fachada', 30.0], ['OBRA ALFA', 'Funcionário 1', 'Geral', 70.0]]
+
+def test_sem_ids_de_servico_nao_monta_indice():
+    indice, detalhe = etl.montar_indice_abc(pd.DataFrame([tarefa('OBRA ALFA', 1, 10)]).drop(columns='id_servico'))
+
+    assert indice == {} and detalhe.empty
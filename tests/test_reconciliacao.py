@@ -0,0 +1,79 @@
+"""
+Reconciliação das bases consolidadas (etl_processamento.reconciliar) em bases montadas à
+mão: tolerância de tarefas + prêmios x linhas, limite de horas de HE e valores negativos.
+"""
+import pandas as pd
+import pytest
+
+import etl_processamento as etl
+
+COMP = "2025-12"
+
+def funcionario(id_funcionario, tarefas=0.0, premios=0.0, base=2200.0, he=0.0, bruto=3000.0, custo_real=3000.0):
+    return {'Competencia': COMP, 'id_obra': 1, 'Obra': 'OBRA ALFA', 'id_funcionario': id_funcionario,
+            'Nome': f"FUNCIONARIO {id_funcionario}", 'Função': 'PEDREIRO', 'Salario Base (R$)': base,
+            'Valor das tarefas (R$)': tarefas, 'Valor total de prêmios (R$)': premios, 'HE 50% (em tarefas)': he,
+            'HE 50% (fora tarefas)': 0.0, 'Salário bruto (R$)': bruto, 'Salário bruto - faltas (R$)': custo_real}
+
+def linhas(id_funcionario, *valores):
+    return [{'Competencia': COMP, 'id_obra': 1, 'id_funcionario': id_funcionario, 'Valor_Tarefa': valor} for valor in valores]
+
+def reconciliar(salarios, tarefas):
+    return etl.reconciliar(pd.DataFrame(salarios), pd.DataFrame(tarefas, columns=['Competencia', 'id_obra', 'id_funcionario', 'Valor_Tarefa']))
+
+def regras(anomalias):
+    return dict(zip(anomalias['Nome'], anomalias['Regra']))
+
+@pytest.mark.parametrize('soma_linhas, anomalia', [
+    (1009.99, False),  # 1% de 1000
+    (1010.01, True),
+    (990.00, False),
+    (989.99, True),
+], ids=['dentro_acima', 'fora_acima', 'dentro_abaixo', 'fora_abaixo'])
+def test_tarefas_mais_premios_com_tolerancia_percentual(soma_linhas, anomalia):
+    # Esperado = tarefas (800) + prêmios (200); as linhas trazem os dois
+    anomalias = reconciliar([funcionario(1, tarefas=800.0, premios=200.0)], linhas(1, soma_linhas - 200.0, 200.0))
+
+    assert (regras(anomalias) == {"FUNCIONARIO 1": 'Tarefas + prêmios ≠ linhas'}) is anomalia
+    if anomalia:
+        assert anomalias.loc[0, ['Valor_Esperado', 'Valor_Encontrado']].tolist() == [1000.0, soma_linhas]
+
+def test_tolerancia_minima_em_reais_para_valores_pequenos():
+    anomalias = reconciliar([funcionario(1, tarefas=50.0), funcionario(2, tarefas=50.0)],
+                            linhas(1, 50.99) + linhas(2, 51.01))
+
+    assert regras(anomalias) == {"FUNCIONARIO 2": 'Tarefas + prêmios ≠ linhas'}
+
+def test_funcionario_sem_linhas_conta_como_zero():
+    anomalias = reconciliar([funcionario(1, tarefas=300.0), funcionario(2)], [])
+
+    assert regras(anomalias) == {"FUNCIONARIO 1": 'Tarefas + prêmios ≠ linhas'}
+    assert anomalias.loc[0, 'Diferenca'] == -300.0
+
+def test_liquido_negativo_compara_tarefas_mais_premios():
+    # Desconto maior que a produção: tarefas -200 + prêmios 50 = -150 nas linhas
+    anomalias = reconciliar([funcionario(1, tarefas=-200.0, premios=50.0), funcionario(2, tarefas=-200.0, premios=50.0)],
+                            linhas(1, -200.0, 50.0) + linhas(2, -200.0))
+
+    assert regras(anomalias) == {"FUNCIONARIO 2": 'Tarefas + prêmios ≠ linhas'}
+    assert anomalias.loc[0, ['Valor_Esperado', 'Valor_Encontrado', 'Diferenca']].tolist() == [-150.0, -200.0, -50.0]
+
+def test_custo_real_negativo_ou_acima_do_bruto():
+    anomalias = reconciliar([funcionario(1, custo_real=-10.0), funcionario(2, custo_real=3000.5), funcionario(3, custo_real=2500.0)], [])
+
+    assert regras(anomalias) == {"FUNCIONARIO 1": 'Bruto - faltas fora do bruto', "FUNCIONARIO 2": 'Bruto - faltas fora do bruto'}
+
+def test_horas_de_he_acima_do_limite_do_mes():
+    # Base 2200 -> hora de HE = 2200/220 * 1.5 = R$ 15
+    limite = etl.LIMITE_HORAS_HE_MES
+    anomalias = reconciliar([funcionario(1, he=15.0 * limite), funcionario(2, he=15.0 * (limite + 1)),
+                             funcionario(3, he=100.0, base=0.0)], [])
+
+    assert regras(anomalias) == {"FUNCIONARIO 2": 'Horas de HE implausíveis', "FUNCIONARIO 3": 'HE sem salário base'}
+    he = anomalias.set_index('Nome').loc["FUNCIONARIO 2"]
+    assert (he['Valor_Esperado'], he['Valor_Encontrado']) == (float(limite), float(limite + 1))
+
+def test_base_sem_salarios_devolve_tabela_vazia_com_as_colunas():
+    anomalias = etl.reconciliar(pd.DataFrame(), pd.DataFrame())
+
+    assert anomalias.empty and list(anomalias.columns) == etl.COLUNAS_ANOMALIAS
@@ -0,0 +1,240 @@
+"""
+Fila com checkpoint (consumir_fila + processar_item) contra o site simulado, com um
+navegador falso que fala HTTP com o site no lugar do Chrome.
+"""
+import os
+import queue
+import re
+import threading
+from urllib.parse import urljoin
+
+import pytest
+
+pytest.importorskip("selenium")
+pytest.importorskip("requests")
+
+import requests  # noqa: E402
+from selenium.common.exceptions import NoAlertPresentException, NoSuchElementException, UnexpectedAlertPresentException  # noqa: E402
+from selenium.webdriver.common.by import By  # noqa: E402
+from selenium.webdriver.remote.webelement import WebElement  # noqa: E402
+from selenium.webdriver.support.ui import WebDriverWait  # noqa: E402
+
+class ElementoFalso(WebElement):
+    # Subclasse só para o isinstance das expected_conditions; não chama o __init__ do WebElement
+    def __init__(self, href=None):
+        self.href = href
+        self.visivel = True
+
+    def is_displayed(self):
+        return self.visivel
+
+class NavegadorFalso:
+    """
+    O mínimo do WebDriver que processar_item usa: get/refresh/back, current_url/title,
+    find_element por XPath de link ou por id, e os execute_script do robô (página pronta,
+    motor de pop-ups e clique). Clicar em exportar grava o .xlsx na pasta de download,
+    como o Chrome faria (.crdownload renomeado no fim).
+    alerta_em: fim de URL que, ao carregar, dispara um alert nativo. Como o Chrome com
+    'accept and notify', o próximo comando levanta UnexpectedAlertPresentException e o alert some.
+    """
+    def __init__(self, url_base, pasta_download):
+        self.sessao = requests.Session()
+        self.sessao.post(f"{url_base}/Acesso/Entrar", data={'usuario': 'robo', 'senha': 'teste'})
+        self.pasta_download = pasta_download
+        self.historico = []
+        self.url = self.html = None
+        self.popup = None
+        self.alerta_em = None
+        self.alerta_aberto = None
+        self.alertas_disparados = 0
+
+    def _carregar(self, url):
+        resposta = self.sessao.get(url)
+        self.url, self.html = resposta.url, resposta.text
+        self.popup = ElementoFalso() if 'id="modalAviso"' in self.html else None
+        if self.alerta_em and self.url.endswith(self.alerta_em):
+            self.alerta_em = None  # dispara uma vez
+            self.alerta_aberto = "Sessão instável, tente novamente"
+
+    def _checar_alerta(self):
+        if self.alerta_aberto:
+            texto, self.alerta_aberto = self.alerta_aberto, None
+            self.alertas_disparados += 1
+            raise UnexpectedAlertPresentException(alert_text=texto)
+
+    def get(self, url):
+        self._checar_alerta()
+        if self.url: self.historico.append(self.url)
+        self._carregar(url)
+
+    def refresh(self):
+        self._checar_alerta()
+        self._carregar(self.url)
+
+    def back(self):
+        self._checar_alerta()
+        self._carregar(self.historico.pop())
+
+    @property
+    def current_url(self):
+        self._checar_alerta()
+        return self.url
+
+    @property
+    def title(self):
+        self._checar_alerta()
+        return re.search(r'<title>(.*?)</title>', self.html).group(1)
+
+    @property
+    def switch_to(self):
+        return self
+
+    @property
+    def alert(self):
+        raise NoAlertPresentException()
+
+    def find_element(self, by, valor):
+        self._checar_alerta()
+        if by == By.ID and f'id="{valor}"' in self.html:
+            href = re.search(rf'id="{valor}"[^>]*href="([^"]+)"', self.html)
+            return ElementoFalso(urljoin(self.url, href.group(1)) if href else None)
+        if by == By.XPATH:
+            trecho = re.search(r"contains\(@href, '([^']+)'\)", valor)
+            for href in re.findall(r'href="([^"]+)"', self.html) if trecho else []:
+                if trecho.group(1) in href:
+                    return ElementoFalso(urljoin(self.url, href))
+        raise NoSuchElementException(f"{by}={valor}")
+
+    def quit(self):
+        self.sessao.close()
+
+    def execute_script(self, script, *args):
+        self._checar_alerta()
+        if 'readyState' in script:
+            return True
+        if 'document.evaluate' in script:  # SCRIPT_POPUP: o modal do site fecha pelo botão OK (índice 0)
+            if self.popup is None or not self.popup.visivel:
+                return None
+            self.popup.visivel = False
+            return [0, self.popup]
+        if 'click' in script:
+            href = args[0].href
+            if '/ExportarRelatorio/' in href:
+                conteudo = self.sessao.get(href).content
+                parcial = os.path.join(self.pasta_download, "RelatorioFolhaPagamento.xlsx.crdownload")
+                with open(parcial, 'wb') as f:
+                    f.write(conteudo)
+                os.replace(parcial, parcial.replace('.crdownload', ''))
+            else:
+                self.get(href)
+            return None
+        raise NotImplementedError(script)
+
+@pytest.fixture
+def navegador(rpa, site_simulado, tmp_path):
+    pasta = rpa.pasta_da_sessao(0)
+    driver = NavegadorFalso(site_simulado, pasta)
+    driver.get(rpa.URL_FOLHA)
+    return driver
+
+@pytest.fixture(autouse=True)
+def sem_espera_retentativa(rpa, monkeypatch):
+    monkeypatch.setattr(rpa, "ESPERA_RETENTATIVA_SEG", 0)
+
+def rodar_fila(rpa, driver, itens, checkpoint):
+    fila = queue.Queue()
+    for item in itens:
+        fila.put(item)
+    resultados = {}
+    rpa.consumir_fila(driver, WebDriverWait(driver, 1), fila, {}, resultados, driver.pasta_download, checkpoint)
+    return resultados
+
+def test_fila_baixa_todos_e_marca_checkpoint(rpa, navegador, itens_site):
+    checkpoint = rpa.carregar_checkpoint()
+    rpa.iniciar_rodada(checkpoint, itens_site)
+
+    resultados = rodar_fila(rpa, navegador, itens_site, checkpoint)
+
+    assert all(resultados.values()) and len(resultados) == len(itens_site)
+    for item in itens_site:
+        assert os.path.exists(os.path.join(rpa.PASTA_DOWNLOAD, rpa.nome_arquivo_final(item['nome'], item['competencia'])))
+    gravado = rpa.carregar_checkpoint()
+    assert {registro['estado'] for registro in gravado['itens'].values()} == {'concluido'}
+    assert rpa.itens_da_rodada(gravado) == []
+
+def test_fila_fecha_popup_e_da_refresh(rpa, navegador, itens_site, monkeypatch):
+    import rpa_site_simulado as site
+    monkeypatch.setitem(site.CONFIG, 'chance_popup', 1.0)
+    antes = rpa.ESTATISTICAS_POPUP['botao_OK']
+    checkpoint = rpa.carregar_checkpoint()
+    rpa.iniciar_rodada(checkpoint, itens_site[:1])
+
+    resultados = rodar_fila(rpa, navegador, itens_site[:1], checkpoint)
+
+    assert list(resultados.values()) == [True]
+    assert rpa.ESTATISTICAS_POPUP['botao_OK'] - antes == 2  # na entrada e de novo depois do refresh
+
+def test_fila_retenta_falha_e_para_no_limite(rpa, navegador, itens_site, monkeypatch):
+    monkeypatch.setattr(rpa, "MAX_TENTATIVAS", 1)
+    monkeypatch.setattr(rpa, "MAX_RODADAS_ITEM", 2)
+    inexistente = {'id': '999', 'nome': 'OBRA FORA DO SITE', 'competencia': '2025/12', 'linha': ''}
+    itens = itens_site[:1] + [inexistente]
+    checkpoint = rpa.carregar_checkpoint()
+    rpa.iniciar_rodada(checkpoint, itens)
+
+    resultados = rodar_fila(rpa, navegador, itens, checkpoint)
+
+    assert resultados == {rpa.chave_item(itens_site[0]): True, rpa.chave_item(inexistente): False}
+    registro = rpa.carregar_checkpoint()['itens'][rpa.chave_item(inexistente)]
+    assert registro['estado'] == 'falhou' and registro['tentativas'] == 2 and registro['ultimo_erro']
+
+def test_checkpoint_retoma_item_interrompido(rpa, navegador, itens_site):
+    checkpoint = rpa.carregar_checkpoint()
+    rpa.iniciar_rodada(checkpoint, itens_site)
+    rpa.marcar_item(checkpoint, itens_site[0], 'em_andamento')
+    rpa.marcar_item(checkpoint, itens_site[0], 'concluido')
+    rpa.marcar_item(checkpoint, itens_site[1], 'em_andamento')  # execução "caiu" aqui
+
+    retomado = rpa.carregar_checkpoint()
+    assert not rpa.lista_desatualizada(retomado)
+    pendentes = rpa.itens_da_rodada(retomado)
+    assert [item['id'] for item in pendentes] == [item['id'] for item in itens_site[1:]]
+
+    resultados = rodar_fila(rpa, navegador, pendentes, retomado)
+
+    assert all(resultados.values()) and len(resultados) == len(pendentes)
+    assert {registro['estado'] for registro in rpa.carregar_checkpoint()['itens'].values()} == {'concluido'}
+
+def test_pool_divide_a_fila_entre_sessoes(rpa, site_simulado, itens_site):
+    checkpoint = rpa.carregar_checkpoint()
+    rpa.iniciar_rodada(checkpoint, itens_site)
+    fila = queue.Queue()
+    for item in itens_site:
+        fila.put(item)
+    resultados = {}
+    sessoes = []
+    for indice in range(2):
+        driver = NavegadorFalso(site_simulado, rpa.pasta_da_sessao(indice))
+        driver.get(rpa.URL_FOLHA)
+        sessoes.append(threading.Thread(target=rpa.trabalhador_sessao, args=(indice, fila, {}, resultados, checkpoint, driver)))
+    for sessao in sessoes: sessao.start()
+    for sessao in sessoes: sessao.join(timeout=60)
+
+    assert len(resultados) == len(itens_site) and all(resultados.values())
+    baixados = sorted(os.listdir(rpa.PASTA_DOWNLOAD))
+    assert baixados == sorted(['_sessoes'] + [rpa.nome_arquivo_final(item['nome'], item['competencia']) for item in itens_site])
+    assert {registro['estado'] for registro in rpa.carregar_checkpoint()['itens'].values()} == {'concluido'}
+
+@pytest.mark.parametrize('trecho', ['/Consultar/101', '/FolhaPagamento'], ids=['ao_abrir_consulta', 'ao_voltar_para_lista'])
+def test_alert_nativo_no_meio_do_item_nao_derruba_a_fila(rpa, navegador, itens_site, trecho):
+    # Alert fora do fechar_popup_se_existir: na espera da URL da consulta ou da lista depois do back()
+    antes = rpa.ESTATISTICAS_POPUP['alerta_nativo']
+    navegador.alerta_em = trecho
+    checkpoint = rpa.carregar_checkpoint()
+    rpa.iniciar_rodada(checkpoint, itens_site[:2])
+
+    resultados = rodar_fila(rpa, navegador, itens_site[:2], checkpoint)
+
+    assert navegador.alertas_disparados == 1
+    assert all(resultados.values()) and len(resultados) == 2
+    assert rpa.ESTATISTICAS_POPUP['alerta_nativo'] - antes == 1
@@ -0,0 +1,125 @@
+"""
+Caminho rápido por HTTP (exportar_via_http / baixar_relatorio_http) contra o site simulado,
+com o GET condicional, e a leitura do log de rede que descobre a URL de exportação.
+"""
+import json
+import os
+
+import pytest
+
+import rpa_site_simulado as site
+
+requests = pytest.importorskip("requests")
+
+@pytest.fixture
+def sessao_logada(site_simulado):
+    sessao = requests.Session()
+    sessao.post(f"{site_simulado}/Acesso/Entrar", data={'usuario': 'robo', 'senha': 'teste'})
+    yield sessao
+    sessao.close()
+
+@pytest.fixture
+def modelo_url(site_simulado):
+    return f"{site_simulado}/FolhaPagamento/ExportarRelatorio/{{id}}"
+
+def test_exportar_via_http_baixa_todos(rpa, sessao_logada, modelo_url, itens_site):
+    historico = {}
+
+    pendentes = rpa.exportar_via_http(sessao_logada, modelo_url, itens_site, historico)
+
+    assert pendentes == []
+    for item in itens_site:
+        caminho = os.path.join(rpa.PASTA_DOWNLOAD, rpa.nome_arquivo_final(item['nome'], item['competencia']))
+        assert rpa.xlsx_completo(caminho)
+        registro = historico[rpa.chave_item(item)]
+        assert registro['sha256'] == rpa.hash_arquivo(caminho)
+        assert registro['remoto']['ETag'] and registro['remoto']['Content-Length'] == str(os.path.getsize(caminho))
+    assert not [nome for nome in os.listdir(rpa.PASTA_DOWNLOAD) if nome.endswith('.part')]
+
+def test_falhas_voltam_para_o_navegador(rpa, sessao_logada, modelo_url, itens_site):
+    inexistente = {'id': '999', 'nome': 'OBRA FORA DO SITE', 'competencia': '2025/12', 'linha': ''}
+
+    pendentes = rpa.exportar_via_http(sessao_logada, modelo_url, itens_site + [inexistente], {})
+
+    assert pendentes == [inexistente]  # 404 do site
+    assert not os.path.exists(os.path.join(rpa.PASTA_DOWNLOAD, rpa.nome_arquivo_final(inexistente['nome'], inexistente['competencia'])))
+
+def test_sessao_expirada_nao_grava_html(rpa, modelo_url, itens_site):
+    # Sem cookie o site redireciona para o login: a página HTML não pode virar um .xlsx
+    historico = {}
+    with requests.Session() as sessao_sem_login:
+        ok = rpa.baixar_relatorio_http(sessao_sem_login, modelo_url, itens_site[0], historico)
+
+    assert ok is False and historico == {}
+    assert os.listdir(rpa.PASTA_DOWNLOAD) == []
+
+def test_falha_http_fica_como_etapa_no_log(rpa, modelo_url, itens_site):
+    with requests.Session() as sessao_sem_login:
+        rpa.baixar_relatorio_http(sessao_sem_login, modelo_url, itens_site[0], {})
+
+    eventos = rpa.ler_logs(rpa.PASTA_LOGS)
+    assert [(evento['evento'], evento.get('etapa')) for evento in eventos] == [('etapa', 'http')]
+
+def entrada_log(metodo, **params):
+    # Formato de driver.get_log('performance'): a mensagem do DevTools vem como texto JSON
+    return {'level': 'INFO', 'message': json.dumps({'message': {'method': metodo, 'params': params}})}
+
+def requisicao(id_requisicao, url, metodo='GET'):
+    return entrada_log('Network.requestWillBeSent', requestId=id_requisicao, request={'method': metodo, 'url': url})
+
+def resposta(id_requisicao, tipo, **cabecalhos):
+    return entrada_log('Network.responseReceived', requestId=id_requisicao, response={'mimeType': tipo, 'headers': cabecalhos})
+
+def test_log_de_rede_acha_a_requisicao_do_xlsx(rpa):
+    entradas = [
+        requisicao('1', 'https://site/js/app.js'), resposta('1', 'application/javascript'),
+        {'level': 'INFO', 'message': 'não é json'},
+        requisicao('2', 'https://site/api/relatorio?obra=101&fmt=xlsx'),
+        resposta('2', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    ]
+
+    assert rpa.requisicao_exportacao_do_log(entradas) == ('GET', 'https://site/api/relatorio?obra=101&fmt=xlsx')
+    assert rpa.modelo_da_url('https://site/api/relatorio?obra=101&fmt=xlsx', {'id': '101'}) == 'https://site/api/relatorio?obra={id}&fmt=xlsx'
+
+def test_log_de_rede_reconhece_anexo_e_download_e_guarda_o_metodo(rpa):
+    anexo = [requisicao('7', 'https://site/Exportar', 'POST'),
+             resposta('7', 'application/octet-stream', **{'Content-Disposition': 'attachment; filename="folha.xlsx"'})]
+    download = [requisicao('8', 'https://site/Exportar/101'), entrada_log('Page.downloadWillBegin', url='https://site/Exportar/101')]
+
+    assert rpa.requisicao_exportacao_do_log(anexo) == ('POST', 'https://site/Exportar')
+    assert rpa.requisicao_exportacao_do_log(download) == ('GET', 'https://site/Exportar/101')
+    assert rpa.requisicao_exportacao_do_log([requisicao('9', 'https://site/')]) is None
+
+def test_get_condicional_304_mantem_o_arquivo(rpa, sessao_logada, modelo_url, itens_site):
+    historico = {}
+    rpa.exportar_via_http(sessao_logada, modelo_url, itens_site, historico)
+    antes = dict(historico)
+
+    pendentes = rpa.exportar_via_http(sessao_logada, modelo_url, itens_site, historico)
+
+    assert pendentes == [] and historico == antes  # nada foi regravado
+    itens = [evento for evento in rpa.ler_logs(rpa.PASTA_LOGS) if evento['evento'] == 'item']
+    assert [evento.get('nao_modificado', False) for evento in itens] == [False] * 3 + [True] * 3
+
+def test_get_condicional_baixa_de_novo_o_que_mudou_no_site(rpa, site_simulado, sessao_logada, modelo_url, itens_site):
+    historico = {}
+    rpa.exportar_via_http(sessao_logada, modelo_url, itens_site, historico)
+    alterado = site.ITENS[itens_site[0]['id']]['arquivo']
+    with open(alterado, 'ab') as f:
+        f.write(b'\0')  # outro tamanho: outro ETag
+
+    rpa.exportar_via_http(sessao_logada, modelo_url, itens_site, historico)
+
+    chave = rpa.chave_item(itens_site[0])
+    caminho = os.path.join(rpa.PASTA_DOWNLOAD, historico[chave]['arquivo'])
+    assert os.path.getsize(caminho) == os.path.getsize(alterado)
+    assert historico[chave]['sha256'] == rpa.hash_arquivo(alterado)
+
+def test_arquivo_local_apagado_baixa_sem_condicional(rpa, sessao_logada, modelo_url, itens_site):
+    historico = {}
+    rpa.exportar_via_http(sessao_logada, modelo_url, itens_site[:1], historico)
+    caminho = os.path.join(rpa.PASTA_DOWNLOAD, historico[rpa.chave_item(itens_site[0])]['arquivo'])
+    os.remove(caminho)
+
+    assert rpa.baixar_relatorio_http(sessao_logada, modelo_url, itens_site[0], historico)
+    assert rpa.xlsx_completo(caminho)